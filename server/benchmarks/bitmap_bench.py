@@ -0,0 +1,101 @@
+"""
+Compares answering enum and boolean filter combinations over the bundled
+campsite CSV files (`campsites_db/data/*.csv`) with a bitmap index and with
+boolean masks over the columns:
+
+    python -m benchmarks.bitmap_bench [--repeat N]
+"""
+
+import argparse
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from benchmarks.normalize_bench import DATA_DIR, read_data
+from campsites_api.services.bitmap_index import BitmapIndex
+from campsites_api.services.campsites_engine import INDEXED_COLUMNS
+from campsites_api.utils.process_data import RowErrors, validate_rows
+
+QUERIES: List[Dict[str, Any]] = [
+    {"has_showers": True},
+    {"state": ["CA", "OR", "WA"], "has_toilets": True},
+    {
+        "state": ["CA", "OR", "WA", "NV", "AZ"],
+        "campsite_type": ["SP", "NF", "BLM"],
+        "toilet_type": ["flush", "vault"],
+        "has_showers": True,
+        "has_drinking_water": True,
+        "has_toilets": True,
+        "accepts_pets": True,
+        "accepts_reservations": True,
+        "has_sewer_hookup": False,
+        "has_electric_hookup": True,
+    },
+]
+
+
+def best_of(repeat: int, run: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(1000):
+            run()
+        timings.append((time.perf_counter() - start) / 1000)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    campsites = list(validate_rows(enumerate(read_data(), 2), RowErrors()))
+    columns = {
+        name: [getattr(getattr(c, name), "value", getattr(c, name)) for c in campsites]
+        for name in INDEXED_COLUMNS
+    }
+    print(f"{len(campsites)} campsites from {DATA_DIR}")  # noqa: T201
+
+    start = time.perf_counter()
+    index = BitmapIndex(columns)
+    print(f"index built in {(time.perf_counter() - start) * 1000:.1f} ms")  # noqa: T201
+    bitsets = [bits for values in index.bitsets.values() for bits in values.values()]
+    print(  # noqa: T201
+        f"{len(bitsets)} bitsets, {sum(bits.nbytes for bits in bitsets) / 1024:.1f} KB"
+    )
+    # the columns as the in-memory engine held them before the index: booleans
+    # as int8 with -1 for NULL, enums as strings with "" for NULL
+    arrays = {
+        name: np.array([-1 if v is None else int(v) for v in values], np.int8)
+        if isinstance(next(v for v in values if v is not None), bool)
+        else np.array(["" if v is None else v for v in values], str)
+        for name, values in columns.items()
+    }
+
+    def with_masks(filters: Dict[str, Any]) -> int:
+        mask = np.ones(len(campsites), bool)
+        for name, value in filters.items():
+            values = arrays[name]
+            if isinstance(value, list):
+                mask &= np.isin(values, value)
+            else:
+                mask &= values == value
+        return int(mask.sum())
+
+    def with_bitmaps(filters: Dict[str, Any]) -> int:
+        return index.count(index.query(filters))
+
+    for filters in QUERIES:
+        assert with_masks(filters) == with_bitmaps(filters)
+        masks = best_of(args.repeat, lambda: with_masks(filters))
+        bitmaps = best_of(args.repeat, lambda: with_bitmaps(filters))
+        print(  # noqa: T201
+            f"{len(filters):>2} filters, {with_bitmaps(filters):>5} matches: "
+            f"masks {masks * 1e6:8.1f} us  bitmaps {bitmaps * 1e6:6.1f} us  "
+            f"x{masks / bitmaps:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compares the per-row and column-wise normalisation of the bundled campsite CSV
+files (`campsites_db/data/*.csv`):
+
+    python -m benchmarks.normalize_bench [--repeat N]
+"""
+
+import argparse
+import csv
+import glob
+import os
+import time
+from typing import Callable, Dict, List
+
+import campsites_api.utils.process_data_utils as ut
+from campsites_api.utils.process_data import (
+    NORMALIZE_BATCH_SIZE,
+    batched,
+    normalize_row,
+    normalize_rows,
+)
+
+DATA_DIR = os.path.join(
+    os.path.dirname(__file__), os.pardir, "campsites_db", "data", "*.csv"
+)
+
+
+def read_data() -> List[Dict]:
+    rows = []
+    for path in sorted(glob.glob(DATA_DIR)):
+        with open(path, encoding="utf-8") as file:
+            rows.extend(csv.DictReader(file))
+    return rows
+
+
+def best_of(repeat: int, run: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def report(name: str, per_row: float, column_wise: float, rows: int) -> None:
+    print(  # noqa: T201
+        f"{name:<12} per-row {per_row * 1000:8.1f} ms "
+        f"({rows / per_row:>10,.0f} rows/s)  column-wise "
+        f"{column_wise * 1000:8.1f} ms ({rows / column_wise:>10,.0f} rows/s)  "
+        f"x{per_row / column_wise:.1f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = read_data()
+    # the column-wise functions take stripped values, as in `normalize_rows()`
+    stripped = [normalize_row(row) for row in rows]
+    columns = {
+        name: [row[name] for row in stripped]
+        for name in ["phone", "dates_open", "state", "amenities"]
+    }
+    raw_phones = [row["phone"] or None for row in rows]
+    print(f"{len(rows)} rows from {DATA_DIR}")  # noqa: T201
+
+    functions = [
+        ("phone", ut.process_phone_number, ut.process_phone_numbers, raw_phones),
+        ("dates", ut.process_dates, ut.process_dates_column, columns["dates_open"]),
+        ("country", ut.process_country, ut.process_countries, columns["state"]),
+        (
+            "amenities",
+            ut.process_amenities,
+            ut.process_amenities_column,
+            columns["amenities"],
+        ),
+    ]
+    for name, per_row, column_wise, column in functions:
+        report(
+            name,
+            best_of(args.repeat, lambda: [per_row(value) for value in column]),
+            best_of(args.repeat, lambda: column_wise(column)),
+            len(column),
+        )
+
+    report(
+        "normalize",
+        best_of(args.repeat, lambda: [normalize_row(row) for row in rows]),
+        best_of(
+            args.repeat,
+            lambda: [
+                normalize_rows(batch) for batch in batched(rows, NORMALIZE_BATCH_SIZE)
+            ],
+        ),
+        len(rows),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compares building the `GET /campsites` statements for every request with
+reusing them from the statement cache, for a few filter shapes. Both include
+the cache key SQLAlchemy computes to find the compiled statement; compiling
+itself is cached by SQLAlchemy in both cases. Needs no database:
+
+    python -m benchmarks.statement_bench [--repeat N]
+"""
+
+import argparse
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+from campsites_api.dto.campsites import DistanceFilterDTO
+from campsites_api.services.abstract_service import list_statements
+from campsites_api.services.campsites_service import CampsitesService
+from campsites_api.utils.cursor import encode_cursor
+
+BASE: Dict[str, Any] = {
+    "limit": 25,
+    "offset": 0,
+    "cursor": None,
+    "count": "exact",
+    "fields": None,
+    "sort_by": "name",
+    "sort_dir": "asc",
+}
+FILTERS: List[Dict[str, Any]] = [
+    {},
+    {"state": ["CA", "OR"], "has_showers": True, "name__ct": "lake"},
+    {
+        "state": ["CA", "OR", "WA"],
+        "campsite_type": ["SP", "NF"],
+        "toilet_type": ["flush"],
+        "elevation_ft__gt": 1000,
+        "num_campsites__lt": 50,
+        "has_showers": True,
+        "accepts_pets": True,
+        "distance": DistanceFilterDTO(value=100, units="mi", lat=40.0, lon=-105.0),
+    },
+    {
+        "sort_by": "state",
+        "cursor": encode_cursor(["state", "asc", "CA", str(uuid.uuid4())]),
+    },
+]
+
+
+def per_call(repeat: int, run: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(1000):
+            run()
+        timings.append((time.perf_counter() - start) / 1000)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    service = CampsitesService(None)
+
+    def built(filters: Dict[str, Any]) -> None:
+        statements = service._AbstractService__list_statements(filters)
+        statements.page._generate_cache_key()
+
+    def cached(filters: Dict[str, Any]) -> None:
+        statements, _ = service._AbstractService__list_query(filters)
+        statements.page._generate_cache_key()
+
+    for filters in FILTERS:
+        filters = {**BASE, **filters}
+        build = per_call(args.repeat, lambda: built(filters))
+        reuse = per_call(args.repeat, lambda: cached(filters))
+        print(  # noqa: T201
+            f"{len(filters) - len(BASE):>2} filters"
+            f"{' + cursor' if filters['cursor'] else '         '}: "
+            f"built {build * 1e6:7.1f} us  cached {reuse * 1e6:6.1f} us  "
+            f"x{build / reuse:.1f}"
+        )
+    print(list_statements.stats())  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,16 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from campsites_api.routers import campsites, places
+from campsites_api.utils.cache import caches
+from campsites_api.utils.debug import require_admin, slow_plans
+from campsites_api.utils.metrics import (
+    PROMETHEUS_MEDIA_TYPE,
+    MetricsMiddleware,
+    render_metrics,
+)
+from campsites_db.session import async_engine, engine, pool_stats
 
 tags_metadata = [
     {"name": "health", "description": "Health check"},
@@ -42,12 +51,55 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=[
+            "Location",
+            "X-Count-Mode",
+            "X-Has-More",
+            "X-Next-Cursor",
+            "X-Total-Count",
+        ],
     )
+    # added last so it is outermost, and times the other middleware too
+    app.add_middleware(MetricsMiddleware)
 
     @app.get("/health", tags=["health"])
     async def health() -> str:
         return "ok"
 
+    @app.get("/health/caches", tags=["health"])
+    async def cache_stats() -> dict:
+        return {name: cache.stats() for name, cache in caches.items()}
+
+    @app.get("/health/pool", tags=["health"])
+    async def connection_pool_stats() -> dict:
+        return {
+            "sync": pool_stats(engine),
+            "async": pool_stats(async_engine.sync_engine),
+        }
+
+    @app.get(
+        "/health/slow-plans", tags=["health"], dependencies=[Depends(require_admin)]
+    )
+    async def slow_plan_log() -> dict:
+        return {
+            "threshold_ms": slow_plans.threshold_ms,
+            "sample_rate": slow_plans.sample_rate,
+            "items": slow_plans.entries(),
+        }
+
+    @app.get("/metrics", tags=["health"], response_class=PlainTextResponse)
+    async def metrics() -> PlainTextResponse:
+        return PlainTextResponse(
+            render_metrics(
+                {name: cache.stats() for name, cache in caches.items()},
+                {
+                    "sync": pool_stats(engine),
+                    "async": pool_stats(async_engine.sync_engine),
+                },
+            ),
+            media_type=PROMETHEUS_MEDIA_TYPE,
+        )
+
     app.include_router(campsites.router)
     app.include_router(places.router)
 
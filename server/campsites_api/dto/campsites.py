@@ -1,10 +1,11 @@
 from enum import Enum
 from typing import Dict, List, Optional
 
-from fastapi import Query
+from fastapi import HTTPException, Query
 from pydantic import BaseModel, ConfigDict
 from pydantic.types import UUID4
 
+from campsites_api.utils.fields import parse_fields
 from campsites_db.models import (
     BearingEnum,
     CampsiteCountryEnum,
@@ -51,9 +52,112 @@ class CampsiteDTO(BaseModel):
     low_no_fee: Optional[bool] = None
 
 
+class CountModeEnum(str, Enum):
+    # exact count, computed with a window function in the same query as the page
+    exact = "exact"
+    # the planner's row estimate; cheap but approximate
+    estimate = "estimate"
+    # no count; use has_more to find out if there is a next page
+    none = "none"
+
+
 class CampsiteListDTO(BaseModel):
     items: List[CampsiteDTO]
-    num_total_results: int
+    # None when counting was skipped with count=none
+    num_total_results: Optional[int]
+    # which count strategy produced num_total_results
+    count_mode: CountModeEnum = CountModeEnum.exact
+    has_more: bool = False
+    # pass as `cursor` to fetch the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+
+class RowErrorDTO(BaseModel):
+    # line of the uploaded file, counting the header as line 1
+    line: int
+    error: str
+
+
+class UploadModeEnum(str, Enum):
+    # add every row; rows already uploaded are skipped
+    insert = "insert"
+    # also update rows already uploaded whose content changed
+    upsert = "upsert"
+
+
+class IngestResultDTO(BaseModel):
+    # number of rows loaded
+    rows: int
+    seconds: float
+    rows_per_second: float
+    inserted: int = 0
+    updated: int = 0
+    # rows already uploaded with the same content, or repeated in the file
+    unchanged: int = 0
+    # rows deleted because they were missing from the file
+    deleted: int = 0
+    # number of rows skipped because they could not be processed, and the
+    # first of their errors
+    num_errors: int = 0
+    errors: List[RowErrorDTO] = []
+
+
+class UploadJobStateEnum(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class UploadJobDTO(BaseModel):
+    job_id: str
+    state: UploadJobStateEnum
+    # rows parsed so far, and their rate since the job started
+    rows_processed: int
+    rows_per_second: float
+    num_errors: int
+    errors: List[RowErrorDTO]
+    # set once the job has succeeded
+    result: Optional[IngestResultDTO] = None
+    # why the job failed
+    detail: Optional[str] = None
+
+
+class CampsiteClusterDTO(BaseModel):
+    # centroid of the campsites in the cluster
+    lat: float
+    lon: float
+    count: int
+
+
+class CampsiteClusterListDTO(BaseModel):
+    items: List[CampsiteClusterDTO]
+    zoom: int
+
+
+class BoundingBoxDTO(BaseModel):
+    min_lon: float
+    min_lat: float
+    max_lon: float
+    max_lat: float
+
+    @classmethod
+    def parser(
+        cls,
+        bbox: str = Query(
+            ..., description="Comma-separated min_lon,min_lat,max_lon,max_lat"
+        ),
+    ) -> "BoundingBoxDTO":
+        try:
+            min_lon, min_lat, max_lon, max_lat = [float(v) for v in bbox.split(",")]
+        except ValueError:
+            raise HTTPException(
+                status_code=422,
+                detail="bbox must be min_lon,min_lat,max_lon,max_lat",
+            )
+        if not (-180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+            raise HTTPException(status_code=422, detail="bbox is out of bounds")
+        return cls(min_lon=min_lon, min_lat=min_lat, max_lon=max_lon, max_lat=max_lat)
 
 
 class SortByEnum(str, Enum):
@@ -69,6 +173,14 @@ class SortDirEnum(str, Enum):
     desc = "desc"
 
 
+class ExportFormatEnum(str, Enum):
+    # one JSON object per line
+    ndjson = "ndjson"
+    # a FeatureCollection of points
+    geojson = "geojson"
+    csv = "csv"
+
+
 class DistanceUnitEnum(str, Enum):
     mi = "mi"
     km = "km"
@@ -81,9 +193,24 @@ class DistanceFilterDTO(BaseModel):
     lon: Optional[float]
 
 
+class CampsiteNearestDTO(CampsiteDTO):
+    # distance from the search point, in the requested units
+    distance: float
+
+
+class CampsiteNearestListDTO(BaseModel):
+    items: List[CampsiteNearestDTO]
+    units: DistanceUnitEnum
+
+
 class CampsiteFilterDTO(BaseModel):
     limit: Optional[int] = 25
     offset: Optional[int] = 0
+    # opaque keyset cursor from a previous page; takes precedence over offset
+    cursor: Optional[str] = None
+    count: Optional[CountModeEnum] = "exact"
+    # names of CampsiteDTO fields to return; all fields if None
+    fields: Optional[List[str]] = None
     sort_by: Optional[SortByEnum] = "name"
     sort_dir: Optional[SortDirEnum] = "asc"
     code__ct: Optional[str]
@@ -122,6 +249,11 @@ class CampsiteFilterDTO(BaseModel):
         cls,
         limit: Optional[int] = Query(25),
         offset: Optional[int] = Query(0),
+        cursor: Optional[str] = Query(None),
+        count: Optional[CountModeEnum] = Query("exact"),
+        fields: Optional[str] = Query(
+            None, description="Comma-separated list of fields to return"
+        ),
         sort_by: Optional[SortByEnum] = Query("name"),
         sort_dir: Optional[SortDirEnum] = Query("asc"),
         code__ct: Optional[str] = Query(None),
@@ -168,6 +300,7 @@ class CampsiteFilterDTO(BaseModel):
         ]
         for arg in args_to_pop:
             queries.pop(arg)
+        queries["fields"] = parse_fields(fields, CampsiteDTO)
         # build distance filter object if all 4 included
         distance = None
         if distance_value and distance_units and distance_lat and distance_lon:
@@ -1,7 +1,12 @@
 from typing import Dict, List, Optional
 from campsites_db.models import CampsiteCountryEnum, CampsiteStateEnum
-from campsites_api.dto.campsites import DistanceUnitEnum, DistanceFilterDTO
+from campsites_api.dto.campsites import (
+    CountModeEnum,
+    DistanceUnitEnum,
+    DistanceFilterDTO,
+)
 
+from campsites_api.utils.fields import parse_fields
 from fastapi import Query
 from pydantic import BaseModel, ConfigDict
 from pydantic.types import UUID4
@@ -23,9 +28,26 @@ class PlaceDTO(BaseModel):
     priority_order: int
 
 
+class PlaceSuggestionDTO(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: UUID4
+    name: str
+    state_province: CampsiteStateEnum
+    country: CampsiteCountryEnum
+    lat: float
+    lon: float
+    priority_order: int
+
+
 class PlaceFilterDTO(BaseModel):
     limit: Optional[int] = 25
     offset: Optional[int] = 0
+    # opaque keyset cursor from a previous page; takes precedence over offset
+    cursor: Optional[str] = None
+    count: Optional[CountModeEnum] = "exact"
+    # names of PlaceDTO fields to return; all fields if None
+    fields: Optional[List[str]] = None
     sort_by: Optional[str] = "priority_order"
     sort_dir: Optional[str] = "asc"
     state_province: Optional[List[CampsiteStateEnum]]
@@ -40,6 +62,11 @@ class PlaceFilterDTO(BaseModel):
         cls,
         limit: Optional[int] = Query(25),
         offset: Optional[int] = Query(0),
+        cursor: Optional[str] = Query(None),
+        count: Optional[CountModeEnum] = Query("exact"),
+        fields: Optional[str] = Query(
+            None, description="Comma-separated list of fields to return"
+        ),
         sort_by: Optional[str] = Query("priority_order"),
         sort_dir: Optional[str] = Query("asc"),
         state_province: Optional[List[CampsiteStateEnum]] = Query(None),
@@ -61,6 +88,7 @@ class PlaceFilterDTO(BaseModel):
         ]
         for arg in args_to_pop:
             queries.pop(arg)
+        queries["fields"] = parse_fields(fields, PlaceDTO)
         # build distance filter object if all 4 included
         distance = None
         if distance_value and distance_units and distance_lat and distance_lon:
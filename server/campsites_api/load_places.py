@@ -0,0 +1,92 @@
+"""
+Loads geographical names CSV files into the table backing `/places`:
+
+    python -m campsites_api.load_places FILE [FILE ...] [--workers N]
+        [--batch-size N]
+
+Files are streamed, normalised across a process pool and loaded with COPY, each
+in one transaction. Progress and throughput are logged as rows are normalised.
+"""
+
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import List, Optional
+
+from campsites_api.services.places_service import PlacesService
+from campsites_api.utils.process_data import RowErrors
+from campsites_api.utils.process_places import (
+    PLACE_COLUMNS,
+    PLACES_BATCH_SIZE,
+    PLACES_LOADER_WORKERS,
+    LoadProgress,
+    process_places,
+    read_place_rows,
+)
+from campsites_db.session import SessionLocal
+
+logger = logging.getLogger("campsites_api.load_places")
+
+
+def load_file(
+    service: PlacesService,
+    path: str,
+    executor: ProcessPoolExecutor,
+    batch_size: int,
+) -> None:
+    errors = RowErrors()
+    progress = LoadProgress(
+        lambda p: logger.info(
+            "%s: %d rows normalised, %d errors (%.0f rows/s)",
+            path,
+            p.rows,
+            p.errors,
+            p.rows_per_second,
+        )
+    )
+    with open(path, "rb") as file:
+        batches = process_places(
+            read_place_rows(file), errors, executor, batch_size, progress
+        )
+        result = service.bulk_load(PLACE_COLUMNS, chain.from_iterable(batches))
+    logger.info(
+        "%s: loaded %d rows in %.1fs (%.0f rows/s), %d errors",
+        path,
+        result.rows,
+        result.seconds,
+        result.rows_per_second,
+        errors.count,
+    )
+    for error in errors.errors:
+        logger.warning("%s line %d: %s", path, error.line, error.error)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Load geographical names CSV files into the places table"
+    )
+    parser.add_argument("files", nargs="+", help="CSV files to load")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=PLACES_LOADER_WORKERS,
+        help="processes normalising rows (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=PLACES_BATCH_SIZE,
+        help="rows per task sent to the process pool",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    with SessionLocal() as session, ProcessPoolExecutor(args.workers) as executor:
+        service = PlacesService(session)
+        for path in args.files:
+            load_file(service, path, executor, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
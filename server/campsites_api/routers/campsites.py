@@ -1,34 +1,272 @@
-from typing import Annotated
+import asyncio
+import logging
+import shutil
+import tempfile
+import time
+from functools import partial
+from typing import IO, Annotated, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from pydantic import UUID4
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
 
-from campsites_api.dto.campsites import CampsiteDTO, CampsiteFilterDTO, CampsiteListDTO
+from campsites_api.dto.campsites import (
+    BoundingBoxDTO,
+    CampsiteClusterListDTO,
+    CampsiteDTO,
+    CampsiteFilterDTO,
+    CampsiteListDTO,
+    CampsiteNearestDTO,
+    CampsiteNearestListDTO,
+    DistanceUnitEnum,
+    ExportFormatEnum,
+    IngestResultDTO,
+    UploadJobDTO,
+    UploadModeEnum,
+)
+from campsites_api.services.abstract_service import METERS_PER_UNIT
 from campsites_api.services.campsites_service import (
     CampsitesService,
     get_campsites_service,
 )
-from campsites_api.utils.process_data import process_data
+from campsites_api.services.upload_jobs import UploadJob, UploadJobs, get_upload_jobs
+from campsites_api.utils.debug import explain_requested, slow_plans
+from campsites_api.utils.export import (
+    EXPORT_EXTENSIONS,
+    EXPORT_MEDIA_TYPES,
+    encode_export,
+)
+from campsites_api.utils.fields import parse_fields
+from campsites_api.utils.process_data import process_data, upload_response
+from campsites_api.utils.tiles import MVT_MEDIA_TYPE, check_tile, tile_response
+from campsites_db.session import get_async_session_factory, get_session_factory
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/campsites")
 
 
-@router.get("", response_model=CampsiteListDTO, tags=["GET"])
+async def sample_list_plans(
+    session_factory: async_sessionmaker, filters: CampsiteFilterDTO
+) -> None:
+    # runs after the response is sent, so sampled requests are not slowed down
+    try:
+        async with session_factory() as session:
+            plans = await CampsitesService(None, session).aexplain(filters)
+        slow_plans.record("/campsites", filters, plans)
+    except Exception:
+        logger.exception("Could not explain sampled list statements")
+
+
+# the response is built by hand rather than validated against CampsiteListDTO,
+# which only documents it
+@router.get(
+    "",
+    response_class=ORJSONResponse,
+    responses={200: {"model": CampsiteListDTO}},
+    tags=["GET"],
+)
 async def list_campsites(
     filters: Annotated[CampsiteFilterDTO, Depends(CampsiteFilterDTO.parser)],
     campsites_service: Annotated[CampsitesService, Depends(get_campsites_service)],
+    session_factory: Annotated[async_sessionmaker, Depends(get_async_session_factory)],
+    explain: Annotated[bool, Depends(explain_requested)],
+    background_tasks: BackgroundTasks,
+):
+    start = time.perf_counter()
+    result = await campsites_service.alist(filters)
+    list_ms = (time.perf_counter() - start) * 1000
+    # items are dicts of column values read from the table, so they are trusted
+    # to match CampsiteListDTO and encoded as they are, without validating them
+    content = result._asdict()
+    if explain:
+        # list statements are run again, so their plans are shown even when the
+        # list was answered from a cache or the in-memory engine
+        plans = await campsites_service.aexplain(filters)
+        slow_plans.record("/campsites", filters, plans)
+        content["explain"] = {
+            "list_ms": list_ms,
+            "statements": [plan._asdict() for plan in plans],
+        }
+    elif slow_plans.sample():
+        background_tasks.add_task(sample_list_plans, session_factory, filters)
+    return ORJSONResponse(content)
+
+
+@router.get("/nearest", response_model=CampsiteNearestListDTO, tags=["GET"])
+async def list_nearest_campsites(
+    filters: Annotated[CampsiteFilterDTO, Depends(CampsiteFilterDTO.parser)],
+    campsites_service: Annotated[CampsitesService, Depends(get_campsites_service)],
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=100),
+    units: DistanceUnitEnum = Query(DistanceUnitEnum.mi),
+):
+    results = await campsites_service.anearest(lat, lon, k, filters)
+    items = [
+        CampsiteNearestDTO(
+            **CampsiteDTO.model_validate(campsite).model_dump(),
+            distance=distance / METERS_PER_UNIT[units],
+        )
+        for campsite, distance in results
+    ]
+    return CampsiteNearestListDTO(items=items, units=units)
+
+
+@router.get("/clusters", response_model=CampsiteClusterListDTO, tags=["GET"])
+async def list_campsite_clusters(
+    bbox: Annotated[BoundingBoxDTO, Depends(BoundingBoxDTO.parser)],
+    filters: Annotated[CampsiteFilterDTO, Depends(CampsiteFilterDTO.parser)],
+    campsites_service: Annotated[CampsitesService, Depends(get_campsites_service)],
+    zoom: int = Query(..., ge=0, le=22),
+):
+    clusters = await campsites_service.aclusters(bbox, zoom, filters)
+    return CampsiteClusterListDTO(
+        items=[cluster._asdict() for cluster in clusters], zoom=zoom
+    )
+
+
+@router.get(
+    "/tiles/{z}/{x}/{y}.pbf",
+    response_class=Response,
+    responses={200: {"content": {MVT_MEDIA_TYPE: {}}}},
+    tags=["GET"],
+)
+async def get_campsites_tile(
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    filters: Annotated[CampsiteFilterDTO, Depends(CampsiteFilterDTO.parser)],
+    campsites_service: Annotated[CampsitesService, Depends(get_campsites_service)],
+):
+    check_tile(z, x, y)
+    tile = await campsites_service.atile(z, x, y, filters)
+    return tile_response(request, tile)
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()}}
+    },
+    tags=["GET"],
+)
+async def export_campsites(
+    filters: Annotated[CampsiteFilterDTO, Depends(CampsiteFilterDTO.parser)],
+    session_factory: Annotated[async_sessionmaker, Depends(get_async_session_factory)],
+    format: ExportFormatEnum = Query(ExportFormatEnum.ndjson),
 ):
-    campsites, count = campsites_service.list(filters)
-    return CampsiteListDTO(items=campsites, num_total_results=count)
+    fields = filters["fields"] or list(CampsiteDTO.model_fields)
+    columns = fields
+    if format == ExportFormatEnum.geojson:
+        columns = [*fields, *[name for name in ["lat", "lon"] if name not in fields]]
 
+    async def batches():
+        # request dependencies are closed before a streamed body is sent, so
+        # the export reads with its own session
+        async with session_factory() as session:
+            service = CampsitesService(None, session)
+            async for batch in service.astream(filters, columns):
+                yield batch
 
-@router.post("/upload", tags=["POST"])
+    return StreamingResponse(
+        encode_export(batches(), fields, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="campsites.{EXPORT_EXTENSIONS[format]}"'
+            )
+        },
+    )
+
+
+def process_upload(
+    job: UploadJob,
+    file: IO[bytes],
+    session_factory: sessionmaker,
+    update: bool,
+    prune: bool,
+) -> IngestResultDTO:
+    def refuse_prune_with_errors() -> None:
+        # rejected rows never reach the table, so pruning would delete the
+        # campsites they were meant to keep
+        if job.errors.count:
+            raise HTTPException(
+                status_code=422,
+                detail=(
+                    f"{job.errors.count} rows could not be processed. Nothing was "
+                    "loaded, as pruning would delete their campsites: fix the "
+                    "rows, or upload without prune."
+                ),
+            )
+
+    # runs in an upload job worker thread, with its own session
+    with file, session_factory() as session:
+        batches = process_data(UploadFile(file), job.errors)
+        result = CampsitesService(session).bulk_create(
+            job.track(batches),
+            update,
+            prune,
+            check=refuse_prune_with_errors if prune else None,
+        )
+        return upload_response(result, job.errors)
+
+
+@router.post("/upload", response_model=UploadJobDTO, status_code=202, tags=["POST"])
 async def upload_campsites(
     csv_file: UploadFile,
-    campsites_service: Annotated[CampsitesService, Depends(get_campsites_service)],
+    response: Response,
+    session_factory: Annotated[sessionmaker, Depends(get_session_factory)],
+    upload_jobs: Annotated[UploadJobs, Depends(get_upload_jobs)],
+    mode: UploadModeEnum = Query(UploadModeEnum.insert),
+    prune: bool = Query(
+        False,
+        description=(
+            "Delete campsites in the file's states that are not in the file. "
+            "Uploads with rows that fail to process are refused"
+        ),
+    ),
 ):
-    campsites: list[CampsiteDTO] = process_data(csv_file)
-    campsites_service.bulk_create(campsites)
+    # the uploaded file is closed when the request ends, so the job reads a copy
+    file = tempfile.TemporaryFile()
+    await asyncio.to_thread(shutil.copyfileobj, csv_file.file, file)
+    file.seek(0)
+    job = upload_jobs.submit(
+        partial(
+            process_upload,
+            file=file,
+            session_factory=session_factory,
+            update=mode == UploadModeEnum.upsert,
+            prune=prune,
+        )
+    )
+    response.headers["Location"] = f"{router.prefix}/upload/{job.id}"
+    return job.dto()
+
+
+@router.get("/upload/{job_id}", response_model=UploadJobDTO, tags=["GET"])
+async def get_upload_job(
+    job_id: str,
+    upload_jobs: Annotated[UploadJobs, Depends(get_upload_jobs)],
+):
+    job = upload_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return job.dto()
 
 
 @router.post("/campsite", response_model=CampsiteDTO, tags=["POST"])
@@ -36,19 +274,25 @@ async def create_campsite(
     campsite: CampsiteDTO,
     campsites_service: Annotated[CampsitesService, Depends(get_campsites_service)],
 ):
-    return campsites_service.create(campsite)
+    return await campsites_service.acreate(campsite)
 
 
 @router.get("/campsite/{campsite_uuid4}", response_model=CampsiteDTO, tags=["GET"])
 async def get_campsite(
     campsite_uuid4: UUID4,
     campsites_service: Annotated[CampsitesService, Depends(get_campsites_service)],
+    fields: Optional[str] = Query(
+        None, description="Comma-separated list of fields to return"
+    ),
 ):
+    fields = parse_fields(fields, CampsiteDTO)
     try:
-        campsite = campsites_service.get(campsite_uuid4)
-        return campsite
+        campsite = await campsites_service.aget(campsite_uuid4, fields)
     except Exception:
         raise HTTPException(status_code=404, detail="Not found")
+    if fields:
+        return JSONResponse(jsonable_encoder(campsite))
+    return campsite
 
 
 @router.patch("/campsite/{campsite_uuid4}", response_model=CampsiteDTO, tags=["PATCH"])
@@ -57,7 +301,7 @@ async def update_campsite(
     campsite: CampsiteDTO,
     campsites_service: Annotated[CampsitesService, Depends(get_campsites_service)],
 ):
-    return campsites_service.update(campsite_uuid4, campsite)
+    return await campsites_service.aupdate(campsite_uuid4, campsite)
 
 
 @router.delete("/campsite/{campsite_uuid4}", tags=["DELETE"])
@@ -65,4 +309,4 @@ async def delete_campsite(
     campsite_uuid4: UUID4,
     campsites_service: Annotated[CampsitesService, Depends(get_campsites_service)],
 ):
-    campsites_service.delete(campsite_uuid4)
+    await campsites_service.adelete(campsite_uuid4)
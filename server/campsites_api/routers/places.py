@@ -1,12 +1,41 @@
-from typing import List
+from concurrent.futures import Executor
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 
-from campsites_api.dto.places import PlaceDTO, PlaceFilterDTO
+from campsites_api.dto.campsites import IngestResultDTO
+from campsites_api.dto.places import PlaceDTO, PlaceFilterDTO, PlaceSuggestionDTO
+from campsites_api.services.place_autocomplete import (
+    PlaceAutocompleteIndex,
+    get_place_autocomplete_index,
+)
 from campsites_api.services.places_service import (
     PlacesService,
     get_places_service,
 )
+from campsites_api.utils.process_data import (
+    RowErrors,
+    iterate_in_thread,
+    upload_response,
+)
+from campsites_api.utils.process_places import (
+    PLACE_COLUMNS,
+    get_places_executor,
+    process_places,
+    read_place_rows,
+)
+from campsites_api.utils.tiles import MVT_MEDIA_TYPE, check_tile, tile_response
+from campsites_db.models import CampsiteCountryEnum, CampsiteStateEnum
 from pydantic import UUID4
 
 router = APIRouter(prefix="/places")
@@ -14,11 +43,72 @@ router = APIRouter(prefix="/places")
 
 @router.get("", response_model=List[PlaceDTO], tags=["GET"])
 async def list_places(
+    response: Response,
+    filters: PlaceFilterDTO = Depends(PlaceFilterDTO.parser),
+    places_service: PlacesService = Depends(get_places_service),
+):
+    result = await places_service.alist(filters)
+    # the response body is a bare list, so paging information goes in headers
+    headers = {
+        "X-Count-Mode": result.count_mode,
+        "X-Has-More": str(result.has_more).lower(),
+    }
+    if result.num_total_results is not None:
+        headers["X-Total-Count"] = str(result.num_total_results)
+    if result.next_cursor is not None:
+        headers["X-Next-Cursor"] = result.next_cursor
+    if filters["fields"]:
+        # partial items don't validate as PlaceDTO; serialize them as they are
+        return JSONResponse(jsonable_encoder(result.items), headers=headers)
+    response.headers.update(headers)
+    return result.items
+
+
+@router.get("/autocomplete", response_model=List[PlaceSuggestionDTO], tags=["GET"])
+async def autocomplete_places(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    state_province: Optional[List[CampsiteStateEnum]] = Query(None),
+    country: Optional[CampsiteCountryEnum] = Query(None),
+    places_service: PlacesService = Depends(get_places_service),
+    index: PlaceAutocompleteIndex = Depends(get_place_autocomplete_index),
+):
+    await index.refresh(places_service.async_session)
+    return [
+        suggestion._asdict()
+        for suggestion in index.search(q, limit, state_province, country)
+    ]
+
+
+@router.get(
+    "/tiles/{z}/{x}/{y}.pbf",
+    response_class=Response,
+    responses={200: {"content": {MVT_MEDIA_TYPE: {}}}},
+    tags=["GET"],
+)
+async def get_places_tile(
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
     filters: PlaceFilterDTO = Depends(PlaceFilterDTO.parser),
     places_service: PlacesService = Depends(get_places_service),
 ):
-    places, count = places_service.list(filters)
-    return places
+    check_tile(z, x, y)
+    tile = await places_service.atile(z, x, y, filters)
+    return tile_response(request, tile)
+
+
+@router.post("/upload", response_model=IngestResultDTO, tags=["POST"])
+async def upload_places(
+    csv_file: UploadFile,
+    places_service: PlacesService = Depends(get_places_service),
+    executor: Executor = Depends(get_places_executor),
+):
+    errors = RowErrors()
+    batches = process_places(read_place_rows(csv_file.file), errors, executor)
+    result = await places_service.abulk_load(PLACE_COLUMNS, iterate_in_thread(batches))
+    return upload_response(result, errors)
 
 
 @router.get("/place/{place_uuid4}", tags=["GET"])
@@ -27,7 +117,7 @@ async def get_place(
     places_service: PlacesService = Depends(get_places_service),
 ):
     try:
-        place = places_service.get(place_uuid4)
+        place = await places_service.aget(place_uuid4)
         return place
     except Exception:
         raise HTTPException(status_code=404, detail="Not found")
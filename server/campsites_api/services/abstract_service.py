@@ -1,50 +1,282 @@
-from typing import Generic, List, Optional, Tuple, Type, TypeVar
+import os
+from itertools import chain
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Generic,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Protocol,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 from fastapi import HTTPException
 from pydantic import UUID4, BaseModel
-from sqlalchemy import func
-from sqlalchemy.orm import Query, Session
-from geoalchemy2.shape import from_shape
-from shapely.geometry import Point
+from sqlalchemy import (
+    Float,
+    Integer,
+    LargeBinary,
+    Select,
+    and_,
+    bindparam,
+    func,
+    or_,
+    select,
+    tuple_,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, load_only
 
-from campsites_db.models import Base
+from campsites_api.utils.cache import TTLCache
+from campsites_api.utils.cursor import decode_keyset_cursor, encode_cursor
+from campsites_api.utils.fields import attribute, project
+from campsites_db.explain import Explain, parse_plan
+from campsites_db.ingest import IngestResult, acopy_rows, copy_rows
+from campsites_db.models import Base, as_geography
 
 ModelType = TypeVar("ModelType", bound=Base)
 ModelTypeDTO = TypeVar("ModelTypeDTO", bound=BaseModel)
 FilterTypeDTO = TypeVar("FilterTypeDTO", bound=BaseModel)
 DistanceTypeDTO = TypeVar("DistanceTypeDTO", bound=BaseModel)
 
+# conversion factors from supported distance units to meters
+METERS_PER_UNIT = {"mi": 1609.344, "km": 1000}
+
+# keys of filter objects that control paging, sorting and output, not filtering
+NON_FILTER_KEYS = [
+    "offset",
+    "limit",
+    "sort_by",
+    "sort_dir",
+    "cursor",
+    "count",
+    "fields",
+]
+
+# statements built by `list()`, by service and filter shape; a few dozen shapes
+# cover nearly every request, and statements don't depend on the table's data,
+# so entries never expire
+list_statements = TTLCache(
+    "list_statements",
+    maxsize=int(os.environ.get("LIST_STATEMENT_CACHE_SIZE", 256)),
+    ttl=None,
+)
+
+# rows fetched from a server-side cursor at a time by `stream()`
+STREAM_BATCH_SIZE = 1000
+
+# vector tile coordinate space, and the margin around it in the same units, so
+# that symbols near a tile's edge are not clipped
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+
+class Invalidatable(Protocol):
+    def invalidate(self) -> None: ...
+
+
+def build_point(lat: float, lon: float):
+    """
+    Builds a SQL expression for a WGS 84 (SRID 4326) point geography
+    """
+    return as_geography(func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326))
+
+
+def has_filters(filters) -> bool:
+    """
+    Whether a filter object has any filter set, ignoring paging, sorting and
+    output options
+    """
+    return any(
+        value is not None
+        for name, value in filters.items()
+        if name not in NON_FILTER_KEYS
+    )
+
+
+def contains_pattern(value: str) -> str:
+    """
+    Builds a LIKE pattern matching lowercase strings containing `value`. LIKE
+    wildcards in `value` are escaped with backslashes, postgres' default escape
+    """
+    escaped = value.lower().replace("\\", "\\\\")
+    escaped = escaped.replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def filter_params(filters) -> Dict[str, Any]:
+    """
+    Values of the bound parameters of the statements filtered by a filter object,
+    by the names `AbstractService.__filter` binds them with: the filter's name, or
+    `distance_lat`, `distance_lon` and `distance_meters` for the distance filter
+    """
+    params: Dict[str, Any] = {}
+    for name, value in filters.items():
+        if value is None or name in NON_FILTER_KEYS:
+            continue
+        if name == "distance":
+            params["distance_lat"] = value.lat
+            params["distance_lon"] = value.lon
+            params["distance_meters"] = (
+                float(value.value) * METERS_PER_UNIT[value.units]
+            )
+        elif name[-4:] == "__ct":
+            params[name] = contains_pattern(value)
+        else:
+            params[name] = value
+    return params
+
+
+def filter_shape(filters) -> Hashable:
+    """
+    Shape of a filter object: which filters are set, whether each is a list, and
+    the sorting and output options. Filter objects of the same shape are filtered
+    by the same statement, with different bound parameters.
+    """
+    return (
+        tuple(
+            sorted(
+                (name, isinstance(value, list))
+                for name, value in filters.items()
+                if value is not None and name not in NON_FILTER_KEYS
+            )
+        ),
+        filters["sort_by"],
+        filters["sort_dir"],
+        filters.get("count") or "exact",
+        tuple(filters.get("fields") or ()),
+    )
+
+
+class ListResult(NamedTuple):
+    # page of items; dicts of the requested attributes if `fields` was given
+    items: List
+    # number of items matching the filters, across all pages. Approximate when
+    # count_mode is "estimate", None when it is "none"
+    num_total_results: Optional[int]
+    # count strategy used for num_total_results: "exact", "estimate" or "none"
+    count_mode: str
+    # whether there are more items after this page
+    has_more: bool
+    # cursor for the page after this one; None on the last page
+    next_cursor: Optional[str]
+
+
+class ListStatements(NamedTuple):
+    # statement for the page of items, with a trailing window count column
+    # if window_count is set
+    page: Select
+    # statement counting every item matching the filters
+    count: Select
+    # statement selecting every item matching the filters, unordered
+    filtered: Select
+    count_mode: str
+    window_count: bool
+    # names of the columns of page rows, if items are selected as plain rows
+    columns: Optional[List[str]] = None
+
+
+class ExplainedStatement(NamedTuple):
+    # which of the list statements was explained: "count" or "page"
+    statement: str
+    # SQL of the statement, with bound parameter placeholders
+    sql: str
+    # values of the bound parameters
+    params: Dict[str, Any]
+    planning_ms: float
+    execution_ms: float
+    # plan document returned by `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`
+    plan: Dict[str, Any]
+
 
 class AbstractService(Generic[ModelType, ModelTypeDTO, FilterTypeDTO, DistanceTypeDTO]):
-    def __init__(self, model: Type[ModelType], session: Session):
+    # in-process caches and indexes derived from the model's table, each with an
+    # `invalidate()` method; they are invalidated after every committed write
+    caches: ClassVar[List[Invalidatable]] = []
+    # attributes included in vector tile features when `fields` is not given
+    tile_properties: ClassVar[List[str]] = ["id"]
+    # maximum number of features per vector tile, taken in sort order; None for all
+    tile_limit: ClassVar[Optional[int]] = None
+    # columns identifying an item across bulk loads, if the model has the
+    # `natural_key` and `content_hash` columns; see campsites_db.ingest
+    natural_key: ClassVar[Optional[List[str]]] = None
+    # column scoping the deletion of items missing from a bulk load
+    prune_scope: ClassVar[Optional[str]] = None
+    # if set, `list()` selects these columns as plain rows and returns items as
+    # dicts of column values, without building model instances
+    row_columns: ClassVar[Optional[List[str]]] = None
+
+    def __init__(
+        self,
+        model: Type[ModelType],
+        session: Session,
+        async_session: Optional[AsyncSession] = None,
+    ):
         self.model = model
+        # statements are built once and can be executed on either session; the
+        # methods prefixed with `a` are async variants using `async_session`
         self.session = session
+        self.async_session = async_session
 
     """
-    Function to filter by distance.
+    Function to invalidate the service's caches. Called after every committed
+    write; only affects the current process.
+    """
+
+    def invalidate_caches(self) -> None:
+        for cache in self.caches:
+            cache.invalidate()
+
+    """
+    Function to filter by distance. Uses a spherical geography ST_DWithin, which
+    can use the `idx_*_geo_geography` GiST indexes. It is not identical to the
+    ST_DistanceSphere comparison it replaced: the sphere's radius is the mean
+    radius (6371008.8 m, not 6370986 m), so distances are about 0.0004% longer,
+    and the boundary is inclusive (`<=`, not `<`). Sites within that margin of
+    the boundary may be excluded where they used to be included.
 
     Parameters:
         distance_filters: DistanceTypeDTO (value, units, lat, lon)
 
     Returns:
-        query (Query): sqlalchemy query object with distance filter applied
+        query (Select): sqlalchemy select statement with distance filter applied
     """
 
-    def __distance(self, query: Query, distance_filters: DistanceTypeDTO):
-        # convert distance to meters
-        dis = distance_filters.value
-        dis = dis * 1609.344 if distance_filters.units == "mi" else dis * 1000
+    def __distance(self, query: Select, distance_filters: DistanceTypeDTO) -> Select:
+        params = filter_params({"distance": distance_filters})
+        # distance in meters
+        dis = bindparam("distance_meters", params["distance_meters"], type_=Float)
         # build point
-        lat, lon = distance_filters.lat, distance_filters.lon
-        point = from_shape(Point(lon, lat), srid=4326)
+        point = build_point(
+            bindparam("distance_lat", params["distance_lat"], type_=Float),
+            bindparam("distance_lon", params["distance_lon"], type_=Float),
+        )
 
         query = query.filter(
-            func.ST_DistanceSphere(getattr(self.model, "geo"), point) < dis
+            func.ST_DWithin(
+                as_geography(getattr(self.model, "geo")),
+                point,
+                dis,
+                # use_spheroid; compute on a sphere of the mean earth radius
+                False,
+            )
         )
         return query
 
     """
-    Takes in a sqlalchemy Query object and a filter object. Removes filters with
+    Takes in a sqlalchemy Select statement and a filter object. Removes filters with
     a None value and applies filters depending on type.
 
     The name of the filters may contain a modifier at the end, preceded with two
@@ -59,68 +291,326 @@ class AbstractService(Generic[ModelType, ModelTypeDTO, FilterTypeDTO, DistanceTy
     from a given point.
 
     Parameters:
-        query (Query): sqlalchemy query object
+        query (Select): sqlalchemy select statement
         filters (FilterTypeDTO): filter object
 
     Returns:
-        query (Query): sqlalchemy query object with filters applied
+        query (Select): sqlalchemy select statement with filters applied
     """
 
-    def __filter(self, query: Query, filters: FilterTypeDTO) -> Query:
-        # keys to exclude (sorting and pagination)
-        excluded_keys = ["offset", "limit", "sort_by", "sort_dir"]
+    def __filter(self, query: Select, filters: FilterTypeDTO) -> Select:
+        params = filter_params(filters)
         for name in filters:
             if filters[name] is not None:
-                if name in excluded_keys:
+                if name in NON_FILTER_KEYS:
                     continue
-                if name[-4:] == "__lt":
-                    # greater than query
-                    query = query.filter(
-                        getattr(self.model, name[:-4]) <= filters[name]
-                    )
-                elif name[-4:] == "__gt":
-                    # less than query
-                    query = query.filter(
-                        getattr(self.model, name[:-4]) >= filters[name]
-                    )
-                elif name[-4:] == "__ct":
-                    query = query.filter(
-                        func.lower(getattr(self.model, name[:-4])).contains(
-                            filters[name].lower()
-                        )
-                    )
-                elif name == "distance":
+                if name == "distance":
                     query = self.__distance(query, filters[name])
+                    continue
+                modifier = name[-4:] if name[-4:] in ["__lt", "__gt", "__ct"] else None
+                column = getattr(self.model, name[:-4] if modifier else name)
+                # values are bound by filter name, so that statements of the same
+                # shape can be reused with other values; see `filter_params()`
+                value = bindparam(
+                    name,
+                    params[name],
+                    type_=column.type,
+                    expanding=isinstance(filters[name], list),
+                )
+                if modifier == "__lt":
+                    # less than query
+                    query = query.filter(column <= value)
+                elif modifier == "__gt":
+                    # greater than query
+                    query = query.filter(column >= value)
+                elif modifier == "__ct":
+                    # a single LIKE pattern on lower(column) matches the trigram
+                    # indexes; wildcards in the search string are escaped
+                    query = query.filter(func.lower(column).like(value))
                 elif isinstance(filters[name], list):
-                    query = query.filter(getattr(self.model, name).in_(filters[name]))
+                    query = query.filter(column.in_(value))
                 else:
-                    query = query.filter(getattr(self.model, name) == filters[name])
+                    query = query.filter(column == value)
         return query
 
+    """
+    Function to select the model, loading only the columns for the given attribute
+    names (and the primary key) if any are given. Other columns are not fetched by
+    the query and are left unloaded on the returned items.
+
+    Parameters:
+        fields (List[str] | None): attribute names to load; all columns if None
+
+    Returns:
+        query (Select): sqlalchemy select statement
+    """
+
+    def __select(self, fields: Optional[List[str]] = None) -> Select:
+        query = select(self.model)
+        if fields:
+            query = query.options(
+                load_only(*[getattr(self.model, name) for name in fields])
+            )
+        return query
+
+    """
+    Function to apply filters to a statement built by a subclass, as `list()` does.
+
+    Parameters:
+        query (Select): sqlalchemy select statement
+        filters (FilterTypeDTO): filter object
+
+    Returns:
+        query (Select): sqlalchemy select statement with filters applied
+    """
+
+    def apply_filters(self, query: Select, filters: FilterTypeDTO) -> Select:
+        return self.__filter(query, filters)
+
     """
     Function to get a single item by UUID. Raises a 404 HTTP exception
     if item was not found.
 
     Parameters:
         id (UUID4): UUID of item
+        fields (List[str] | None): attribute names to load, as in `list()`
 
     Returns:
-        item (ModelType): item with given UUID4
+        item (ModelType | Dict): item with given UUID4, or a dict of the
+            requested attributes if `fields` was given
     """
 
-    def get(self, id: UUID4) -> ModelType:
+    def get(self, id: UUID4, fields: Optional[List[str]] = None) -> ModelType:
         item: Optional[ModelType] = (
-            self.session.query(self.model).filter_by(id=id).first()
+            self.session.execute(self.__select(fields).filter_by(id=id))
+            .scalars()
+            .first()
         )
         if item is None:
             self.session.rollback()
             raise HTTPException(status_code=404, detail=f"Item with id {id} not found")
-        return item
+        return project(item, fields) if fields else item
 
     """
-    Function to list items based on applied filters. Returns a tuple containing the list
-    of items, limited by the page size and page, and the number of total items based on
-    applied filters.
+    Async variant of `get()`.
+    """
+
+    async def aget(self, id: UUID4, fields: Optional[List[str]] = None) -> ModelType:
+        result = await self.async_session.execute(
+            self.__select(fields).filter_by(id=id)
+        )
+        item: Optional[ModelType] = result.scalars().first()
+        if item is None:
+            await self.async_session.rollback()
+            raise HTTPException(status_code=404, detail=f"Item with id {id} not found")
+        return project(item, fields) if fields else item
+
+    """
+    Function to apply the keyset condition for a cursor, seeking past the last item of
+    the previous page. The cursor holds the sort column, sort direction, and the
+    (sort value, id) of the last item; the query must be ordered by (sort column, id)
+    in the cursor's direction.
+
+    Postgres sorts NULLs last when ascending and first when descending, and a row-value
+    comparison against NULL is never true, so nullable sort columns need the NULL
+    block handled separately.
+
+    Parameters:
+        query (Select): sqlalchemy select statement, ordered by (sort column, id)
+        filters (FilterTypeDTO): object with filters to apply, containing the cursor
+
+    Returns:
+        query (Select): sqlalchemy select statement with keyset condition applied
+    """
+
+    def __seek(self, query: Select, filters: FilterTypeDTO) -> Select:
+        value, last_id = decode_keyset_cursor(
+            filters["cursor"], filters["sort_by"], filters["sort_dir"]
+        )
+
+        column = self.model.__table__.c[getattr(self.model, filters["sort_by"]).key]
+        id_column = self.model.__table__.c["id"]
+        ascending = filters["sort_dir"] == "asc"
+
+        if value is None:
+            # the last item was in the NULL block; continue within it by id
+            last_id = bindparam("cursor_id", last_id, type_=id_column.type)
+            same_block = and_(
+                column.is_(None),
+                id_column > last_id if ascending else id_column < last_id,
+            )
+            # descending puts the NULL block first, so all non-null rows follow it
+            return query.filter(
+                same_block if ascending else or_(same_block, column.isnot(None))
+            )
+
+        row = tuple_(column, id_column)
+        bound = tuple_(
+            bindparam("cursor_value", value, type_=column.type),
+            bindparam("cursor_id", last_id, type_=id_column.type),
+        )
+        condition = row > bound if ascending else row < bound
+        if ascending and column.nullable:
+            # the NULL block comes after every non-null value
+            condition = or_(condition, column.is_(None))
+        return query.filter(condition)
+
+    """
+    Function to build the statements used by `list()` and `alist()`.
+
+    Parameters:
+        filters (FilterTypeDTO): object with filters to apply
+
+    Returns:
+        statements (ListStatements): page, count and filtered statements, and
+            the count strategy to use with them
+    """
+
+    def __list_statements(self, filters: FilterTypeDTO) -> ListStatements:
+        count_mode = filters.get("count") or "exact"
+        fields = filters.get("fields")
+        if fields:
+            # the sort column is needed for the next page's cursor
+            fields = [*fields, filters["sort_by"]]
+        columns = None
+        if self.row_columns:
+            # each column once, in the order of `fields` or `row_columns`
+            columns = list(dict.fromkeys(fields or self.row_columns))
+            table = self.model.__table__
+            filtered = self.__filter(
+                select(*[table.c[name] for name in columns]), filters
+            )
+        else:
+            filtered = self.__filter(self.__select(fields), filters)
+        count = select(func.count()).select_from(filtered.subquery())
+
+        window_count = count_mode == "exact" and not filters.get("cursor")
+        page = filtered
+        if window_count:
+            page = page.add_columns(func.count().over())
+        sort_column = getattr(self.model, filters["sort_by"])
+        direction = filters["sort_dir"]
+        page = page.order_by(
+            getattr(sort_column, direction)(),
+            getattr(getattr(self.model, "id"), direction)(),
+        )
+        if filters.get("cursor"):
+            page = self.__seek(page, filters)
+        else:
+            page = page.offset(
+                bindparam("page_offset", filters["offset"], type_=Integer)
+            )
+        # fetch one extra row to find out if there is a next page
+        page = page.limit(bindparam("page_limit", filters["limit"] + 1, type_=Integer))
+        return ListStatements(page, count, filtered, count_mode, window_count, columns)
+
+    """
+    Function to find the statements and bound parameters for `list()` and
+    `alist()`. Statements are cached in `list_statements` by service and filter
+    shape (see `filter_shape()`), and reused with the filters' values as
+    parameters, which saves building them and SQLAlchemy's compiled cache lookup
+    key on every request.
+
+    Parameters:
+        filters (FilterTypeDTO): object with filters to apply
+
+    Returns:
+        statements (ListStatements), params (Dict[str, Any]): the statements,
+            and the values of their bound parameters
+    """
+
+    def __list_query(self, filters: FilterTypeDTO) -> Tuple[ListStatements, Dict]:
+        params = filter_params(filters)
+        params["page_limit"] = filters["limit"] + 1
+        cursor_shape = None
+        if filters.get("cursor"):
+            value, last_id = decode_keyset_cursor(
+                filters["cursor"], filters["sort_by"], filters["sort_dir"]
+            )
+            params["cursor_value"], params["cursor_id"] = value, last_id
+            # a cursor in the NULL block seeks with a different condition
+            cursor_shape = value is None
+        else:
+            params["page_offset"] = filters["offset"]
+
+        key = (type(self), filter_shape(filters), cursor_shape)
+        hit, statements = list_statements.get(key)
+        if not hit:
+            statements = self.__list_statements(filters)
+            list_statements.set(key, statements)
+        return statements, params
+
+    """
+    Function to build the `ListResult` for the rows returned by a `ListStatements`
+    page statement.
+
+    Parameters:
+        rows (List[Row]): rows returned by the page statement
+        filters (FilterTypeDTO): object with filters applied
+        statements (ListStatements): statements the rows were selected with
+        num_total_results (int | None): number of total items, if already known
+
+    Returns:
+        result (ListResult): page of items and paging information
+    """
+
+    def __list_result(
+        self,
+        rows: List,
+        filters: FilterTypeDTO,
+        statements: ListStatements,
+        num_total_results: Optional[int],
+    ) -> ListResult:
+        if statements.window_count and rows:
+            num_total_results = rows[0][-1]
+        if statements.columns:
+            # zip leaves out the trailing window count column
+            items = [dict(zip(statements.columns, row)) for row in rows]
+        else:
+            items = [row[0] for row in rows]
+
+        result = items[: filters["limit"]]
+        has_more = len(items) > filters["limit"]
+        next_cursor = None
+        if has_more:
+            last = result[-1]
+            next_cursor = encode_cursor(
+                [
+                    filters["sort_by"],
+                    filters["sort_dir"],
+                    attribute(last, filters["sort_by"]),
+                    str(attribute(last, "id")),
+                ]
+            )
+        if filters.get("fields"):
+            result = [project(item, filters["fields"]) for item in result]
+        return ListResult(
+            result, num_total_results, statements.count_mode, has_more, next_cursor
+        )
+
+    """
+    Function to list items based on applied filters. Returns the list of items, limited
+    by the page size and either the offset or the cursor, the number of total items
+    based on applied filters, whether there is a next page, and a cursor for it.
+
+    Items are ordered by the sort column, then by id, so that pages are stable.
+    If a cursor (from a previous page's `next_cursor`) is given, the page is found
+    by seeking past the previous page's last item and the offset is ignored; this
+    stays fast for deep pages and does not shift when rows are added.
+
+    The `count` filter selects how the number of total items is found:
+        exact: a window count computed in the same query as the page. This needs a
+            separate count query when a cursor is given, as the seek condition
+            hides the rows of earlier pages from the window, or when the offset is
+            past the last item
+        estimate: the planner's row estimate for the filtered query
+        none: no count
+    `has_more` is always found by fetching one more row than the page size.
+
+    If the `fields` filter is given, only those columns are selected and the items
+    are returned as dicts of the requested attributes. If `row_columns` is set,
+    items are always dicts, of those columns if `fields` is not given, read from
+    plain rows without building model instances.
 
     Parameters:
         filters (FilterTypeDTO): object with filters to apply.
@@ -128,26 +618,342 @@ class AbstractService(Generic[ModelType, ModelTypeDTO, FilterTypeDTO, DistanceTy
             description for `__filter()`
 
     Returns:
-        result (List[ModelType]), num_total_results (int): a tuple containing the
-            list of items and the number of total items
+        result (ListResult): the list of items, the number of total items, the
+            count mode used, whether there is a next page, and the cursor for it
     """
 
-    def list(self, filters: FilterTypeDTO) -> Tuple[List[ModelType], int]:
+    def list(self, filters: FilterTypeDTO) -> ListResult:
         try:
-            query = self.session.query(self.model)
-            query = self.__filter(query, filters)
-            query = query.order_by(
-                getattr(getattr(self.model, filters["sort_by"]), filters["sort_dir"])()
+            statements, params = self.__list_query(filters)
+            num_total_results = None
+            if statements.count_mode == "exact" and not statements.window_count:
+                num_total_results = self.session.execute(
+                    statements.count, params
+                ).scalar_one()
+            elif statements.count_mode == "estimate":
+                plan = self.session.execute(
+                    Explain(statements.filtered), params
+                ).scalar()
+                num_total_results = int(parse_plan(plan)["Plan"]["Plan Rows"])
+
+            rows = self.session.execute(statements.page, params).all()
+            if statements.window_count and not rows:
+                # the window had no rows to count; the offset may be past the end
+                num_total_results = (
+                    self.session.execute(statements.count, params).scalar_one()
+                    if filters["offset"]
+                    else 0
+                )
+            return self.__list_result(rows, filters, statements, num_total_results)
+        except Exception as e:
+            self.session.rollback()
+            raise e
+
+    """
+    Async variant of `list()`.
+    """
+
+    async def alist(self, filters: FilterTypeDTO) -> ListResult:
+        try:
+            statements, params = self.__list_query(filters)
+            num_total_results = None
+            if statements.count_mode == "exact" and not statements.window_count:
+                result = await self.async_session.execute(statements.count, params)
+                num_total_results = result.scalar_one()
+            elif statements.count_mode == "estimate":
+                result = await self.async_session.execute(
+                    Explain(statements.filtered), params
+                )
+                num_total_results = int(
+                    parse_plan(result.scalar())["Plan"]["Plan Rows"]
+                )
+
+            rows = (await self.async_session.execute(statements.page, params)).all()
+            if statements.window_count and not rows:
+                # the window had no rows to count; the offset may be past the end
+                num_total_results = 0
+                if filters["offset"]:
+                    result = await self.async_session.execute(statements.count, params)
+                    num_total_results = result.scalar_one()
+            return self.__list_result(rows, filters, statements, num_total_results)
+        except Exception as e:
+            await self.async_session.rollback()
+            raise e
+
+    """
+    Function to run the statements `list()` runs for a filter object under
+    `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`, to find out where a slow list
+    spends its time. The statements are executed, but their rows are discarded.
+    The count statement is only explained when `list()` runs it separately from
+    the page; the planner estimate of count=estimate is not executed.
+
+    Parameters:
+        filters (FilterTypeDTO): object with filters to apply, as in `list()`
+
+    Returns:
+        plans (List[ExplainedStatement]): the plan and timings of each statement,
+            in the order `list()` runs them
+    """
+
+    def explain(self, filters: FilterTypeDTO) -> List[ExplainedStatement]:
+        try:
+            statements, params = self.__list_query(filters)
+            plans = []
+            for name, statement in self.__explained_statements(statements):
+                plan = self.session.execute(
+                    Explain(statement, analyze=True, buffers=True), params
+                ).scalar()
+                plans.append(self.__explained(name, statement, params, plan))
+            return plans
+        except Exception as e:
+            self.session.rollback()
+            raise e
+
+    """
+    Async variant of `explain()`.
+    """
+
+    async def aexplain(self, filters: FilterTypeDTO) -> List[ExplainedStatement]:
+        try:
+            statements, params = self.__list_query(filters)
+            plans = []
+            for name, statement in self.__explained_statements(statements):
+                result = await self.async_session.execute(
+                    Explain(statement, analyze=True, buffers=True), params
+                )
+                plans.append(self.__explained(name, statement, params, result.scalar()))
+            return plans
+        except Exception as e:
+            await self.async_session.rollback()
+            raise e
+
+    def __explained_statements(
+        self, statements: ListStatements
+    ) -> List[Tuple[str, Select]]:
+        explained = []
+        if statements.count_mode == "exact" and not statements.window_count:
+            explained.append(("count", statements.count))
+        explained.append(("page", statements.page))
+        return explained
+
+    def __explained(
+        self, name: str, statement: Select, params: Dict[str, Any], plan
+    ) -> ExplainedStatement:
+        plan = parse_plan(plan)
+        return ExplainedStatement(
+            name,
+            str(statement.compile(dialect=postgresql.dialect())),
+            params,
+            plan["Planning Time"],
+            plan["Execution Time"],
+            plan,
+        )
+
+    """
+    Function to read every item matching the filters, in the order given by the
+    sort filters, for exports. Rows are read through a server-side cursor,
+    `batch_size` at a time, as plain column values rather than model instances,
+    so memory use doesn't grow with the number of items. Pagination filters are
+    ignored.
+
+    Parameters:
+        filters (FilterTypeDTO): object with filters to apply, as in `list()`
+        columns (List[str]): names of the columns to read
+        batch_size (int): number of rows fetched at a time
+
+    Returns:
+        batches (Iterator[List[Dict]]): batches of rows, as dicts of column values
+    """
+
+    def stream(
+        self,
+        filters: FilterTypeDTO,
+        columns: List[str],
+        batch_size: int = STREAM_BATCH_SIZE,
+    ) -> Iterator[List[Dict]]:
+        statement = self.__stream_statement(filters, columns, batch_size)
+        try:
+            result = self.session.execute(statement).mappings()
+            for batch in result.partitions():
+                yield [dict(row) for row in batch]
+        except Exception as e:
+            self.session.rollback()
+            raise e
+
+    """
+    Async variant of `stream()`.
+    """
+
+    async def astream(
+        self,
+        filters: FilterTypeDTO,
+        columns: List[str],
+        batch_size: int = STREAM_BATCH_SIZE,
+    ) -> AsyncIterator[List[Dict]]:
+        statement = self.__stream_statement(filters, columns, batch_size)
+        try:
+            result = (await self.async_session.stream(statement)).mappings()
+            async for batch in result.partitions():
+                yield [dict(row) for row in batch]
+        except Exception as e:
+            await self.async_session.rollback()
+            raise e
+
+    """
+    Function to build the statement used by `stream()` and `astream()`.
+    """
+
+    def __stream_statement(
+        self, filters: FilterTypeDTO, columns: List[str], batch_size: int
+    ) -> Select:
+        table = self.model.__table__
+        query = self.__filter(select(*[table.c[name] for name in columns]), filters)
+        sort_column = getattr(self.model, filters["sort_by"])
+        direction = filters["sort_dir"]
+        query = query.order_by(
+            getattr(sort_column, direction)(),
+            getattr(getattr(self.model, "id"), direction)(),
+        )
+        # yield_per streams the rows with a server-side cursor
+        return query.execution_options(yield_per=batch_size)
+
+    """
+    Function to list the `k` items closest to a given point, nearest first. Ordering
+    uses the PostGIS KNN operator (`<->`) on geography, which is answered by walking
+    the `idx_*_geo_geography` GiST index instead of sorting every matching row.
+    All other filters are applied as in `list()`; pagination and sorting filters
+    are ignored.
+
+    Parameters:
+        lat (float): latitude of the point to search from
+        lon (float): longitude of the point to search from
+        k (int): maximum number of items to return
+        filters (FilterTypeDTO): object with filters to apply, as in `list()`
+
+    Returns:
+        result (List[Tuple[ModelType, float]]): list of (item, distance in meters)
+            tuples, ordered by distance
+    """
+
+    def nearest(
+        self, lat: float, lon: float, k: int, filters: FilterTypeDTO
+    ) -> List[Tuple[ModelType, float]]:
+        try:
+            rows = self.session.execute(self.__nearest_statement(lat, lon, k, filters))
+            return [(item, distance) for item, distance in rows]
+        except Exception as e:
+            self.session.rollback()
+            raise e
+
+    """
+    Async variant of `nearest()`.
+    """
+
+    async def anearest(
+        self, lat: float, lon: float, k: int, filters: FilterTypeDTO
+    ) -> List[Tuple[ModelType, float]]:
+        try:
+            rows = await self.async_session.execute(
+                self.__nearest_statement(lat, lon, k, filters)
             )
-            num_total_results = query.count()
-            query = query.limit(filters["limit"])
-            query = query.offset(filters["offset"])
-            result: List[ModelTypeDTO] = query.all()
-            return result, num_total_results
+            return [(item, distance) for item, distance in rows]
+        except Exception as e:
+            await self.async_session.rollback()
+            raise e
+
+    """
+    Function to build the statement used by `nearest()` and `anearest()`.
+    """
+
+    def __nearest_statement(
+        self, lat: float, lon: float, k: int, filters: FilterTypeDTO
+    ) -> Select:
+        point = build_point(lat, lon)
+        geo = as_geography(getattr(self.model, "geo"))
+        query = select(
+            self.model, func.ST_Distance(geo, point, False).label("distance")
+        )
+        query = self.__filter(query, filters)
+        return query.order_by(geo.op("<->")(point)).limit(k)
+
+    """
+    Function to render a Mapbox Vector Tile of the items in tile `z/x/y`, with a
+    single layer named after the model's table. The tile's bounding box is
+    matched against the `geo` GiST index, and all filters are applied as in
+    `list()`; pagination filters are ignored.
+
+    Each feature carries the attributes named by the `fields` filter, or
+    `tile_properties` if it is not given. If `tile_limit` is set, only that many
+    features are kept, in the order given by the sort filters.
+
+    Parameters:
+        z (int): zoom level
+        x (int): tile column
+        y (int): tile row
+        filters (FilterTypeDTO): object with filters to apply, as in `list()`
+
+    Returns:
+        tile (bytes): the encoded tile; empty if no items are in it
+    """
+
+    def tile(self, z: int, x: int, y: int, filters: FilterTypeDTO) -> bytes:
+        try:
+            tile = self.session.execute(
+                self.__tile_statement(z, x, y, filters)
+            ).scalar()
+            return bytes(tile or b"")
         except Exception as e:
             self.session.rollback()
             raise e
 
+    """
+    Async variant of `tile()`.
+    """
+
+    async def atile(self, z: int, x: int, y: int, filters: FilterTypeDTO) -> bytes:
+        try:
+            result = await self.async_session.execute(
+                self.__tile_statement(z, x, y, filters)
+            )
+            return bytes(result.scalar() or b"")
+        except Exception as e:
+            await self.async_session.rollback()
+            raise e
+
+    """
+    Function to build the statement used by `tile()` and `atile()`.
+    """
+
+    def __tile_statement(
+        self, z: int, x: int, y: int, filters: FilterTypeDTO
+    ) -> Select:
+        envelope = func.ST_TileEnvelope(z, x, y)
+        geo = getattr(self.model, "geo")
+        geom = func.ST_AsMVTGeom(
+            func.ST_Transform(geo, 3857), envelope, TILE_EXTENT, TILE_BUFFER, True
+        ).label("geom")
+        properties = filters.get("fields") or self.tile_properties
+        query = select(geom, *[getattr(self.model, name) for name in properties])
+        # bounding box overlap, answered by the plain geometry GiST index
+        query = query.filter(geo.op("&&")(func.ST_Transform(envelope, 4326)))
+        query = self.__filter(query, filters)
+        if self.tile_limit is not None:
+            direction = filters["sort_dir"]
+            query = query.order_by(
+                getattr(getattr(self.model, filters["sort_by"]), direction)(),
+                getattr(getattr(self.model, "id"), direction)(),
+            ).limit(self.tile_limit)
+        features = query.subquery("features")
+        return select(
+            func.ST_AsMVT(
+                features.table_valued(),
+                self.model.__tablename__,
+                TILE_EXTENT,
+                "geom",
+                type_=LargeBinary,
+            )
+        )
+
     """
     Function to add an instance of the item to the database. Takes in the
     item, adds it to the database, and returns the item with its assigned UUID.
@@ -165,30 +971,223 @@ class AbstractService(Generic[ModelType, ModelTypeDTO, FilterTypeDTO, DistanceTy
         self.session.add(item)
         try:
             self.session.commit()
+            self.invalidate_caches()
         except Exception:
             self.session.rollback()
             raise HTTPException(status_code=422, detail="Item could not be created.")
         return item
 
     """
-    Function to add multiple items to the database. Takes in a list of
-    items and adds them to the database. Does not return the items, as the list could be
-    large.
+    Async variant of `create()`.
+    """
+
+    async def acreate(self, item: ModelTypeDTO) -> ModelType:
+        item: ModelType = self.model(**item.model_dump())
+        self.async_session.add(item)
+        try:
+            await self.async_session.commit()
+            self.invalidate_caches()
+        except Exception:
+            await self.async_session.rollback()
+            raise HTTPException(status_code=422, detail="Item could not be created.")
+        return item
+
+    """
+    Function to add multiple items to the database. Takes in a list of items and
+    streams them into the table with PostgreSQL COPY, through a staging table;
+    ids and the `geo` point are computed in SQL, so any ids on the items are
+    ignored. Does not return the items, as the list could be large.
+
+    If the service has a `natural_key`, items already in the table are not added
+    again: with `update`, they are updated if their content changed, otherwise
+    they are left as they are. With `prune` and a `prune_scope`, items loaded
+    before that are missing from `items` are deleted, within the `prune_scope`
+    values present in `items`.
+
+    `check` is called once every item is read, before the table is written. An
+    HTTPException it raises aborts the load and is raised as is.
 
     If an issue is encountered while adding items, a 422 HTTP exception is thrown.
 
     Parameters:
-        items (List[ModelTypeDTO]): objects to be added to the database, in DTO format.
+        items (Iterable[ModelTypeDTO]): objects to be added to the database, in
+            DTO format.
+        update (bool): whether to update changed items
+        prune (bool): whether to delete missing items
+        check (Callable[[], None] | None): called before the table is written
+
+    Returns:
+        result (IngestResult): number of items loaded, inserted, updated,
+            unchanged and deleted, and time taken
+    """
+
+    def bulk_create(
+        self,
+        items: Iterable[ModelTypeDTO],
+        update: bool = False,
+        prune: bool = False,
+        check: Optional[Callable[[], None]] = None,
+    ) -> IngestResult:
+        columns, rows = self.__copy_input(items)
+        return self.bulk_load(columns, rows, update, prune, check)
+
+    """
+    Async variant of `bulk_create()`. `items` may also be an async iterable, so
+    they can be produced without blocking the event loop.
+    """
+
+    async def abulk_create(
+        self,
+        items: Union[Iterable[ModelTypeDTO], AsyncIterable[ModelTypeDTO]],
+        update: bool = False,
+        prune: bool = False,
+        check: Optional[Callable[[], None]] = None,
+    ) -> IngestResult:
+        if isinstance(items, AsyncIterable):
+            columns, rows = await self.__acopy_input(items)
+        else:
+            columns, rows = self.__copy_input(items)
+        return await self.abulk_load(columns, rows, update, prune, check)
+
+    """
+    Function to add rows of column values to the database, as `bulk_create()`
+    does for items. Lets loaders that already produce plain rows skip building
+    DTOs.
+
+    Parameters:
+        columns (List[str]): column names, in the order of the row values
+        rows (Iterable[tuple]): row values; nothing is loaded if there are no
+            columns
+        update (bool): whether to update changed items
+        prune (bool): whether to delete missing items
+        check (Callable[[], None] | None): called before the table is written
+
+    Returns:
+        result (IngestResult): number of rows loaded, inserted, updated,
+            unchanged and deleted, and time taken
     """
 
-    def bulk_create(self, items: List[ModelTypeDTO]) -> None:
-        items: List[ModelType] = [self.model(**item.model_dump()) for item in items]
-        self.session.add_all(items)
+    def bulk_load(
+        self,
+        columns: List[str],
+        rows: Iterable[tuple],
+        update: bool = False,
+        prune: bool = False,
+        check: Optional[Callable[[], None]] = None,
+    ) -> IngestResult:
         try:
+            result = IngestResult(0, 0.0)
+            if columns:
+                result = copy_rows(
+                    self.session.connection(),
+                    self.model,
+                    columns,
+                    rows,
+                    self.natural_key,
+                    update,
+                    self.prune_scope if prune else None,
+                    check,
+                )
             self.session.commit()
+            self.invalidate_caches()
+        except HTTPException:
+            self.session.rollback()
+            raise
         except Exception:
             self.session.rollback()
             raise HTTPException(status_code=422, detail="Items could not be created.")
+        return result
+
+    """
+    Async variant of `bulk_load()`. `rows` may also be an async iterable.
+    """
+
+    async def abulk_load(
+        self,
+        columns: List[str],
+        rows: Union[Iterable[tuple], AsyncIterable[tuple]],
+        update: bool = False,
+        prune: bool = False,
+        check: Optional[Callable[[], None]] = None,
+    ) -> IngestResult:
+        try:
+            result = IngestResult(0, 0.0)
+            if columns:
+                connection = await self.async_session.connection()
+                result = await acopy_rows(
+                    connection,
+                    self.model,
+                    columns,
+                    rows,
+                    self.natural_key,
+                    update,
+                    self.prune_scope if prune else None,
+                    check,
+                )
+            await self.async_session.commit()
+            self.invalidate_caches()
+        except HTTPException:
+            await self.async_session.rollback()
+            raise
+        except Exception:
+            await self.async_session.rollback()
+            raise HTTPException(status_code=422, detail="Items could not be created.")
+        return result
+
+    """
+    Function to convert items into the columns and rows loaded by `bulk_create()`.
+    The columns are the model's columns present on the first item, except `id`.
+
+    Parameters:
+        items (Iterable[ModelTypeDTO]): objects to convert
+
+    Returns:
+        columns (List[str]), rows (Iterator[tuple]): column names, and a lazy
+            iterator of row values in column order; no columns if there are
+            no items
+    """
+
+    def __copy_input(
+        self, items: Iterable[ModelTypeDTO]
+    ) -> Tuple[List[str], Iterator[tuple]]:
+        items = iter(items)
+        first = next(items, None)
+        if first is None:
+            return [], iter(())
+        columns = self.__copy_columns(first)
+        rows = (self.__copy_row(item, columns) for item in chain([first], items))
+        return columns, rows
+
+    """
+    Async variant of `__copy_input()`, for async iterables of items.
+    """
+
+    async def __acopy_input(
+        self, items: AsyncIterable[ModelTypeDTO]
+    ) -> Tuple[List[str], AsyncIterator[tuple]]:
+        items = items.__aiter__()
+        try:
+            first = await items.__anext__()
+        except StopAsyncIteration:
+            return [], None
+        columns = self.__copy_columns(first)
+
+        async def rows() -> AsyncIterator[tuple]:
+            yield self.__copy_row(first, columns)
+            async for item in items:
+                yield self.__copy_row(item, columns)
+
+        return columns, rows()
+
+    def __copy_columns(self, item: ModelTypeDTO) -> List[str]:
+        table_columns = self.model.__table__.c
+        return [
+            name for name in item.model_dump() if name != "id" and name in table_columns
+        ]
+
+    def __copy_row(self, item: ModelTypeDTO, columns: List[str]) -> tuple:
+        dump = item.model_dump()
+        return tuple(dump[name] for name in columns)
 
     """
     Function to update the values for an item. Takes in the UUID of the item as well
@@ -213,11 +1212,30 @@ class AbstractService(Generic[ModelType, ModelTypeDTO, FilterTypeDTO, DistanceTy
                 setattr(db_item, key, value)
         try:
             self.session.commit()
+            self.invalidate_caches()
         except Exception as e:
             self.session.rollback()
             raise e
         return db_item
 
+    """
+    Async variant of `update()`.
+    """
+
+    async def aupdate(self, id: UUID4, item: ModelTypeDTO) -> ModelType:
+        db_item = await self.aget(id)
+        for key, value in item.model_dump().items():
+            # we want to ensure we are not overwriting the ID
+            if key != "id":
+                setattr(db_item, key, value)
+        try:
+            await self.async_session.commit()
+            self.invalidate_caches()
+        except Exception as e:
+            await self.async_session.rollback()
+            raise e
+        return db_item
+
     """
     Function to delete an item by UUID. Takes in the UUID of the item and removes it from
     the database.
@@ -227,12 +1245,32 @@ class AbstractService(Generic[ModelType, ModelTypeDTO, FilterTypeDTO, DistanceTy
     """
 
     def delete(self, id: UUID4) -> None:
-        item = self.session.query(self.model).filter_by(id=id).first()
+        item = (
+            self.session.execute(select(self.model).filter_by(id=id)).scalars().first()
+        )
         if item is None:
             raise HTTPException(status_code=404, detail=f"Item with id {id} not found")
         try:
             self.session.delete(item)
             self.session.commit()
+            self.invalidate_caches()
         except Exception as e:
             self.session.rollback()
             raise e
+
+    """
+    Async variant of `delete()`.
+    """
+
+    async def adelete(self, id: UUID4) -> None:
+        result = await self.async_session.execute(select(self.model).filter_by(id=id))
+        item = result.scalars().first()
+        if item is None:
+            raise HTTPException(status_code=404, detail=f"Item with id {id} not found")
+        try:
+            await self.async_session.delete(item)
+            await self.async_session.commit()
+            self.invalidate_caches()
+        except Exception as e:
+            await self.async_session.rollback()
+            raise e
@@ -0,0 +1,96 @@
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+# number of set bits in each byte value
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], np.uint8)
+
+
+class BitmapIndex:
+    """
+    Bitmap index over low-cardinality columns (enums and booleans): one bitset
+    per (column, value), packed 8 rows to a byte, with bit i set if row i has
+    the value. NULLs are in no bitset, so they match no filter.
+
+    A filter combination is answered by OR-ing the bitsets of each column's
+    accepted values and AND-ing the columns together, which gives both the
+    matching rows and their exact count. Only the in-memory engine uses it, so
+    it only answers requests when `CAMPSITES_MEMORY_ENGINE` is set.
+
+    The bitsets are left uncompressed: one is `size / 8` bytes, about 2 KB for
+    the campsites table, a fraction of the snapshot's other columns. Rows are in
+    table order rather than sorted by value, so run-length encoding would find
+    few runs, and a roaring bitmap keeps sets this dense as plain bitsets too;
+    either would make intersections slower for no real saving.
+    """
+
+    def __init__(self, columns: Dict[str, Sequence[Hashable]]):
+        """
+        Parameters:
+            columns (Dict[str, Sequence[Hashable]]): values of each indexed
+                column, row by row; all the same length. None is NULL.
+        """
+        sizes = {len(values) for values in columns.values()}
+        if len(sizes) > 1:
+            raise ValueError("Columns have different lengths")
+        self.size = sizes.pop() if sizes else 0
+        self._empty = np.zeros((self.size + 7) // 8, np.uint8)
+        self._all = np.packbits(np.ones(self.size, bool))
+        self.bitsets: Dict[str, Dict[Hashable, np.ndarray]] = {}
+        for name, values in columns.items():
+            values = np.array(values, object)
+            self.bitsets[name] = {
+                value: np.packbits(values == value)
+                for value in set(values.tolist())
+                if value is not None
+            }
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.bitsets)
+
+    def bitset(self, column: str, value: Any) -> np.ndarray:
+        """
+        Rows where `column` is `value`, or any of `value` if it is a list
+        """
+        values = value if isinstance(value, list) else [value]
+        bitsets = self.bitsets[column]
+        if len(values) == 1:
+            return bitsets.get(values[0], self._empty)
+        found = self._empty.copy()
+        for v in values:
+            if v in bitsets:
+                found |= bitsets[v]
+        return found
+
+    def query(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Intersects the bitsets of a filter combination. Filters on columns that
+        aren't indexed, or whose value is None, are ignored.
+
+        Parameters:
+            filters (Dict[str, Any]): column -> value, or list of values (IN)
+
+        Returns:
+            bits (np.ndarray): packed bitset of the matching rows
+        """
+        bits: Optional[np.ndarray] = None
+        for column, value in filters.items():
+            if value is None or column not in self.bitsets:
+                continue
+            found = self.bitset(column, value)
+            bits = found.copy() if bits is None else np.bitwise_and(bits, found, bits)
+        return self._all.copy() if bits is None else bits
+
+    @staticmethod
+    def count(bits: np.ndarray) -> int:
+        """
+        Number of rows in a bitset
+        """
+        return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+    def mask(self, bits: np.ndarray) -> np.ndarray:
+        """
+        A bitset as a boolean array with one item per row
+        """
+        return np.unpackbits(bits, count=self.size).view(bool)
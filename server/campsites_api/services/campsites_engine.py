@@ -0,0 +1,408 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from campsites_api.dto.campsites import (
+    CampsiteDTO,
+    CampsiteFilterDTO,
+    DistanceFilterDTO,
+    SortByEnum,
+)
+from campsites_api.services.abstract_service import (
+    METERS_PER_UNIT,
+    NON_FILTER_KEYS,
+    ListResult,
+)
+from campsites_api.services.bitmap_index import BitmapIndex
+from campsites_api.utils.cursor import decode_keyset_cursor, encode_cursor
+from campsites_api.utils.fields import project
+from campsites_db.models import Campsite, table_version
+
+# whether campsite lists are answered from memory by `campsites_engine`
+CAMPSITES_MEMORY_ENGINE = os.environ.get(
+    "CAMPSITES_MEMORY_ENGINE", "false"
+).lower() in ["1", "true"]
+# mean radius of the WGS 84 spheroid: the sphere PostGIS measures geography
+# distances on when use_spheroid is false
+EARTH_RADIUS_METERS = 6371008.7714
+# columns matched by `__ct` filters; lowercased by postgres when loaded, so that
+# matches don't depend on python's idea of lowercase
+SEARCH_COLUMNS = ["code", "name"]
+ITEM_COLUMNS = list(CampsiteDTO.model_fields)
+SORT_COLUMNS = [sort_by.value for sort_by in SortByEnum]
+# enum and boolean filters, answered from a bitmap index
+INDEXED_COLUMNS = [
+    name
+    for name, column in Campsite.__table__.c.items()
+    if name in CampsiteFilterDTO.model_fields
+    and issubclass(column.type.python_type, (bool, Enum))
+]
+# number of `__ct` matches kept per snapshot; substring search is the slowest
+# filter, and search boxes repeat the same strings
+CONTAINS_CACHE_SIZE = 256
+
+
+def _load_statement() -> Select:
+    table = Campsite.__table__
+    columns = [table.c[name] for name in ITEM_COLUMNS]
+    # ranks in postgres' sort order (collation, enum order, NULLs last), so that
+    # sorting in memory gives the same order as sorting in SQL
+    ranks = [
+        func.rank().over(order_by=table.c[name]).label(f"{name}_rank")
+        for name in SORT_COLUMNS
+    ]
+    lowered = [
+        func.lower(table.c[name]).label(f"{name}_lower") for name in SEARCH_COLUMNS
+    ]
+    return select(*columns, *lowered, *ranks)
+
+
+def _table_version_statement() -> Select:
+    return select(table_version(Campsite.__tablename__))
+
+
+def _plain(value: Any) -> Any:
+    return value.value if isinstance(value, Enum) else value
+
+
+class _Snapshot:
+    """
+    Columnar copy of the campsites table. Numeric columns are float arrays with
+    NaN for NULL, booleans are int8 arrays with -1 for NULL, and other columns
+    are string arrays (enum values) with a NULL mask. Enum and boolean filter
+    columns are also indexed by `bitmaps`.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        rows = [dict(row) for row in rows]
+        self.size = len(rows)
+        # items as `list()` returns them: dicts of the DTO's columns
+        self.items = [{name: row[name] for name in ITEM_COLUMNS} for row in rows]
+        self.columns: Dict[str, np.ndarray] = {}
+        self.nulls: Dict[str, np.ndarray] = {}
+        for name, column in Campsite.__table__.c.items():
+            if name not in ITEM_COLUMNS or name == "id":
+                continue
+            values = [row[name] for row in rows]
+            self.nulls[name] = np.array([value is None for value in values], bool)
+            python_type = column.type.python_type
+            if issubclass(python_type, bool):
+                self.columns[name] = np.array(
+                    [-1 if value is None else int(value) for value in values], np.int8
+                )
+            elif issubclass(python_type, (int, float)):
+                self.columns[name] = np.array(
+                    [np.nan if value is None else value for value in values],
+                    np.float64,
+                )
+            else:
+                self.columns[name] = np.array(
+                    ["" if value is None else _plain(value) for value in values], str
+                )
+
+        ids = [row["id"].int for row in rows]
+        self.id_high = np.array([i >> 64 for i in ids], np.uint64)
+        self.id_low = np.array([i & (2**64 - 1) for i in ids], np.uint64)
+        self.lat = np.radians(self.columns["lat"])
+        self.lon = np.radians(self.columns["lon"])
+        self.cos_lat = np.cos(self.lat)
+        self.lowered = {
+            name: np.array([row[f"{name}_lower"] or "" for row in rows], str)
+            for name in SEARCH_COLUMNS
+        }
+        self.ranks = {
+            name: np.array([row[f"{name}_rank"] for row in rows], np.int64)
+            for name in SORT_COLUMNS
+        }
+        self.bitmaps = BitmapIndex(
+            {name: [_plain(row[name]) for row in rows] for name in INDEXED_COLUMNS}
+        )
+        # ascending (sort value, id) order of each sort column; postgres
+        # compares uuids bytewise, i.e. as 128 bit unsigned integers
+        self.orders = {
+            name: np.lexsort((self.id_low, self.id_high, ranks))
+            for name, ranks in self.ranks.items()
+        }
+        self._contains: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+
+    def distances(self, lat: float, lon: float) -> np.ndarray:
+        """
+        Haversine distances in meters from a point to every campsite
+        """
+        lat, lon = np.radians(lat), np.radians(lon)
+        a = (
+            np.sin((self.lat - lat) / 2) ** 2
+            + np.cos(lat) * self.cos_lat * np.sin((self.lon - lon) / 2) ** 2
+        )
+        return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def within(self, distance: DistanceFilterDTO) -> np.ndarray:
+        meters = float(distance.value) * METERS_PER_UNIT[distance.units]
+        return self.distances(distance.lat, distance.lon) <= meters
+
+    def mask(self, filters: CampsiteFilterDTO) -> Optional[Tuple[np.ndarray, int]]:
+        """
+        Applies filters as `AbstractService.__filter` does: enum and boolean
+        filters by intersecting bitmaps, the others on the columns. Returns None
+        if any filter can't be answered from memory.
+
+        Returns:
+            mask (np.ndarray), count (int): matching rows, and how many there are
+        """
+        indexed, others = {}, {}
+        for name, value in filters.items():
+            if value is None or name in NON_FILTER_KEYS:
+                continue
+            if name in self.bitmaps.bitsets:
+                indexed[name] = (
+                    [_plain(v) for v in value] if isinstance(value, list) else value
+                )
+            else:
+                others[name] = value
+        bits = self.bitmaps.query(indexed)
+        mask = self.bitmaps.mask(bits)
+        if not others:
+            return mask, self.bitmaps.count(bits)
+
+        for name, value in others.items():
+            if name == "distance":
+                mask &= self.within(value)
+                continue
+            operator = name[-4:] if name[-4:] in ["__lt", "__gt", "__ct"] else None
+            column = name[:-4] if operator else name
+            if operator == "__ct" and column in self.lowered:
+                mask &= self.contains(column, value.lower())
+            elif operator in ["__lt", "__gt"] and column in self.columns:
+                values = self.columns[column]
+                if values.dtype.kind != "f":
+                    return None
+                mask &= values <= value if operator == "__lt" else values >= value
+            else:
+                return None
+        return mask, int(mask.sum())
+
+    def contains(self, column: str, value: str) -> np.ndarray:
+        """
+        Which non-null values of a search column contain a lowercase string
+        """
+        key = (column, value)
+        found = self._contains.get(key)
+        if found is None:
+            found = np.char.find(self.lowered[column], value) >= 0
+            found &= ~self.nulls[column]
+            self._contains[key] = found
+            if len(self._contains) > CONTAINS_CACHE_SIZE:
+                self._contains.popitem(last=False)
+        return found
+
+    def seek(
+        self, sort_by: str, ascending: bool, value: Any, last_id: uuid.UUID
+    ) -> Optional[np.ndarray]:
+        """
+        Keyset condition of a cursor, as `AbstractService.__seek` builds it.
+        Returns None if the cursor's sort value is not in the table, as its rank
+        is then unknown.
+        """
+        ranks, nulls = self.ranks[sort_by], self.nulls[sort_by]
+        if value is None:
+            # NULLs are peers, ranked after every value
+            candidates = np.flatnonzero(nulls)
+            rank = ranks[candidates[0]] if candidates.size else self.size + 1
+        else:
+            candidates = np.flatnonzero((self.columns[sort_by] == value) & ~nulls)
+            if not candidates.size:
+                return None
+            rank = ranks[candidates[0]]
+        high, low = np.uint64(last_id.int >> 64), np.uint64(last_id.int & (2**64 - 1))
+        if ascending:
+            after = (self.id_high > high) | (
+                (self.id_high == high) & (self.id_low > low)
+            )
+            return (ranks > rank) | ((ranks == rank) & after)
+        before = (self.id_high < high) | ((self.id_high == high) & (self.id_low < low))
+        return (ranks < rank) | ((ranks == rank) & before)
+
+
+class CampsitesEngine:
+    """
+    In-memory query engine over the whole campsites table, which is small enough
+    to hold as NumPy arrays in each API process. Answers `list()` and `nearest()`
+    like `AbstractService` does, result for result, with vectorised filters,
+    haversine distances, sorting and pagination, without querying postgres.
+
+    Sort order matches postgres' by loading each sort column's rank from
+    postgres. Distances are computed on the same sphere as PostGIS' geography
+    functions; campsites exactly on a distance filter's boundary may differ by
+    floating point rounding.
+
+    The table is loaded on first use. After that, at most every
+    `check_interval` seconds, `refresh()` compares the table's version in
+    `table_versions`, which a trigger bumps after every write to it from any
+    process, with the one seen at load time and reloads if it changed.
+    `invalidate()`, called after writes in this process, forces a reload on the
+    next `refresh()`.
+    """
+
+    def __init__(self, check_interval: float = 5.0):
+        self.check_interval = check_interval
+        self._snapshot: Optional[_Snapshot] = None
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        # created on first async refresh, as a lock is bound to the running loop
+        self._async_lock: Optional[asyncio.Lock] = None
+        self._async_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._version is not None
+
+    def invalidate(self) -> None:
+        """
+        Forces the table to reload on the next `refresh()`
+        """
+        self._checked_at = 0.0
+        self._version = None
+
+    def __checked_recently(self) -> bool:
+        return self.loaded and time.monotonic() - self._checked_at < self.check_interval
+
+    def refresh(self, session: Session) -> None:
+        """
+        Loads the table if it was never loaded or has changed since it was.
+        Checks for changes at most every `check_interval` seconds.
+
+        Parameters:
+            session (Session): session used to check for changes and load
+        """
+        if self.__checked_recently():
+            return
+        with self._lock:
+            if self.__checked_recently():
+                return
+            version = session.execute(_table_version_statement()).scalar() or 0
+            if version != self._version:
+                rows = session.execute(_load_statement()).mappings().all()
+                self._snapshot = _Snapshot(rows)
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    """
+    Async variant of `refresh()`.
+    """
+
+    async def arefresh(self, session: AsyncSession) -> None:
+        if self.__checked_recently():
+            return
+        loop = asyncio.get_running_loop()
+        if self._async_lock_loop is not loop:
+            self._async_lock, self._async_lock_loop = asyncio.Lock(), loop
+        async with self._async_lock:
+            if self.__checked_recently():
+                return
+            result = await session.execute(_table_version_statement())
+            version = result.scalar() or 0
+            if version != self._version:
+                rows = (await session.execute(_load_statement())).mappings().all()
+                # building the arrays and DTOs would block the event loop
+                self._snapshot = await asyncio.to_thread(_Snapshot, rows)
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    def list(self, filters: CampsiteFilterDTO) -> Optional[ListResult]:
+        """
+        `AbstractService.list()` from memory. Call `refresh()` first.
+
+        Returns:
+            result (ListResult | None): the same result as `list()`, or None if
+                the filters need postgres (estimated counts, or a cursor whose
+                sort value is not in the table)
+        """
+        snapshot = self._snapshot
+        limit, offset = filters["limit"], filters["offset"]
+        if snapshot is None or filters.get("count") == "estimate":
+            return None
+        if limit is None or limit < 1 or offset is None or offset < 0:
+            # leave invalid paging to postgres, so errors are the same
+            return None
+        selected = snapshot.mask(filters)
+        if selected is None:
+            return None
+        mask, count = selected
+        count_mode = filters.get("count") or "exact"
+        num_total_results = count if count_mode == "exact" else None
+
+        sort_by = _plain(filters["sort_by"])
+        ascending = filters["sort_dir"] == "asc"
+        order = snapshot.orders[sort_by]
+        if not ascending:
+            # (value, id) descending is exactly (value, id) ascending reversed
+            order = order[::-1]
+        if filters.get("cursor"):
+            value, last_id = decode_keyset_cursor(
+                filters["cursor"], filters["sort_by"], filters["sort_dir"]
+            )
+            seek = snapshot.seek(sort_by, ascending, value, last_id)
+            if seek is None:
+                return None
+            mask = mask & seek
+            offset = 0
+        positions = order[mask[order]][offset : offset + limit + 1]
+
+        items = [snapshot.items[i] for i in positions[:limit]]
+        has_more = len(positions) > limit
+        next_cursor = None
+        if has_more:
+            last = items[-1]
+            next_cursor = encode_cursor(
+                [
+                    filters["sort_by"],
+                    filters["sort_dir"],
+                    last[sort_by],
+                    str(last["id"]),
+                ]
+            )
+        if filters.get("fields"):
+            items = [project(item, filters["fields"]) for item in items]
+        return ListResult(items, num_total_results, count_mode, has_more, next_cursor)
+
+    def nearest(
+        self, lat: float, lon: float, k: int, filters: CampsiteFilterDTO
+    ) -> Optional[List[Tuple[Dict, float]]]:
+        """
+        `AbstractService.nearest()` from memory. Call `refresh()` first. Items
+        at the same distance may be in a different order than in postgres.
+
+        Returns:
+            result (List[Tuple[Dict, float]] | None): (item, distance in
+                meters) tuples, nearest first, or None if the filters need
+                postgres
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        selected = snapshot.mask(filters)
+        if selected is None:
+            return None
+        positions = np.flatnonzero(selected[0])
+        distances = snapshot.distances(lat, lon)[positions]
+        nearest = np.arange(len(positions))
+        if k < len(positions):
+            nearest = np.argpartition(distances, k)[:k]
+        nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+        return [(snapshot.items[positions[i]], float(distances[i])) for i in nearest]
+
+
+campsites_engine = CampsitesEngine(
+    check_interval=float(os.environ.get("CAMPSITES_MEMORY_ENGINE_CHECK_INTERVAL", 5))
+)
@@ -1,22 +1,408 @@
+import os
+from math import floor
+from typing import (
+    AsyncIterable,
+    Callable,
+    ClassVar,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
 from fastapi import Depends
+from sqlalchemy import Select, delete, func, insert, literal, select, text, true
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from campsites_api.dto.campsites import (
+    BoundingBoxDTO,
     CampsiteDTO,
     CampsiteFilterDTO,
     DistanceFilterDTO,
 )
-from campsites_api.services.abstract_service import AbstractService
-from campsites_db.models import Campsite
-from campsites_db.session import get_session
+from campsites_api.services.abstract_service import (
+    AbstractService,
+    ListResult,
+    has_filters,
+)
+from campsites_api.services.campsites_engine import (
+    CAMPSITES_MEMORY_ENGINE,
+    CampsitesEngine,
+    campsites_engine,
+)
+from campsites_api.utils.cache import TTLCache, canonical_key
+from campsites_db.ingest import IngestResult
+from campsites_db.models import (
+    CAMPSITE_NATURAL_KEY,
+    CLUSTER_MAX_ZOOM,
+    CLUSTERS_SOURCE_VERSION,
+    Campsite,
+    CampsiteCluster,
+    TableVersion,
+    cluster_cell,
+    cluster_cell_size,
+    table_version,
+)
+from campsites_db.session import get_async_session, get_session
+
+# decimal places kept from distance filter coordinates (about 11 m)
+COORDINATE_PRECISION = 4
+
+# cache of list results. Entries are only invalidated by writes made in the same
+# process, so other processes see changes once their entries expire
+list_cache = TTLCache(
+    "campsites_list",
+    maxsize=int(os.environ.get("CAMPSITES_LIST_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("CAMPSITES_LIST_CACHE_TTL", 300)),
+)
+
+
+def clusters_fresh_statement() -> Select:
+    """
+    Statement telling whether `campsite_clusters` was refreshed from the current
+    version of `campsites`, i.e. whether no write committed by any process since
+    """
+    return select(
+        table_version(Campsite.__tablename__) == table_version(CLUSTERS_SOURCE_VERSION)
+    )
 
 
 class CampsitesService(
     AbstractService[Campsite, CampsiteDTO, CampsiteFilterDTO, DistanceFilterDTO]
 ):
-    def __init__(self, session: Session):
-        super(CampsitesService, self).__init__(Campsite, session)
+    caches = [list_cache, campsites_engine]
+    # answers lists and nearest queries from memory when set; see CampsitesEngine
+    engine: ClassVar[Optional[CampsitesEngine]] = (
+        campsites_engine if CAMPSITES_MEMORY_ENGINE else None
+    )
+    # list items are built from plain rows, as responses only serialize them
+    row_columns = list(CampsiteDTO.model_fields)
+    tile_properties = ["id", "name", "campsite_type", "state"]
+    natural_key = CAMPSITE_NATURAL_KEY
+    # uploads are regional files, so only campsites in their states are pruned
+    prune_scope = "state"
+
+    def __init__(self, session: Session, async_session: AsyncSession = None):
+        super(CampsitesService, self).__init__(Campsite, session, async_session)
+
+    """
+    Function to normalize filters for caching. Distance filter coordinates are
+    rounded, both in the key and in the filters used for the query, so that a
+    cached result is exactly the result for its key.
+
+    Parameters:
+        filters (CampsiteFilterDTO): object with filters to apply
+
+    Returns:
+        filters (CampsiteFilterDTO), key (Hashable): rounded filters and their
+            cache key
+    """
+
+    def __cache_key(self, filters: CampsiteFilterDTO) -> Tuple[Dict, Hashable]:
+        distance = filters.get("distance")
+        if distance is not None:
+            distance = distance.model_copy(
+                update={
+                    "lat": round(distance.lat, COORDINATE_PRECISION),
+                    "lon": round(distance.lon, COORDINATE_PRECISION),
+                }
+            )
+            filters = {**filters, "distance": distance}
+        return filters, canonical_key(filters)
+
+    """
+    Cached `list()`. Items are dicts of column values, built from plain rows, so
+    cached results don't hold on to ORM objects and are never validated.
+
+    With the in-memory `engine`, lists are answered by it instead, unless it
+    needs postgres for the filters.
+    """
+
+    def list(self, filters: CampsiteFilterDTO) -> ListResult:
+        filters, key = self.__cache_key(filters)
+        if self.engine is not None:
+            self.engine.refresh(self.session)
+            result = self.engine.list(filters)
+            if result is not None:
+                return result
+        hit, result = list_cache.get(key)
+        if not hit:
+            result = super(CampsitesService, self).list(filters)
+            list_cache.set(key, result)
+        return result
+
+    """
+    Cached `alist()`.
+    """
+
+    async def alist(self, filters: CampsiteFilterDTO) -> ListResult:
+        filters, key = self.__cache_key(filters)
+        if self.engine is not None:
+            await self.engine.arefresh(self.async_session)
+            result = self.engine.list(filters)
+            if result is not None:
+                return result
+        hit, result = list_cache.get(key)
+        if not hit:
+            result = await super(CampsitesService, self).alist(filters)
+            list_cache.set(key, result)
+        return result
+
+    """
+    `nearest()`, answered by the in-memory `engine` if set.
+    """
+
+    def nearest(
+        self, lat: float, lon: float, k: int, filters: CampsiteFilterDTO
+    ) -> List[Tuple[Union[Campsite, Dict], float]]:
+        if self.engine is not None:
+            self.engine.refresh(self.session)
+            result = self.engine.nearest(lat, lon, k, filters)
+            if result is not None:
+                return result
+        return super(CampsitesService, self).nearest(lat, lon, k, filters)
+
+    """
+    Async variant of `nearest()`.
+    """
+
+    async def anearest(
+        self, lat: float, lon: float, k: int, filters: CampsiteFilterDTO
+    ) -> List[Tuple[Union[Campsite, Dict], float]]:
+        if self.engine is not None:
+            await self.engine.arefresh(self.async_session)
+            result = self.engine.nearest(lat, lon, k, filters)
+            if result is not None:
+                return result
+        return await super(CampsitesService, self).anearest(lat, lon, k, filters)
+
+    """
+    Bulk create followed by a refresh of the precomputed clusters.
+    """
+
+    def bulk_create(
+        self,
+        items: Iterable[CampsiteDTO],
+        update: bool = False,
+        prune: bool = False,
+        check: Optional[Callable[[], None]] = None,
+    ) -> IngestResult:
+        result = super(CampsitesService, self).bulk_create(items, update, prune, check)
+        self.refresh_clusters()
+        return result
+
+    """
+    Async variant of `bulk_create()`.
+    """
+
+    async def abulk_create(
+        self,
+        items: Union[Iterable[CampsiteDTO], AsyncIterable[CampsiteDTO]],
+        update: bool = False,
+        prune: bool = False,
+        check: Optional[Callable[[], None]] = None,
+    ) -> IngestResult:
+        result = await super(CampsitesService, self).abulk_create(
+            items, update, prune, check
+        )
+        await self.arefresh_clusters()
+        return result
+
+    """
+    Function to group the campsites in a bounding box into grid cells for a zoom
+    level, returning the centroid and number of campsites of each cell. Cells are
+    included whole, even where they extend past the bounding box, so results do
+    not depend on how the map is panned.
+
+    Without filters, and up to `CLUSTER_MAX_ZOOM`, clusters are read from the
+    precomputed `campsite_clusters` table, so a continent-level view is a small
+    primary key range scan. That table is only used if no write to `campsites`
+    was committed, by any process, since it was last refreshed; this is checked
+    against the versions in `table_versions`. Otherwise clusters are grouped from
+    the campsites in the box, with all filters applied as in `list()`.
+
+    Parameters:
+        bbox (BoundingBoxDTO): bounding box, in degrees
+        zoom (int): map zoom level
+        filters (CampsiteFilterDTO): object with filters to apply
+
+    Returns:
+        clusters (List[Row]): (lat, lon, count) rows
+    """
+
+    def clusters(
+        self, bbox: BoundingBoxDTO, zoom: int, filters: CampsiteFilterDTO
+    ) -> List:
+        try:
+            precomputed = self.__uses_precomputed_clusters(zoom, filters) and (
+                self.session.execute(clusters_fresh_statement()).scalar()
+            )
+            return self.session.execute(
+                self.__clusters_statement(bbox, zoom, filters, precomputed)
+            ).all()
+        except Exception as e:
+            self.session.rollback()
+            raise e
+
+    """
+    Async variant of `clusters()`.
+    """
+
+    async def aclusters(
+        self, bbox: BoundingBoxDTO, zoom: int, filters: CampsiteFilterDTO
+    ) -> List:
+        try:
+            precomputed = (
+                self.__uses_precomputed_clusters(zoom, filters)
+                and (
+                    await self.async_session.execute(clusters_fresh_statement())
+                ).scalar()
+            )
+            result = await self.async_session.execute(
+                self.__clusters_statement(bbox, zoom, filters, precomputed)
+            )
+            return result.all()
+        except Exception as e:
+            await self.async_session.rollback()
+            raise e
+
+    def __uses_precomputed_clusters(
+        self, zoom: int, filters: CampsiteFilterDTO
+    ) -> bool:
+        return zoom <= CLUSTER_MAX_ZOOM and not has_filters(filters)
+
+    """
+    Function to build the statement used by `clusters()` and `aclusters()`.
+    Clusters are read from `campsite_clusters` if `precomputed`, and computed
+    from `campsites` otherwise.
+    """
+
+    def __clusters_statement(
+        self,
+        bbox: BoundingBoxDTO,
+        zoom: int,
+        filters: CampsiteFilterDTO,
+        precomputed: bool,
+    ) -> Select:
+        # cell indexes are computed the same way in python and in SQL
+        size = cluster_cell_size(zoom)
+        min_x, min_y = floor(bbox.min_lon / size), floor(bbox.min_lat / size)
+        max_x, max_y = floor(bbox.max_lon / size), floor(bbox.max_lat / size)
+        if precomputed:
+            return (
+                select(CampsiteCluster.lat, CampsiteCluster.lon, CampsiteCluster.count)
+                .filter(
+                    CampsiteCluster.zoom == zoom,
+                    CampsiteCluster.cell_x.between(min_x, max_x),
+                    CampsiteCluster.cell_y.between(min_y, max_y),
+                )
+                .order_by(CampsiteCluster.cell_y, CampsiteCluster.cell_x)
+            )
+
+        cell_x, cell_y = cluster_cell(zoom, Campsite.lon, Campsite.lat)
+        # the bounding box grown to whole cells, matched against the geo index
+        envelope = func.ST_MakeEnvelope(
+            min_x * size, min_y * size, (max_x + 1) * size, (max_y + 1) * size, 4326
+        )
+        query = select(
+            func.avg(Campsite.lat).label("lat"),
+            func.avg(Campsite.lon).label("lon"),
+            func.count().label("count"),
+        ).filter(
+            Campsite.geo.op("&&")(envelope),
+            cell_x.between(min_x, max_x),
+            cell_y.between(min_y, max_y),
+        )
+        query = self.apply_filters(query, filters)
+        return query.group_by(cell_x, cell_y).order_by(cell_y, cell_x)
+
+    """
+    Function to rebuild the precomputed `campsite_clusters` table from `campsites`,
+    for every zoom level up to `CLUSTER_MAX_ZOOM`.
+    """
+
+    def refresh_clusters(self) -> None:
+        try:
+            for statement in self.__refresh_clusters_statements():
+                self.session.execute(statement)
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            raise e
+
+    """
+    Async variant of `refresh_clusters()`.
+    """
+
+    async def arefresh_clusters(self) -> None:
+        try:
+            for statement in self.__refresh_clusters_statements():
+                await self.async_session.execute(statement)
+            await self.async_session.commit()
+        except Exception as e:
+            await self.async_session.rollback()
+            raise e
+
+    """
+    Function to build the statements used by `refresh_clusters()` and
+    `arefresh_clusters()`, run in one transaction. The campsites version is
+    recorded before the clusters are computed, so a write committed in between
+    leaves the clusters stale rather than fresh with missing data.
+    """
+
+    def __refresh_clusters_statements(self) -> List:
+        zooms = func.generate_series(0, CLUSTER_MAX_ZOOM).table_valued("zoom")
+        cell_x, cell_y = cluster_cell(zooms.c.zoom, Campsite.lon, Campsite.lat)
+        cells = (
+            select(
+                zooms.c.zoom,
+                cell_x.label("cell_x"),
+                cell_y.label("cell_y"),
+                Campsite.lat,
+                Campsite.lon,
+            )
+            .join_from(Campsite, zooms, true())
+            .subquery("cells")
+        )
+        clusters = select(
+            cells.c.zoom,
+            cells.c.cell_x,
+            cells.c.cell_y,
+            func.avg(cells.c.lat),
+            func.avg(cells.c.lon),
+            func.count(),
+        ).group_by(cells.c.zoom, cells.c.cell_x, cells.c.cell_y)
+        record_version = pg_insert(TableVersion).from_select(
+            ["table_name", "version"],
+            select(
+                literal(CLUSTERS_SOURCE_VERSION),
+                table_version(Campsite.__tablename__),
+            ),
+        )
+        return [
+            # serializes concurrent refreshes, without blocking readers
+            text(f"LOCK TABLE {CampsiteCluster.__tablename__} IN EXCLUSIVE MODE"),
+            record_version.on_conflict_do_update(
+                index_elements=[TableVersion.table_name],
+                set_={
+                    "version": record_version.excluded.version,
+                    "changed_at": func.now(),
+                },
+            ),
+            delete(CampsiteCluster),
+            insert(CampsiteCluster).from_select(
+                ["zoom", "cell_x", "cell_y", "lat", "lon", "count"], clusters
+            ),
+        ]
 
 
-def get_campsites_service(session: Session = Depends(get_session)) -> CampsitesService:
-    return CampsitesService(session)
+def get_campsites_service(
+    session: Session = Depends(get_session),
+    async_session: AsyncSession = Depends(get_async_session),
+) -> CampsitesService:
+    return CampsitesService(session, async_session)
@@ -0,0 +1,207 @@
+import asyncio
+import re
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from unidecode import unidecode
+
+from campsites_db.models import GeographicalName, table_version
+
+
+class PlaceSuggestion(NamedTuple):
+    id: str
+    name: str
+    state_province: str
+    country: str
+    lat: float
+    lon: float
+    priority_order: int
+
+
+def normalize(value: str) -> str:
+    """
+    Normalizes a search string for prefix matching: transliterated to ASCII,
+    lowercased, with runs of whitespace collapsed to a single space
+    """
+    return re.sub(r"\s+", " ", unidecode(value).lower()).strip()
+
+
+class _Bucket:
+    """
+    Sorted prefix keys for the places sharing one priority_order. Every word in a
+    place's search string starts a key, so "york" finds "new york".
+    """
+
+    def __init__(self, keys: List[Tuple[str, int]]):
+        keys.sort()
+        self.keys = [key for key, _ in keys]
+        self.positions = [position for _, position in keys]
+
+
+class PlaceAutocompleteIndex:
+    """
+    In-process prefix index over `GeographicalName.search_str`, serving typeahead
+    without querying postgres for every keystroke.
+
+    Places are grouped into buckets by priority_order, each holding a sorted array
+    of prefix keys, so a lookup bisects the buckets in priority order and stops as
+    soon as enough suggestions are found.
+
+    The index is loaded on first use. After that, at most every `check_interval`
+    seconds, `refresh()` compares the table's version in `table_versions`, which
+    every write to it bumps, with the one seen at load time and reloads if it
+    changed. `invalidate()` forces a reload on the next `refresh()`.
+    """
+
+    def __init__(self, check_interval: float = 60.0):
+        self.check_interval = check_interval
+        self._places: List[PlaceSuggestion] = []
+        self._buckets: List[_Bucket] = []
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        # created on first refresh, as a lock is bound to the running event loop
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._version is not None
+
+    def build(self, places: Iterable[Tuple[str, PlaceSuggestion]]) -> None:
+        """
+        Builds the index from (search_str, place) pairs, replacing its contents
+
+        Parameters:
+            places (Iterable[Tuple[str, PlaceSuggestion]]): places to index
+        """
+        suggestions: List[PlaceSuggestion] = []
+        keys_by_priority: Dict[int, List[Tuple[str, int]]] = {}
+        for search_str, place in places:
+            position = len(suggestions)
+            suggestions.append(place)
+            keys = keys_by_priority.setdefault(place.priority_order, [])
+            words = normalize(search_str).split(" ")
+            for i in range(len(words)):
+                keys.append((" ".join(words[i:]), position))
+        # swap in whole, so concurrent searches see either the old or new index
+        self._places, self._buckets = (
+            suggestions,
+            [
+                _Bucket(keys_by_priority[priority])
+                for priority in sorted(keys_by_priority)
+            ],
+        )
+
+    def search(
+        self,
+        q: str,
+        limit: int = 10,
+        state_province: Optional[List[str]] = None,
+        country: Optional[str] = None,
+    ) -> List[PlaceSuggestion]:
+        """
+        Finds places with a word in their search string starting with `q`, ordered
+        by priority_order, then alphabetically by the search string from the
+        matching word on
+
+        Parameters:
+            q (str): prefix to search for
+            limit (int): maximum number of suggestions to return
+            state_province (List[str] | None): only return places in these
+                states/provinces
+            country (str | None): only return places in this country
+
+        Returns:
+            suggestions (List[PlaceSuggestion]): matching places
+        """
+        prefix = normalize(q)
+        if not prefix:
+            return []
+        states = set(state_province) if state_province else None
+        places, buckets = self._places, self._buckets
+
+        found: List[PlaceSuggestion] = []
+        seen = set()
+        for bucket in buckets:
+            # matching keys are a contiguous, alphabetically sorted run
+            i = bisect_left(bucket.keys, prefix)
+            while i < len(bucket.keys) and bucket.keys[i].startswith(prefix):
+                position = bucket.positions[i]
+                i += 1
+                place = places[position]
+                if position in seen:
+                    continue
+                if states is not None and place.state_province not in states:
+                    continue
+                if country is not None and place.country != country:
+                    continue
+                seen.add(position)
+                found.append(place)
+                if len(found) >= limit:
+                    return found
+        return found
+
+    def invalidate(self) -> None:
+        """
+        Forces the index to reload on the next `refresh()`
+        """
+        self._checked_at = 0.0
+        self._version = None
+
+    async def refresh(self, session: AsyncSession) -> None:
+        """
+        Loads the index if it was never loaded or the table has changed since it
+        was. Checks for changes at most every `check_interval` seconds.
+
+        Parameters:
+            session (AsyncSession): session used to check for changes and load
+        """
+        if self.loaded and time.monotonic() - self._checked_at < self.check_interval:
+            return
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        async with self._lock:
+            if (
+                self.loaded
+                and time.monotonic() - self._checked_at < self.check_interval
+            ):
+                # refreshed by another request while waiting for the lock
+                return
+            version = await self._table_version(session)
+            if version != self._version:
+                result = await session.execute(
+                    select(
+                        GeographicalName.search_str,
+                        GeographicalName.id,
+                        GeographicalName.name,
+                        GeographicalName.state_province,
+                        GeographicalName.country,
+                        GeographicalName.lat,
+                        GeographicalName.lon,
+                        GeographicalName.priority_order,
+                    )
+                )
+                rows = [
+                    (row[0], PlaceSuggestion(str(row[1]), *row[2:])) for row in result
+                ]
+                # sorting millions of keys would block the event loop
+                await asyncio.to_thread(self.build, rows)
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    async def _table_version(self, session: AsyncSession) -> int:
+        result = await session.execute(
+            select(table_version(GeographicalName.__tablename__))
+        )
+        return result.scalar() or 0
+
+
+place_autocomplete_index = PlaceAutocompleteIndex()
+
+
+def get_place_autocomplete_index() -> PlaceAutocompleteIndex:
+    return place_autocomplete_index
@@ -1,17 +1,27 @@
+import os
 from typing import Optional
 from fastapi import Depends, HTTPException
 from pydantic import UUID4
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from campsites_api.dto.places import PlaceDTO, PlaceFilterDTO
 from campsites_api.services.abstract_service import AbstractService
+from campsites_api.services.place_autocomplete import place_autocomplete_index
 from campsites_db.models import GeographicalName
-from campsites_db.session import get_session
+from campsites_db.session import get_async_session, get_session
 
 
 class PlacesService(AbstractService[GeographicalName, PlaceDTO, PlaceFilterDTO, None]):
-    def __init__(self, session: Session):
-        super(PlacesService, self).__init__(GeographicalName, session)
+    tile_properties = ["id", "name", "generic_term", "priority_order"]
+    # there are millions of places, so low zoom tiles only keep the highest
+    # priority ones (sorted by priority_order by default)
+    tile_limit = int(os.environ.get("PLACES_TILE_MAX_FEATURES", 4096))
+    # uploads reload the autocomplete index without waiting for table stats
+    caches = [place_autocomplete_index]
+
+    def __init__(self, session: Session, async_session: AsyncSession = None):
+        super(PlacesService, self).__init__(GeographicalName, session, async_session)
 
     def get(self, id: UUID4) -> GeographicalName:
         item: Optional[GeographicalName] = (
@@ -23,5 +33,8 @@ class PlacesService(AbstractService[GeographicalName, PlaceDTO, PlaceFilterDTO,
         return item
 
 
-def get_places_service(session: Session = Depends(get_session)) -> PlacesService:
-    return PlacesService(session)
+def get_places_service(
+    session: Session = Depends(get_session),
+    async_session: AsyncSession = Depends(get_async_session),
+) -> PlacesService:
+    return PlacesService(session, async_session)
@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from fastapi import HTTPException
+
+from campsites_api.dto.campsites import (
+    IngestResultDTO,
+    UploadJobDTO,
+    UploadJobStateEnum,
+)
+from campsites_api.utils.process_data import RowErrors
+
+logger = logging.getLogger(__name__)
+
+# number of uploads processed at the same time; more are queued
+UPLOAD_JOB_WORKERS = int(os.environ.get("UPLOAD_JOB_WORKERS", 2))
+# number of finished jobs kept for polling; the oldest are forgotten first
+UPLOAD_JOBS_KEPT = int(os.environ.get("UPLOAD_JOBS_KEPT", 100))
+
+
+class UploadJob:
+    """
+    State and progress of an upload processed in the background
+    """
+
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+        self.state = UploadJobStateEnum.queued
+        self.rows_processed = 0
+        self.errors = RowErrors()
+        self.result: Optional[IngestResultDTO] = None
+        self.detail: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in [UploadJobStateEnum.succeeded, UploadJobStateEnum.failed]
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return self.rows_processed / elapsed if elapsed else 0.0
+
+    def track(self, batches: Iterable[List]) -> Iterator:
+        """
+        Iterates the items of a batch pipeline, counting them as processed
+        """
+        for batch in batches:
+            self.rows_processed += len(batch)
+            yield from batch
+
+    def dto(self) -> UploadJobDTO:
+        return UploadJobDTO(
+            job_id=self.id,
+            state=self.state,
+            rows_processed=self.rows_processed,
+            rows_per_second=self.rows_per_second,
+            num_errors=self.errors.count,
+            errors=[error._asdict() for error in self.errors.errors],
+            result=self.result,
+            detail=self.detail,
+        )
+
+
+class UploadJobs:
+    """
+    Registry of upload jobs, run by a pool of worker threads so that requests
+    return as soon as an upload is accepted. Jobs only live in this process;
+    the most recent `kept` finished jobs can be polled.
+    """
+
+    def __init__(self, workers: int = UPLOAD_JOB_WORKERS, kept: int = UPLOAD_JOBS_KEPT):
+        self.workers = workers
+        self.kept = kept
+        self._jobs: "OrderedDict[str, UploadJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        # created on first use, so importing the app starts no threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def submit(self, process: Callable[[UploadJob], IngestResultDTO]) -> UploadJob:
+        """
+        Queues an upload
+
+        Parameters:
+            process (Callable[[UploadJob], IngestResultDTO]): processes the
+                upload, updating the job's progress and errors, and returns
+                its result. A raised HTTPException's detail fails the job.
+
+        Returns:
+            job (UploadJob): the queued job
+        """
+        job = UploadJob()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="upload-job"
+                )
+            self._jobs[job.id] = job
+            self._forget_finished()
+            self._executor.submit(self._run, job, process)
+        return job
+
+    def get(self, job_id: str) -> Optional[UploadJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: UploadJob, process: Callable[[UploadJob], IngestResultDTO]):
+        job.started_at = time.perf_counter()
+        job.state = UploadJobStateEnum.running
+        try:
+            job.result = process(job)
+            state = UploadJobStateEnum.succeeded
+        except HTTPException as e:
+            detail = e.detail
+            job.detail = detail["message"] if isinstance(detail, dict) else detail
+            state = UploadJobStateEnum.failed
+        except Exception:
+            logger.exception("Upload job %s failed", job.id)
+            job.detail = "Upload could not be processed."
+            state = UploadJobStateEnum.failed
+        job.finished_at = time.perf_counter()
+        job.state = state
+
+    def _forget_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(len(finished) - self.kept, 0)]:
+            del self._jobs[job_id]
+
+
+upload_jobs = UploadJobs()
+
+
+def get_upload_jobs() -> UploadJobs:
+    return upload_jobs
@@ -1,3 +1,38 @@
 def test_health(test_client):
     response = test_client.get("/health")
     assert response.status_code == 200, "Problem with app or test client"
+
+
+def test_pool_stats(test_client):
+    response = test_client.get("/health/pool")
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data) == {"sync", "async"}
+    for stats in data.values():
+        assert stats["checkout_failures"] >= 0
+        assert "checked_out" in stats
+
+
+def test_metrics(test_client):
+    test_client.get("/health")
+    response = test_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "server-timing" in response.headers
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="/health",status="200"}'
+        in response.text
+    )
+    assert "# TYPE cache_hit_ratio gauge" in response.text
+    assert 'db_pool_checkouts_total{engine="async"}' in response.text
+
+
+def test_list_campsites_documented(test_client):
+    response = test_client.get("/openapi.json")
+    assert response.status_code == 200
+    content = response.json()["paths"]["/campsites"]["get"]["responses"]["200"][
+        "content"
+    ]
+    assert content["application/json"]["schema"] == {
+        "$ref": "#/components/schemas/CampsiteListDTO"
+    }
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from campsites_api.services.bitmap_index import BitmapIndex
+
+# 10 rows, so that bitsets span a partial byte
+STATES = ["CA", "OR", "CA", None, "WA", "CA", "OR", None, "CA", "WA"]
+SHOWERS = [True, False, None, True, True, False, True, None, True, False]
+
+
+@pytest.fixture
+def index() -> BitmapIndex:
+    return BitmapIndex({"state": STATES, "has_showers": SHOWERS})
+
+
+def positions(index: BitmapIndex, bits: np.ndarray) -> list:
+    return np.flatnonzero(index.mask(bits)).tolist()
+
+
+def expected(**filters) -> list:
+    return [
+        i
+        for i, (state, showers) in enumerate(zip(STATES, SHOWERS))
+        if ("state" not in filters or state in filters["state"])
+        and ("has_showers" not in filters or showers is filters["has_showers"])
+    ]
+
+
+class TestBitmapIndex:
+    @pytest.mark.parametrize(
+        "filters",
+        [
+            {},
+            {"state": ["CA"]},
+            {"state": ["CA", "WA"]},
+            {"has_showers": True},
+            {"has_showers": False},
+            {"state": ["OR", "WA"], "has_showers": True},
+            {"state": ["CA"], "has_showers": False},
+        ],
+    )
+    def test_query(self, index, filters):
+        bits = index.query(filters)
+
+        assert positions(index, bits) == expected(**filters)
+        assert index.count(bits) == len(expected(**filters))
+        assert index.mask(bits).tolist() == [
+            i in expected(**filters) for i in range(len(STATES))
+        ]
+
+    def test_nulls_match_no_value(self, index):
+        bits = index.query({"state": ["CA", "OR", "WA"], "has_showers": False})
+
+        assert 3 not in positions(index, bits)
+        assert 7 not in positions(index, bits)
+        assert index.count(index.query({"has_showers": None})) == len(SHOWERS)
+
+    def test_unknown_values_and_columns(self, index):
+        assert index.count(index.query({"state": ["NV"]})) == 0
+        assert index.count(index.query({"state": ["NV", "WA"]})) == 2
+        assert index.count(index.query({"elevation_ft": 100})) == len(STATES)
+
+    def test_query_does_not_change_bitsets(self, index):
+        before = index.count(index.query({"state": ["CA"]}))
+        index.query({"state": ["CA"], "has_showers": False})
+
+        assert index.count(index.query({"state": ["CA"]})) == before
+
+    def test_columns_of_different_lengths(self):
+        with pytest.raises(ValueError):
+            BitmapIndex({"state": ["CA"], "has_showers": [True, False]})
@@ -0,0 +1,55 @@
+import time
+
+from campsites_api.dto.campsites import DistanceFilterDTO
+from campsites_api.utils.cache import TTLCache, canonical_key
+
+
+class TestTTLCache:
+    def test_get_set(self):
+        cache = TTLCache("test_get_set")
+        assert cache.get("foo") == (False, None)
+
+        cache.set("foo", 1)
+        assert cache.get("foo") == (True, 1)
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.5
+
+    def test_lru_eviction(self):
+        cache = TTLCache("test_lru_eviction", maxsize=2)
+        cache.set("foo", 1)
+        cache.set("bar", 2)
+        # foo is now the most recently used
+        cache.get("foo")
+        cache.set("baz", 3)
+
+        assert cache.get("bar") == (False, None)
+        assert cache.get("foo") == (True, 1)
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiry(self):
+        cache = TTLCache("test_ttl_expiry", ttl=0.01)
+        cache.set("foo", 1)
+        time.sleep(0.02)
+
+        assert cache.get("foo") == (False, None)
+
+    def test_invalidate(self):
+        cache = TTLCache("test_invalidate")
+        cache.set("foo", 1)
+        cache.invalidate()
+
+        assert cache.get("foo") == (False, None)
+        assert cache.stats()["size"] == 0
+
+
+class TestCanonicalKey:
+    def test_equivalent_filters(self):
+        distance = DistanceFilterDTO(value=5, units="mi", lat=1.0, lon=2.0)
+        a = {"state": ["MA", "CT"], "name__ct": None, "distance": distance}
+        b = {"distance": distance, "state": ["CT", "MA"]}
+
+        assert canonical_key(a) == canonical_key(b)
+        assert canonical_key(a) != canonical_key({"state": ["CT"]})
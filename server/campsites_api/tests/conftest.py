@@ -1,17 +1,29 @@
-import warnings
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import OperationalError as SQLAlchemyOperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool, StaticPool
 from sqlalchemy.orm.session import close_all_sessions
 from sqlalchemy_utils import create_database, drop_database, database_exists
 
 from campsites_db.models import Base
-from campsites_db.session import get_session
+from campsites_db.session import (
+    get_async_session,
+    get_async_session_factory,
+    get_session,
+    get_session_factory,
+    to_async_uri,
+)
 
 from campsites_api.app import create_app
+from campsites_api.services.upload_jobs import UploadJobs, get_upload_jobs
+from campsites_api.utils.cache import caches
+from campsites_api.services.place_autocomplete import (
+    PlaceAutocompleteIndex,
+    get_place_autocomplete_index,
+)
 from server.campsites_api.services.campsites_service import get_campsites_service
 from server.campsites_api.services.places_service import get_places_service
 from campsites_api.tests.factories import (
@@ -77,6 +89,8 @@ def db_session(db_url):
     with engine.connect() as connection:
         # install PostGIS extension
         connection.execute(text("CREATE EXTENSION IF NOT EXISTS postgis;"))
+        # install pg_trgm extension, for the trigram indexes
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
         connection.commit()
 
     # Create a sessionmaker to manage sessions
@@ -86,19 +100,23 @@ def db_session(db_url):
 
     # Create tables in the database
     Base.metadata.create_all(bind=engine)
-    connection = engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
+    session = TestingSessionLocal()
     yield session
     session.close()
-    with warnings.catch_warnings():
-        # session might have already been rolled back, such as in case of 404.
-        # we don't need to care about this specific warning when running tests.
-        warnings.filterwarnings(
-            "ignore", message="transaction already deassociated from connection"
-        )
-        transaction.rollback()
-    connection.close()
+    # the app commits through its own async session, so a wrapping transaction
+    # can't be rolled back to isolate tests; empty the tables instead
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+    engine.dispose()
+
+
+@pytest.fixture(scope="function")
+def async_session_factory(db_url):
+    # NullPool, as connections can't be shared between the event loops of
+    # different test clients
+    engine = create_async_engine(to_async_uri(db_url), poolclass=NullPool)
+    yield async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
 
 @pytest.fixture(scope="function")
@@ -119,7 +137,7 @@ def geographical_name_factory(db_session):
 
 
 @pytest.fixture(scope="function")
-def test_client(db_session):
+def test_client(db_session, async_session_factory):
     """Create a test client that uses the override_get_db fixture to return a session."""
 
     def override_get_db():
@@ -128,6 +146,10 @@ def test_client(db_session):
         finally:
             db_session.close()
 
+    async def override_get_async_db():
+        async with async_session_factory() as session:
+            yield session
+
     # I'm not sure why these dependencies need to be overwritten but it doesn't work without it
     def override_campsites_service(_):
         yield get_campsites_service
@@ -138,6 +160,24 @@ def test_client(db_session):
     app = create_app()
 
     app.dependency_overrides[get_session] = override_get_db
+    app.dependency_overrides[get_async_session] = override_get_async_db
+    # upload jobs open their own sessions, on the test database
+    app.dependency_overrides[get_session_factory] = lambda: sessionmaker(
+        autocommit=False, autoflush=False, bind=db_session.get_bind()
+    )
+    # exports stream with their own sessions, on the test database
+    app.dependency_overrides[get_async_session_factory] = lambda: (
+        async_session_factory
+    )
+    upload_jobs = UploadJobs()
+    app.dependency_overrides[get_upload_jobs] = lambda: upload_jobs
+    # in-process caches and indexes would otherwise outlive each test's data
+    for cache in caches.values():
+        cache.invalidate()
+    autocomplete_index = PlaceAutocompleteIndex()
+    app.dependency_overrides[get_place_autocomplete_index] = lambda: (
+        autocomplete_index
+    )
     app.dependency_overrides[get_campsites_service] = override_campsites_service
     app.dependency_overrides[get_places_service] = override_places_service
 
@@ -50,3 +50,9 @@ example_csv_content = """lon,lat,composite,code,name,type,phone,dates_open,comme
 example_incorrect_csv_content = """lon,lat,composite,code,name,type,phone,dates_open,comments,num_campsites,elevation_ft,amenities,state,nearest_town_distance,nearest_town_bearing,nearest_town
 -73.098,41.651,,,,,,,,,,,,,,
 """
+
+example_places_csv_content = """govt_id,name,generic_category,generic_term,county,state_province,lat,lon
+617565,Boston,Populated Place,City,Suffolk,MA,42.3584,-71.0598
+618274,Blue Hills Reservation,Park,Park,Norfolk,MA,42.2115,-71.0881
+FDHJK,Montréal,Populated Place,City,,QC,45.5088,-73.5878
+"""
@@ -0,0 +1,71 @@
+from typing import NamedTuple
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from campsites_api.utils import debug
+from campsites_api.utils.debug import SlowPlanLog, explain_requested
+
+
+class Plan(NamedTuple):
+    statement: str
+    execution_ms: float
+
+
+class TestSlowPlanLog:
+    def test_threshold(self):
+        log = SlowPlanLog(threshold_ms=10, sample_rate=0, maxsize=2)
+
+        assert not log.record("/a", {"state": ["CA"]}, [Plan("page", 9.5)])
+        assert log.record(
+            "/a",
+            {"state": ["CA"], "name__ct": None},
+            [Plan("count", 4), Plan("page", 6)],
+        )
+        assert log.record("/b", {}, [Plan("page", 20)])
+        assert log.record("/c", {}, [Plan("page", 30)])
+
+        entries = log.entries()
+        assert [entry["route"] for entry in entries] == ["/c", "/b"]
+        assert entries[0]["execution_ms"] == 30
+        assert entries[0]["statements"] == [{"statement": "page", "execution_ms": 30}]
+
+    def test_filters_without_none(self):
+        log = SlowPlanLog(threshold_ms=0, sample_rate=0)
+        log.record("/a", {"state": ["CA"], "name__ct": None}, [Plan("page", 1)])
+
+        assert log.entries()[0]["filters"] == {"state": ["CA"]}
+
+    def test_sample(self):
+        assert not SlowPlanLog(threshold_ms=0, sample_rate=0).sample()
+        assert SlowPlanLog(threshold_ms=0, sample_rate=1).sample()
+
+
+class TestExplainRequested:
+    def client(self):
+        app = FastAPI()
+
+        @app.get("/")
+        def root(explain: bool = Depends(explain_requested)) -> bool:
+            return explain
+
+        return TestClient(app)
+
+    def test_disabled_without_admin_token(self, monkeypatch):
+        monkeypatch.setattr(debug, "ADMIN_TOKEN", None)
+        client = self.client()
+
+        assert client.get("/").json() is False
+        response = client.get("/?explain=true", headers={"X-Admin-Token": ""})
+        assert response.status_code == 403
+
+    def test_flag_or_header(self, monkeypatch):
+        monkeypatch.setattr(debug, "ADMIN_TOKEN", "secret")
+        client = self.client()
+        admin = {"X-Admin-Token": "secret"}
+
+        assert client.get("/", headers=admin).json() is False
+        assert client.get("/?explain=true", headers=admin).json() is True
+        assert client.get("/", headers={**admin, "X-Explain": "1"}).json() is True
+        response = client.get("/", headers={"X-Explain": "1", "X-Admin-Token": "no"})
+        assert response.status_code == 403
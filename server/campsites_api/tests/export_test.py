@@ -0,0 +1,83 @@
+import asyncio
+import csv
+import io
+import json
+import uuid
+from typing import AsyncIterator, Dict, List
+
+from campsites_api.dto.campsites import ExportFormatEnum
+from campsites_api.utils.export import encode_export
+from campsites_db.models import CampsiteStateEnum
+
+ID = uuid.UUID("0b5f3c1e-8d3a-4c3b-9a59-2f0c6b3f1a10")
+ROWS = [
+    {
+        "id": ID,
+        "name": "Lac Écho",
+        "state": CampsiteStateEnum.QC,
+        "lat": 46.0,
+        "lon": -74.5,
+    },
+    {
+        "id": ID,
+        "name": 'a, "b"',
+        "state": CampsiteStateEnum.CA,
+        "lat": 38.0,
+        "lon": -120.0,
+    },
+]
+
+
+def export(
+    batches: List[List[Dict]], fields: List[str], format: ExportFormatEnum
+) -> str:
+    async def iterate() -> AsyncIterator[List[Dict]]:
+        for batch in batches:
+            yield batch
+
+    async def encode() -> List[bytes]:
+        return [chunk async for chunk in encode_export(iterate(), fields, format)]
+
+    return b"".join(asyncio.run(encode())).decode()
+
+
+class TestEncodeExport:
+    def test_ndjson(self):
+        text = export(
+            [ROWS[:1], [], ROWS[1:]], ["id", "name", "state"], ExportFormatEnum.ndjson
+        )
+
+        assert [json.loads(line) for line in text.splitlines()] == [
+            {"id": str(ID), "name": "Lac Écho", "state": "QC"},
+            {"id": str(ID), "name": 'a, "b"', "state": "CA"},
+        ]
+
+    def test_geojson(self):
+        data = json.loads(
+            export([ROWS[:1], [], ROWS[1:]], ["name"], ExportFormatEnum.geojson)
+        )
+
+        assert data["type"] == "FeatureCollection"
+        assert data["features"] == [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [row["lon"], row["lat"]]},
+                "properties": {"name": row["name"]},
+            }
+            for row in ROWS
+        ]
+
+    def test_geojson_empty(self):
+        assert json.loads(export([], ["name"], ExportFormatEnum.geojson)) == {
+            "type": "FeatureCollection",
+            "features": [],
+        }
+
+    def test_csv(self):
+        text = export([ROWS], ["name", "state", "lat"], ExportFormatEnum.csv)
+
+        assert list(csv.reader(io.StringIO(text))) == [
+            ["name", "state", "lat"],
+            ["Lac Écho", "QC", "46.0"],
+            ['a, "b"', "CA", "38.0"],
+        ]
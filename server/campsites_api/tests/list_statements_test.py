@@ -0,0 +1,86 @@
+import uuid
+
+from sqlalchemy.dialects import postgresql
+
+from campsites_api.dto.campsites import DistanceFilterDTO
+from campsites_api.services.abstract_service import filter_shape, list_statements
+from campsites_api.services.campsites_service import CampsitesService
+from campsites_api.utils.cursor import encode_cursor
+
+BASE = {
+    "limit": 25,
+    "offset": 0,
+    "cursor": None,
+    "count": "exact",
+    "fields": None,
+    "sort_by": "name",
+    "sort_dir": "asc",
+}
+
+
+def list_query(filters):
+    statements, params = CampsitesService(None)._AbstractService__list_query(
+        {**BASE, **filters}
+    )
+    compiled = statements.page.compile(dialect=postgresql.dialect())
+    return statements, compiled.construct_params(params)
+
+
+class TestListStatements:
+    def test_same_shape_reuses_statements(self):
+        list_statements.invalidate()
+        hits = list_statements.stats()["hits"]
+        first, first_params = list_query(
+            {"state": ["CA"], "name__ct": "lake", "elevation_ft__gt": 100}
+        )
+        second, second_params = list_query(
+            {
+                "state": ["OR", "WA"],
+                "name__ct": "50%",
+                "elevation_ft__gt": 5,
+                "offset": 7,
+            }
+        )
+
+        assert second is first
+        assert list_statements.stats()["hits"] == hits + 1
+        assert second_params["state"] == ["OR", "WA"]
+        assert second_params["name__ct"] == "%50\\%%"
+        assert second_params["elevation_ft__gt"] == 5
+        assert second_params["page_offset"] == 7
+        assert second_params["page_limit"] == 26
+        assert first_params["state"] == ["CA"]
+
+    def test_distance_params(self):
+        distance = DistanceFilterDTO(value=2, units="km", lat=40.5, lon=-105.25)
+        _, params = list_query({"distance": distance})
+
+        assert params["distance_lat"] == 40.5
+        assert params["distance_lon"] == -105.25
+        assert params["distance_meters"] == 2000.0
+
+    def test_shapes(self):
+        shape = filter_shape({**BASE, "state": ["CA"], "has_showers": True})
+
+        assert shape == filter_shape(
+            {**BASE, "has_showers": False, "state": ["OR"], "limit": 5}
+        )
+        assert shape != filter_shape({**BASE, "state": "CA", "has_showers": True})
+        assert shape != filter_shape({**BASE, "state": ["CA"]})
+        assert shape != filter_shape(
+            {**BASE, "state": ["CA"], "has_showers": True, "sort_dir": "desc"}
+        )
+        assert shape != filter_shape(
+            {**BASE, "state": ["CA"], "has_showers": True, "fields": ["id"]}
+        )
+
+    def test_cursor_in_null_block_has_its_own_statement(self):
+        def cursor(value):
+            return encode_cursor(["code", "asc", value, str(uuid.uuid4())])
+
+        with_value, params = list_query({"sort_by": "code", "cursor": cursor("A1")})
+        with_null, null_params = list_query({"sort_by": "code", "cursor": cursor(None)})
+
+        assert with_value is not with_null
+        assert params["cursor_value"] == "A1"
+        assert "cursor_value" not in null_params
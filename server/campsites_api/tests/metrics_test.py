@@ -0,0 +1,103 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from campsites_api.utils.metrics import (
+    Histogram,
+    MetricsMiddleware,
+    RequestSQL,
+    histograms,
+    render_gauges,
+    render_metrics,
+    request_duration,
+    request_sql,
+    request_sql_statements,
+)
+
+
+def samples(lines):
+    return dict(line.rsplit(" ", 1) for line in lines if not line.startswith("#"))
+
+
+class TestHistogram:
+    def test_render(self):
+        histogram = Histogram("test_seconds", "Test", ["route"], [0.1, 1])
+        for value in [0.05, 0.1, 0.5, 3]:
+            histogram.observe(value, '/a"b')
+        histogram.observe(0.2, "/c")
+
+        lines = histogram.render()
+        del histograms["test_seconds"]
+
+        assert lines[:2] == [
+            "# HELP test_seconds Test",
+            "# TYPE test_seconds histogram",
+        ]
+        values = samples(lines)
+        assert values['test_seconds_bucket{route="/a\\"b",le="0.1"}'] == "2"
+        assert values['test_seconds_bucket{route="/a\\"b",le="1"}'] == "3"
+        assert values['test_seconds_bucket{route="/a\\"b",le="+Inf"}'] == "4"
+        assert values['test_seconds_count{route="/a\\"b"}'] == "4"
+        assert float(values['test_seconds_sum{route="/a\\"b"}']) == 3.65
+        assert values['test_seconds_count{route="/c"}'] == "1"
+
+    def test_gauges_skip_none(self):
+        lines = render_gauges("ratio", "Ratio", ["cache"], {("a",): 0.5, ("b",): None})
+
+        assert samples(lines) == {'ratio{cache="a"}': "0.5"}
+
+    def test_render_metrics(self):
+        text = render_metrics(
+            {"places": {"hits": 3, "misses": 1, "hit_ratio": 0.75, "size": 2}},
+            {"sync": {"size": 5, "checkouts": 10}, "async": {}},
+        )
+
+        values = samples(text.splitlines())
+        assert values['cache_hit_ratio{cache="places"}'] == "0.75"
+        assert values['cache_hits_total{cache="places"}'] == "3"
+        assert values['db_pool_checkouts_total{engine="sync"}'] == "10"
+        assert "# TYPE http_request_duration_seconds histogram" in text
+
+
+class TestSQLCounts:
+    def test_statements_counted_in_request_context(self):
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+        engine = create_engine("sqlite://")
+
+        @app.get("/things/{thing_id}")
+        def get_thing(thing_id: int) -> int:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+                connection.execute(text("SELECT 2"))
+            return thing_id
+
+        response = TestClient(app).get("/things/7")
+
+        assert response.status_code == 200
+        assert 'desc="2 statements"' in response.headers["server-timing"]
+        values = samples(request_sql_statements.render())
+        key = 'http_request_sql_statements_bucket{method="GET",route="/things/{thing_id}",le="2"}'
+        assert int(values[key]) >= 1
+        values = samples(request_duration.render())
+        key = 'http_request_duration_seconds_count{method="GET",route="unmatched",status="404"}'
+        count = int(values.get(key, 0))
+        TestClient(app).get("/nowhere")
+        values = samples(request_duration.render())
+        assert int(values[key]) == count + 1
+
+    def test_statements_outside_requests_not_attributed(self):
+        MetricsMiddleware(None)
+        engine = create_engine("sqlite://")
+        sql = RequestSQL()
+        token = request_sql.set(sql)
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        finally:
+            request_sql.reset(token)
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+        assert sql.statements == 1
+        assert sql.seconds > 0
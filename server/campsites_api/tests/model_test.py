@@ -1,3 +1,5 @@
+from sqlalchemy import inspect
+
 from campsites_db.models import Campsite, GeographicalName
 
 
@@ -21,3 +23,11 @@ class TestGeographicalNameFactory:
         db_results = db_session.query(GeographicalName).all()
         assert len(db_results) == 1, "GeographicalNameFactory did not auto-commit to db"
         assert db_results[0].id == p.id
+
+
+class TestSpatialIndexes:
+    def test_geo_indexes(self, db_session):
+        indexes = inspect(db_session.get_bind()).get_indexes("campsites")
+        names = [index["name"] for index in indexes]
+        assert "idx_campsites_geo" in names
+        assert "idx_campsites_geo_geography" in names
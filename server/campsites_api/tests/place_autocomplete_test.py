@@ -0,0 +1,69 @@
+import uuid
+
+from campsites_api.services.place_autocomplete import (
+    PlaceAutocompleteIndex,
+    PlaceSuggestion,
+)
+
+
+def place(name, priority_order=1, state_province="MA", country="USA"):
+    return (
+        name,
+        PlaceSuggestion(
+            str(uuid.uuid4()), name, state_province, country, 0.0, 0.0, priority_order
+        ),
+    )
+
+
+class TestPlaceAutocompleteIndex:
+    def test_search_prefix(self):
+        index = PlaceAutocompleteIndex()
+        index.build([place("Boston"), place("Bolton"), place("Worcester")])
+
+        assert [p.name for p in index.search("bo")] == ["Bolton", "Boston"]
+        assert [p.name for p in index.search("BOS")] == ["Boston"]
+        assert index.search("x") == []
+        assert index.search(" ") == []
+
+    def test_search_word_start(self):
+        index = PlaceAutocompleteIndex()
+        index.build([place("New York"), place("Yorktown")])
+
+        assert [p.name for p in index.search("york")] == ["New York", "Yorktown"]
+        # each place is only suggested once
+        assert [p.name for p in index.search("new")] == ["New York"]
+
+    def test_search_priority_and_limit(self):
+        index = PlaceAutocompleteIndex()
+        index.build(
+            [place("Springdale", 2), place("Springfield", 1), place("Springvale", 3)]
+        )
+
+        assert [p.name for p in index.search("spring")] == [
+            "Springfield",
+            "Springdale",
+            "Springvale",
+        ]
+        assert [p.name for p in index.search("spring", limit=1)] == ["Springfield"]
+
+    def test_search_filters(self):
+        index = PlaceAutocompleteIndex()
+        index.build(
+            [
+                place("Portland", state_province="ME"),
+                place("Portland", state_province="OR"),
+                place("Port Hope", state_province="ON", country="CAN"),
+            ]
+        )
+
+        assert [
+            p.state_province for p in index.search("port", state_province=["OR"])
+        ] == ["OR"]
+        assert [p.name for p in index.search("port", country="CAN")] == ["Port Hope"]
+
+    def test_search_unicode(self):
+        index = PlaceAutocompleteIndex()
+        index.build([place("Montréal")])
+
+        assert [p.name for p in index.search("montre")] == ["Montréal"]
+        assert [p.name for p in index.search("Montré")] == ["Montréal"]
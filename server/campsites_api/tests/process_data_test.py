@@ -0,0 +1,43 @@
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from campsites_api.tests.const import example_csv_content
+from campsites_api.utils.process_data import RowErrors, batched, process_data
+
+
+def upload(content: str) -> UploadFile:
+    return UploadFile(file=io.BytesIO(content.encode("utf-8")), filename="test.csv")
+
+
+class TestProcessData:
+    def test_process_data_batches(self):
+        errors = RowErrors()
+        batches = list(process_data(upload(example_csv_content), errors, 3))
+
+        assert [len(batch) for batch in batches] == [3, 1]
+        assert batches[0][0].name == "Black Rock State Park"
+        assert errors.count == 0
+
+    def test_process_data_row_errors(self):
+        header, *rows = example_csv_content.strip().split("\n")
+        bad_row = "-73.098,41.651,,,,,,,,,,,,,,"
+        content = "\n".join([header, rows[0], bad_row, rows[1]]) + "\n"
+
+        errors = RowErrors()
+        campsites = [
+            c for batch in process_data(upload(content), errors) for c in batch
+        ]
+
+        assert len(campsites) == 2
+        assert errors.count == 1
+        assert errors.errors[0].line == 3
+
+    def test_process_data_empty_file(self):
+        with pytest.raises(HTTPException):
+            process_data(upload(""), RowErrors())
+
+    def test_batched(self):
+        assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+        assert list(batched([], 2)) == []
@@ -0,0 +1,96 @@
+import csv
+import glob
+import os
+
+import pytest
+
+import campsites_api.utils.process_data_utils as ut
+from campsites_api.utils.process_data import (
+    RowErrors,
+    normalize_row,
+    normalize_rows,
+    validate_rows,
+)
+
+DATA_FILES = sorted(
+    glob.glob(
+        os.path.join(
+            os.path.dirname(__file__),
+            os.pardir,
+            os.pardir,
+            "campsites_db",
+            "data",
+            "*.csv",
+        )
+    )
+)
+
+
+@pytest.fixture(scope="module")
+def data_rows():
+    rows = []
+    for path in DATA_FILES:
+        with open(path, encoding="utf-8") as file:
+            rows.extend(csv.DictReader(file))
+    return rows
+
+
+class TestColumnWiseProcessing:
+    def test_column_functions_match_per_row(self, data_rows):
+        rows = [normalize_row(row) for row in data_rows]
+        phones = [row["phone"] for row in data_rows] + ["(555) 12é-34", None]
+        dates = [row["dates_open"] for row in rows] + ["all year", "late", None]
+        states = [row["state"] for row in rows]
+        amenities = [row["amenities"] for row in rows] + ["NH NP", "FTVT L$", None]
+
+        assert ut.process_phone_numbers(phones) == [
+            ut.process_phone_number(phone) for phone in phones
+        ]
+        assert ut.process_dates_column(dates) == {
+            name: [ut.process_dates(value)[name] for value in dates]
+            for name in ["month_open", "month_close"]
+        }
+        assert ut.process_countries(states) == [
+            ut.process_country(state) for state in states
+        ]
+        assert ut.process_amenities_column(amenities) == {
+            name: [ut.process_amenities(value).get(name) for value in amenities]
+            for name in ut.AMENITY_COLUMNS
+        }
+
+    def test_column_functions_empty(self):
+        assert ut.process_dates_column([]) == {"month_open": [], "month_close": []}
+        assert ut.process_amenities_column([])["has_showers"] == []
+
+    def test_long_values_not_memoized(self):
+        long_value = "SH " * ut.NORMALIZER_CACHE_MAX_LENGTH
+        before = ut._amenities.cache_info().currsize
+        column = ut.process_amenities_column([long_value, "SH DW"])
+
+        assert column["has_showers"] == [True, True]
+        assert ut._amenities.cache_info().currsize <= before + 1
+        assert ut._amenities.cache_info().maxsize == ut.NORMALIZER_CACHE_SIZE
+
+    def test_process_amenities_column_invalid(self):
+        with pytest.raises(ValueError):
+            ut.process_amenities_column(["SH", "longft"])
+
+    def test_normalize_rows_match_per_row(self, data_rows):
+        assert len(data_rows) > 10000
+        per_row = [normalize_row(row) for row in data_rows]
+        column_wise = normalize_rows(data_rows)
+
+        assert len(column_wise) == len(per_row)
+        for expected, row in zip(per_row, column_wise):
+            assert row == {"has_rv_hookup": None, **expected}
+
+    def test_validate_rows_falls_back_to_per_row(self, data_rows):
+        rows = [{**row} for row in data_rows[:10]]
+        rows[3]["amenities"] = "SH longft"
+        errors = RowErrors()
+        campsites = list(validate_rows(enumerate(rows, start=2), errors, 4))
+
+        assert len(campsites) == 9
+        assert errors.count == 1
+        assert errors.errors[0].line == 5
+        assert campsites[0].name == data_rows[0]["name"].strip()
@@ -0,0 +1,68 @@
+import io
+
+import pytest
+
+from campsites_api.tests.const import example_places_csv_content
+from campsites_api.utils.process_data import RowErrors
+from campsites_api.utils.process_places import (
+    DEFAULT_PRIORITY,
+    PLACE_COLUMNS,
+    LoadProgress,
+    normalize_place,
+    process_places,
+    read_place_rows,
+)
+
+
+def rows(content: str):
+    return read_place_rows(io.BytesIO(content.encode("utf-8")))
+
+
+class TestProcessPlaces:
+    def test_normalize_place(self):
+        (_, row), *_ = rows(example_places_csv_content)
+        place = dict(zip(PLACE_COLUMNS, normalize_place(row)))
+
+        assert place["search_str"] == "boston ma"
+        assert place["country"] == "USA"
+        assert place["priority_order"] == 1
+        assert (place["lat"], place["lon"]) == (42.3584, -71.0598)
+
+    def test_normalize_place_defaults(self):
+        _, _, (_, row) = rows(example_places_csv_content)
+        place = dict(zip(PLACE_COLUMNS, normalize_place(row)))
+
+        assert place["search_str"] == "montreal qc"
+        assert place["country"] == "CAN"
+        assert place["county"] is None
+
+        row = {**row, "generic_category": "Stream", "priority_order": "7"}
+        assert normalize_place(row)[-1] == 7
+        del row["priority_order"]
+        assert normalize_place(row)[-1] == DEFAULT_PRIORITY
+
+    @pytest.mark.parametrize(
+        "change", [{"name": ""}, {"state_province": "XX"}, {"lat": "91"}]
+    )
+    def test_normalize_place_invalid(self, change):
+        (_, row), *_ = rows(example_places_csv_content)
+        with pytest.raises(ValueError):
+            normalize_place({**row, **change})
+
+    def test_process_places(self):
+        header, *lines = example_places_csv_content.strip().split("\n")
+        content = "\n".join([header, lines[0], "1,Nowhere,,,,ZZ,0,0", *lines[1:]])
+
+        errors = RowErrors()
+        progress = LoadProgress()
+        batches = list(process_places(rows(content), errors, None, 2, progress))
+
+        assert [len(batch) for batch in batches] == [1, 2]
+        assert [place[1] for batch in batches for place in batch] == [
+            "Boston",
+            "Blue Hills Reservation",
+            "Montréal",
+        ]
+        assert errors.count == 1
+        assert errors.errors[0].line == 3
+        assert (progress.rows, progress.errors) == (3, 1)
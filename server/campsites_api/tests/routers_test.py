@@ -1,13 +1,52 @@
+import csv
+import io
+import json
+import time
 import uuid
 
 import pytest
-from campsites_api.dto.campsites import CampsiteDTO, CampsiteListDTO
+from campsites_api.dto.campsites import (
+    CampsiteClusterListDTO,
+    CampsiteDTO,
+    CampsiteListDTO,
+    CampsiteNearestListDTO,
+)
 from campsites_api.tests.const import (
     example_filter_combos,
     example_csv_content,
+    example_places_csv_content,
     example_incorrect_csv_content,
 )
-from campsites_db.models import Campsite
+from campsites_api.services.abstract_service import build_point
+from campsites_api.services.campsites_engine import CampsitesEngine
+from campsites_api.services.campsites_service import (
+    CampsitesService,
+    clusters_fresh_statement,
+)
+from campsites_api.utils import debug
+from campsites_db.models import (
+    Campsite,
+    CampsiteStateEnum,
+    CampsiteTypeEnum,
+    GeographicalName,
+    as_geography,
+)
+from sqlalchemy import func, select
+
+
+def upload_campsites(test_client, path, **params) -> dict:
+    """Uploads a CSV file, and polls its upload job until it has finished"""
+    with open(path, "rb") as f:
+        response = test_client.post(
+            "/campsites/upload", params=params, files={"csv_file": f}
+        )
+    assert response.status_code == 202
+    for _ in range(200):
+        job = test_client.get(response.headers["Location"]).json()
+        if job["state"] in ["succeeded", "failed"]:
+            return job
+        time.sleep(0.05)
+    raise AssertionError("upload job did not finish")
 
 
 class TestCampsitesRouter:
@@ -23,6 +62,25 @@ class TestCampsitesRouter:
             data = CampsiteDTO(**response.json())
             assert data.id == c.id, "Query is not filtering by correct ID"
 
+        def test_get_campsite_fields(self, test_client, campsite_factory):
+            c = campsite_factory.create()
+
+            response = test_client.get(
+                f"/campsites/campsite/{c.id}", params={"fields": "name,lat,lon"}
+            )
+            assert response.status_code == 200
+            assert response.json() == {
+                "id": str(c.id),
+                "name": c.name,
+                "lat": c.lat,
+                "lon": c.lon,
+            }
+
+            response = test_client.get(
+                f"/campsites/campsite/{c.id}", params={"fields": "name,geo"}
+            )
+            assert response.status_code == 422
+
         def test_get_campsite_invalid_id(self, test_client):
             response = test_client.get("/campsites/campsite/foobar")
             assert response.status_code == 422
@@ -71,6 +129,156 @@ class TestCampsitesRouter:
             assert len(data.items) == 1
             assert data.items[0].id == c[2].id
 
+        def test_list_campsites_cache_invalidated_on_write(
+            self, test_client, campsite_factory
+        ):
+            c = campsite_factory.create()
+
+            response = test_client.get("/campsites")
+            assert CampsiteListDTO(**response.json()).num_total_results == 1
+
+            response = test_client.delete(f"/campsites/campsite/{c.id}")
+            assert response.status_code == 200
+
+            response = test_client.get("/campsites")
+            assert CampsiteListDTO(**response.json()).num_total_results == 0
+
+            stats = test_client.get("/health/caches").json()["campsites_list"]
+            assert stats["misses"] == 2
+
+        def test_list_campsites_count_modes(self, test_client, campsite_factory):
+            campsite_factory.create_batch(3)
+
+            response = test_client.get("/campsites", params={"limit": 2})
+            data = CampsiteListDTO(**response.json())
+            assert data.count_mode == "exact"
+            assert data.num_total_results == 3
+            assert data.has_more is True
+
+            response = test_client.get(
+                "/campsites", params={"limit": 2, "count": "none"}
+            )
+            data = CampsiteListDTO(**response.json())
+            assert data.count_mode == "none"
+            assert data.num_total_results is None
+            assert data.has_more is True
+            assert len(data.items) == 2
+
+            response = test_client.get(
+                "/campsites", params={"limit": 2, "offset": 2, "count": "none"}
+            )
+            data = CampsiteListDTO(**response.json())
+            assert data.has_more is False
+            assert len(data.items) == 1
+
+            response = test_client.get("/campsites", params={"count": "estimate"})
+            data = CampsiteListDTO(**response.json())
+            assert data.count_mode == "estimate"
+            assert data.num_total_results is not None
+
+        def test_list_campsites_exact_count_past_end(
+            self, test_client, campsite_factory
+        ):
+            campsite_factory.create_batch(3)
+
+            response = test_client.get("/campsites", params={"offset": 5})
+            data = CampsiteListDTO(**response.json())
+            assert data.num_total_results == 3
+            assert data.items == []
+
+        def test_list_campsites_cursor(self, test_client, campsite_factory):
+            c = campsite_factory.create_batch(5)
+
+            response = test_client.get("/campsites", params={"limit": 2})
+            data = CampsiteListDTO(**response.json())
+            assert [item.id for item in data.items] == [c[0].id, c[1].id]
+            assert data.next_cursor is not None
+
+            # a row added mid-scroll before the cursor does not shift later pages
+            campsite_factory.create(name="aaa")
+
+            response = test_client.get(
+                "/campsites", params={"limit": 2, "cursor": data.next_cursor}
+            )
+            data = CampsiteListDTO(**response.json())
+            assert [item.id for item in data.items] == [c[2].id, c[3].id]
+
+            response = test_client.get(
+                "/campsites", params={"limit": 2, "cursor": data.next_cursor}
+            )
+            data = CampsiteListDTO(**response.json())
+            assert [item.id for item in data.items] == [c[4].id]
+            assert data.next_cursor is None
+
+        def test_list_campsites_cursor_nullable_sort(
+            self, test_client, campsite_factory
+        ):
+            campsite_factory.create_batch(2)
+            campsite_factory.create_batch(3, code=None)
+
+            for sort_dir in ["asc", "desc"]:
+                params = {"limit": 2, "sort_by": "code", "sort_dir": sort_dir}
+                response = test_client.get("/campsites", params=params)
+                data = CampsiteListDTO(**response.json())
+                expected = [item.id for item in data.items]
+                # page through the rest with the cursor and compare with offset paging
+                offset = 2
+                while data.next_cursor is not None:
+                    response = test_client.get(
+                        "/campsites", params={**params, "cursor": data.next_cursor}
+                    )
+                    data = CampsiteListDTO(**response.json())
+                    offset_data = CampsiteListDTO(
+                        **test_client.get(
+                            "/campsites", params={**params, "offset": offset}
+                        ).json()
+                    )
+                    assert [item.id for item in data.items] == [
+                        item.id for item in offset_data.items
+                    ]
+                    expected += [item.id for item in data.items]
+                    offset += 2
+                assert len(set(expected)) == 5
+
+        def test_list_campsites_cursor_invalid(self, test_client, campsite_factory):
+            campsite_factory.create_batch(3)
+            response = test_client.get("/campsites", params={"limit": 2})
+            cursor = response.json()["next_cursor"]
+
+            # cursor from a different sort order
+            response = test_client.get(
+                "/campsites", params={"cursor": cursor, "sort_by": "code"}
+            )
+            assert response.status_code == 422
+
+            response = test_client.get("/campsites", params={"cursor": "foobar"})
+            assert response.status_code == 422
+
+        def test_list_campsites_fields(self, test_client, campsite_factory):
+            c = campsite_factory.create_batch(3)
+
+            params = {"limit": 2, "fields": "name,state"}
+            response = test_client.get("/campsites", params=params)
+            assert response.status_code == 200
+            data = response.json()
+            assert data["items"] == [
+                {"id": str(item.id), "name": item.name, "state": item.state}
+                for item in c[:2]
+            ]
+            assert data["num_total_results"] == 3
+
+            # the cursor still works when the sort column is not requested
+            params = {"limit": 2, "fields": "code", "sort_by": "name"}
+            cursor = test_client.get("/campsites", params=params).json()["next_cursor"]
+            response = test_client.get(
+                "/campsites", params={**params, "cursor": cursor}
+            )
+            assert response.json()["items"] == [{"id": str(c[2].id), "code": c[2].code}]
+
+        def test_list_campsites_fields_unknown(self, test_client):
+            response = test_client.get("/campsites", params={"fields": "name,foo"})
+            assert response.status_code == 422
+
         @pytest.mark.parametrize(
             "obj_attr,filter_attr,_",
             example_filter_combos,
@@ -89,6 +297,19 @@ class TestCampsitesRouter:
             assert data.num_total_results == 1
             assert data.items[0].id == c_exp.id
 
+        def test_list_campsites_contains_escapes_wildcards(
+            self, test_client, campsite_factory
+        ):
+            c_exp = campsite_factory.create(name="50% Off Camp")
+            # would match if % was treated as a wildcard
+            campsite_factory.create(name="500 Off Camp")
+
+            response = test_client.get("/campsites", params={"name__ct": "0% o"})
+            data = CampsiteListDTO(**response.json())
+
+            assert data.num_total_results == 1
+            assert data.items[0].id == c_exp.id
+
         def test_list_campsites_distance(self, test_client, campsite_factory):
             c_exp = campsite_factory.create(lat=41.751, lon=-70.593)
             # campsite outside of range
@@ -124,6 +345,45 @@ class TestCampsitesRouter:
 
             assert data.num_total_results == 0
 
+        def test_list_campsites_distance_boundary(
+            self, test_client, campsite_factory, db_session
+        ):
+            campsite = campsite_factory.create(lat=41.751, lon=-70.593)
+            target = (42.3584308, -71.0597732)  # boston
+            point = build_point(*target)
+            distance = func.ST_Distance(as_geography(Campsite.geo), point, False)
+            geography, sphere, within = db_session.execute(
+                select(
+                    distance,
+                    func.ST_DistanceSphere(
+                        Campsite.geo,
+                        func.ST_SetSRID(func.ST_MakePoint(target[1], target[0]), 4326),
+                    ),
+                    func.ST_DWithin(as_geography(Campsite.geo), point, distance, False),
+                ).where(Campsite.id == campsite.id)
+            ).one()
+
+            def total(meters: float) -> int:
+                response = test_client.get(
+                    "/campsites",
+                    params={
+                        "distance_value": meters / 1000,
+                        "distance_units": "km",
+                        "distance_lat": target[0],
+                        "distance_lon": target[1],
+                    },
+                )
+                return response.json()["num_total_results"]
+
+            # the boundary is inclusive
+            assert within is True
+            # distances are on a sphere of the mean radius, slightly longer than
+            # ST_DistanceSphere's
+            assert geography > sphere
+            assert geography == pytest.approx(sphere, rel=1e-5)
+            assert total(geography * (1 + 1e-9)) == 1
+            assert total(sphere) == 0
+
         def test_list_campsites_distance_incomplete(
             self, test_client, campsite_factory
         ):
@@ -143,6 +403,454 @@ class TestCampsitesRouter:
             # should not filter based on distance without all parameters
             assert data.num_total_results == 2
 
+    class TestNearestCampsites:
+        target = (42.3584308, -71.0597732)  # boston
+
+        def test_nearest_campsites(self, test_client, campsite_factory):
+            far = campsite_factory.create(lat=50.0, lon=-74.0)
+            near = campsite_factory.create(lat=41.751, lon=-70.593)
+            nearest = campsite_factory.create(lat=42.36, lon=-71.06)
+
+            response = test_client.get(
+                "/campsites/nearest",
+                params={"lat": self.target[0], "lon": self.target[1], "k": 2},
+            )
+            assert response.status_code == 200
+
+            data = CampsiteNearestListDTO(**response.json())
+            assert [item.id for item in data.items] == [nearest.id, near.id]
+            assert far.id not in [item.id for item in data.items]
+            # boston to the cape is roughly 48 miles
+            assert 45 < data.items[1].distance < 50
+
+        def test_nearest_campsites_filter(self, test_client, campsite_factory):
+            campsite_factory.create(lat=42.36, lon=-71.06, has_showers=False)
+            c_exp = campsite_factory.create(lat=41.751, lon=-70.593, has_showers=True)
+
+            response = test_client.get(
+                "/campsites/nearest",
+                params={
+                    "lat": self.target[0],
+                    "lon": self.target[1],
+                    "has_showers": True,
+                    "units": "km",
+                },
+            )
+            data = CampsiteNearestListDTO(**response.json())
+
+            assert [item.id for item in data.items] == [c_exp.id]
+            assert data.units == "km"
+
+        def test_nearest_campsites_missing_point(self, test_client):
+            response = test_client.get("/campsites/nearest", params={"k": 2})
+            assert response.status_code == 422
+
+    class TestCampsitesMemoryEngine:
+        @pytest.fixture
+        def campsites(self, campsite_factory):
+            names = ["alpha", "Beta", "beta", "_under", "Zeta Park", "Ébène"]
+            for i, name in enumerate(names + ["same"] * 3):
+                campsite_factory.create(
+                    name=name,
+                    code=None if i % 4 == 0 else f"C{i % 3}",
+                    state=[CampsiteStateEnum.CA, CampsiteStateEnum.AB][i % 2],
+                    campsite_type=[None, CampsiteTypeEnum.SP, CampsiteTypeEnum.NF][
+                        i % 3
+                    ],
+                    has_showers=[None, True, False][i % 3],
+                    elevation_ft=None if i % 5 == 0 else i * 500,
+                    lat=42.0 + i * 0.1,
+                    lon=-71.0,
+                )
+
+        def pages(self, test_client, params) -> list:
+            pages = [test_client.get("/campsites", params=params).json()]
+            while pages[-1]["next_cursor"] is not None:
+                cursor = pages[-1]["next_cursor"]
+                pages.append(
+                    test_client.get(
+                        "/campsites", params={**params, "cursor": cursor}
+                    ).json()
+                )
+            return pages
+
+        @pytest.mark.parametrize(
+            "params",
+            [
+                {},
+                {"sort_dir": "desc"},
+                {"sort_by": "code"},
+                {"sort_by": "code", "sort_dir": "desc"},
+                {"sort_by": "state", "sort_dir": "desc"},
+                {"sort_by": "campsite_type"},
+                {"sort_by": "campsite_type", "sort_dir": "desc"},
+                {"name__ct": "A"},
+                {"code__ct": "c1"},
+                {"state": ["CA", "AB"], "has_showers": True},
+                {"campsite_type": ["SP"], "elevation_ft__gt": 1000},
+                {"elevation_ft__lt": 2000, "count": "none"},
+                {
+                    "distance_value": 20,
+                    "distance_units": "mi",
+                    "distance_lat": 42.0,
+                    "distance_lon": -71.0,
+                },
+                {"fields": "name,state", "sort_by": "state"},
+                {"offset": 3},
+                {"offset": 20},
+            ],
+        )
+        def test_memory_engine_matches_postgres(
+            self, params, test_client, campsites, monkeypatch
+        ):
+            params = {"limit": 2, **params}
+            expected = self.pages(test_client, params)
+
+            monkeypatch.setattr(CampsitesService, "engine", CampsitesEngine())
+            assert self.pages(test_client, params) == expected
+
+        def test_memory_engine_nearest(self, test_client, campsites, monkeypatch):
+            params = {"lat": 42.33, "lon": -71.05, "k": 4, "has_showers": False}
+            expected = test_client.get("/campsites/nearest", params=params).json()
+
+            monkeypatch.setattr(CampsitesService, "engine", CampsitesEngine())
+            items = test_client.get("/campsites/nearest", params=params).json()["items"]
+            assert [item["id"] for item in items] == [
+                item["id"] for item in expected["items"]
+            ]
+            for item, expected_item in zip(items, expected["items"]):
+                assert item["distance"] == pytest.approx(expected_item["distance"])
+
+        def test_memory_engine_reloads_on_write(
+            self, test_client, campsites, monkeypatch
+        ):
+            monkeypatch.setattr(CampsitesService, "engine", CampsitesEngine())
+            before = test_client.get("/campsites").json()["num_total_results"]
+            campsite = CampsiteDTO(
+                name="new",
+                state="CA",
+                country="USA",
+                lon=-71.0,
+                lat=42.0,
+                composite="new",
+            )
+            test_client.post(
+                "/campsites/campsite", json=campsite.model_dump(mode="json")
+            )
+
+            after = test_client.get("/campsites").json()["num_total_results"]
+            assert after == before + 1
+
+        def test_memory_engine_reloads_on_other_writes(
+            self, test_client, campsites, campsite_factory, monkeypatch
+        ):
+            monkeypatch.setattr(
+                CampsitesService, "engine", CampsitesEngine(check_interval=0)
+            )
+            before = test_client.get("/campsites").json()["num_total_results"]
+            # written without the API, as another process would
+            campsite_factory.create(lat=42.0, lon=-71.0)
+
+            after = test_client.get("/campsites").json()["num_total_results"]
+            assert after == before + 1
+
+    class TestExplainCampsites:
+        @pytest.fixture
+        def campsites(self, campsite_factory):
+            # enough rows for a second page of 2, with the filtered values
+            return [
+                campsite_factory.create(state=state, has_showers=showers)
+                for state, showers in [
+                    (CampsiteStateEnum.CA, True),
+                    (CampsiteStateEnum.OR, True),
+                    (CampsiteStateEnum.CA, False),
+                    (CampsiteStateEnum.WA, None),
+                ]
+            ]
+
+        @pytest.fixture
+        def admin(self, monkeypatch):
+            monkeypatch.setattr(debug, "ADMIN_TOKEN", "secret")
+            return {"X-Admin-Token": "secret"}
+
+        def test_requires_admin(self, test_client, campsites, monkeypatch):
+            response = test_client.get("/campsites", params={"explain": True})
+            assert response.status_code == 403
+
+            monkeypatch.setattr(debug, "ADMIN_TOKEN", "secret")
+            response = test_client.get(
+                "/campsites",
+                params={"explain": True},
+                headers={"X-Admin-Token": "wrong"},
+            )
+            assert response.status_code == 403
+
+        def test_not_requested(self, test_client, campsites, admin):
+            response = test_client.get("/campsites", headers=admin)
+            assert response.status_code == 200
+            assert "explain" not in response.json()
+
+        def test_explain_page(self, test_client, campsites, admin):
+            response = test_client.get(
+                "/campsites",
+                params={"explain": True, "state": ["CA"], "limit": 2},
+                headers=admin,
+            )
+            assert response.status_code == 200
+            data = response.json()
+            assert len(data["items"]) <= 2
+            assert data["explain"]["list_ms"] >= 0
+            [page] = data["explain"]["statements"]
+            assert page["statement"] == "page"
+            assert page["params"]["state"] == ["CA"]
+            assert page["execution_ms"] >= 0
+            assert "Plan" in page["plan"]
+            assert "Shared Hit Blocks" in page["plan"]["Plan"]
+
+        def test_explain_count_with_cursor(self, test_client, campsites, admin):
+            first = test_client.get("/campsites", params={"limit": 2})
+            response = test_client.get(
+                "/campsites",
+                params={"cursor": first.json()["next_cursor"], "limit": 2},
+                headers={**admin, "X-Explain": "true"},
+            )
+            assert response.status_code == 200
+            statements = response.json()["explain"]["statements"]
+            assert [plan["statement"] for plan in statements] == ["count", "page"]
+
+        def test_slow_plan_log(self, test_client, campsites, admin, monkeypatch):
+            monkeypatch.setattr(debug.slow_plans, "threshold_ms", 0)
+            debug.slow_plans.clear()
+            test_client.get(
+                "/campsites",
+                params={"explain": True, "has_showers": True},
+                headers=admin,
+            )
+
+            assert test_client.get("/health/slow-plans").status_code == 403
+            response = test_client.get("/health/slow-plans", headers=admin)
+            [entry] = response.json()["items"]
+            assert entry["route"] == "/campsites"
+            assert entry["filters"]["has_showers"] is True
+            assert entry["statements"][-1]["statement"] == "page"
+            debug.slow_plans.clear()
+
+        def test_sampled_plans(self, test_client, campsites, monkeypatch):
+            monkeypatch.setattr(debug.slow_plans, "threshold_ms", 0)
+            monkeypatch.setattr(debug.slow_plans, "sample_rate", 1)
+            debug.slow_plans.clear()
+            response = test_client.get("/campsites", params={"state": ["CA"]})
+
+            assert "explain" not in response.json()
+            [entry] = debug.slow_plans.entries()
+            assert entry["filters"]["state"] == ["CA"]
+            debug.slow_plans.clear()
+
+    class TestExportCampsites:
+        @pytest.fixture
+        def campsites(self, campsite_factory):
+            return [
+                campsite_factory.create(name=name, state=state, has_showers=showers)
+                for name, state, showers in [
+                    ("b", CampsiteStateEnum.CA, True),
+                    ("a", CampsiteStateEnum.OR, True),
+                    ("c", CampsiteStateEnum.CA, False),
+                ]
+            ]
+
+        def test_export_ndjson(self, test_client, campsites):
+            response = test_client.get("/campsites/export")
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "application/x-ndjson"
+            assert "campsites.ndjson" in response.headers["content-disposition"]
+
+            rows = [json.loads(line) for line in response.text.splitlines()]
+            assert [row["name"] for row in rows] == ["a", "b", "c"]
+            for row in rows:
+                assert CampsiteDTO(**row) == CampsiteDTO.model_validate(
+                    next(c for c in campsites if str(c.id) == row["id"])
+                )
+
+        def test_export_filters_and_fields(self, test_client, campsites):
+            params = {
+                "state": "CA",
+                "has_showers": True,
+                "fields": "name",
+                "limit": 1,
+                "offset": 5,
+            }
+            response = test_client.get("/campsites/export", params=params)
+            assert response.status_code == 200
+
+            rows = [json.loads(line) for line in response.text.splitlines()]
+            assert rows == [{"id": str(campsites[0].id), "name": "b"}]
+
+        def test_export_geojson(self, test_client, campsites):
+            params = {"format": "geojson", "fields": "name,state", "sort_dir": "desc"}
+            response = test_client.get("/campsites/export", params=params)
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "application/geo+json"
+
+            data = response.json()
+            assert data["type"] == "FeatureCollection"
+            assert [f["properties"]["name"] for f in data["features"]] == [
+                "c",
+                "b",
+                "a",
+            ]
+            feature = data["features"][-1]
+            assert feature["properties"] == {
+                "id": str(campsites[1].id),
+                "name": "a",
+                "state": "OR",
+            }
+            assert feature["geometry"] == {
+                "type": "Point",
+                "coordinates": [campsites[1].lon, campsites[1].lat],
+            }
+
+        def test_export_csv(self, test_client, campsites):
+            params = {"format": "csv", "fields": "name,state,has_showers"}
+            response = test_client.get("/campsites/export", params=params)
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/csv")
+
+            rows = list(csv.DictReader(io.StringIO(response.text)))
+            assert rows == [
+                {
+                    "id": str(c.id),
+                    "name": c.name,
+                    "state": c.state.value,
+                    "has_showers": str(c.has_showers),
+                }
+                for c in [campsites[1], campsites[0], campsites[2]]
+            ]
+
+        def test_export_empty(self, test_client):
+            response = test_client.get(
+                "/campsites/export", params={"format": "geojson"}
+            )
+            assert response.status_code == 200
+            assert response.json() == {"type": "FeatureCollection", "features": []}
+
+        def test_export_invalid_format(self, test_client):
+            response = test_client.get("/campsites/export", params={"format": "xml"})
+            assert response.status_code == 422
+
+    class TestCampsiteClusters:
+        params = {"bbox": "-80,40,-60,50", "zoom": 3}
+
+        def test_campsite_clusters(self, test_client, campsite_factory):
+            # boston and the cape share a cell at zoom 3, but not at zoom 10
+            campsite_factory.create(lat=42.36, lon=-71.06)
+            campsite_factory.create(lat=41.751, lon=-70.593)
+            campsite_factory.create(lat=49.0, lon=-75.0)
+            # outside the bounding box
+            campsite_factory.create(lat=37.77, lon=-122.42)
+
+            response = test_client.get("/campsites/clusters", params=self.params)
+            assert response.status_code == 200
+            data = CampsiteClusterListDTO(**response.json())
+            assert sorted(item.count for item in data.items) == [1, 2]
+            cluster = next(item for item in data.items if item.count == 2)
+            assert cluster.lat == pytest.approx((42.36 + 41.751) / 2)
+
+            response = test_client.get(
+                "/campsites/clusters", params={**self.params, "zoom": 10}
+            )
+            data = CampsiteClusterListDTO(**response.json())
+            assert [item.count for item in data.items] == [1, 1, 1]
+
+        def test_campsite_clusters_filter(self, test_client, campsite_factory):
+            campsite_factory.create(lat=42.36, lon=-71.06, has_showers=True)
+            campsite_factory.create(lat=41.751, lon=-70.593, has_showers=False)
+
+            response = test_client.get(
+                "/campsites/clusters", params={**self.params, "has_showers": True}
+            )
+            data = CampsiteClusterListDTO(**response.json())
+            assert [item.count for item in data.items] == [1]
+
+        def test_campsite_clusters_precomputed(self, test_client, tmp_path):
+            p = tmp_path / "campsites.csv"
+            p.write_text(example_csv_content)
+            upload_campsites(test_client, p)
+
+            params = {"bbox": "-180,-90,180,90", "zoom": 2}
+            precomputed = test_client.get("/campsites/clusters", params=params).json()
+            # any filter, even one matching every campsite, makes the clusters be
+            # grouped from the campsites table
+            computed = test_client.get(
+                "/campsites/clusters", params={**params, "name__ct": ""}
+            ).json()
+            assert sum(item["count"] for item in precomputed["items"]) == 4
+            assert len(precomputed["items"]) == len(computed["items"])
+            for a, b in zip(precomputed["items"], computed["items"]):
+                assert a == pytest.approx(b)
+
+        def test_campsite_clusters_stale_after_other_writes(
+            self, test_client, tmp_path, campsite_factory, db_session
+        ):
+            p = tmp_path / "campsites.csv"
+            p.write_text(example_csv_content)
+            upload_campsites(test_client, p)
+            assert db_session.execute(clusters_fresh_statement()).scalar() is True
+
+            # written without the API, as another process would
+            campsite_factory.create(lat=42.36, lon=-71.06)
+            assert db_session.execute(clusters_fresh_statement()).scalar() is False
+
+            params = {"bbox": "-180,-90,180,90", "zoom": 2}
+            response = test_client.get("/campsites/clusters", params=params)
+            assert sum(item["count"] for item in response.json()["items"]) == 5
+
+        def test_campsite_clusters_invalid_bbox(self, test_client):
+            for bbox in ["foo", "-60,40,-80,50", "-80,40,-60"]:
+                response = test_client.get(
+                    "/campsites/clusters", params={"bbox": bbox, "zoom": 3}
+                )
+                assert response.status_code == 422
+
+    class TestCampsitesTiles:
+        def test_campsites_tile(self, test_client, campsite_factory):
+            c = campsite_factory.create(lat=42.36, lon=-71.06)
+
+            response = test_client.get("/campsites/tiles/0/0/0.pbf")
+            assert response.status_code == 200
+            assert response.headers["content-type"] == (
+                "application/vnd.mapbox-vector-tile"
+            )
+            assert "max-age" in response.headers["cache-control"]
+            # feature properties are stored as plain strings in the tile
+            assert c.name.encode() in response.content
+
+            # boston is in the western half of the map at zoom 1
+            response = test_client.get("/campsites/tiles/1/1/0.pbf")
+            assert c.name.encode() not in response.content
+
+        def test_campsites_tile_filter(self, test_client, campsite_factory):
+            campsite_factory.create(lat=42.36, lon=-71.06, has_showers=False)
+
+            response = test_client.get(
+                "/campsites/tiles/0/0/0.pbf", params={"has_showers": True}
+            )
+            assert response.status_code == 200
+            assert response.content == b""
+
+        def test_campsites_tile_not_modified(self, test_client, campsite_factory):
+            campsite_factory.create(lat=42.36, lon=-71.06)
+
+            response = test_client.get("/campsites/tiles/0/0/0.pbf")
+            response = test_client.get(
+                "/campsites/tiles/0/0/0.pbf",
+                headers={"If-None-Match": response.headers["etag"]},
+            )
+            assert response.status_code == 304
+
+        def test_campsites_tile_out_of_range(self, test_client):
+            response = test_client.get("/campsites/tiles/1/2/0.pbf")
+            assert response.status_code == 404
+
     class TestPostCampsite:
         def test_post_campsite(self, test_client, db_session):
             c = CampsiteDTO(
@@ -190,6 +898,8 @@ class TestCampsitesRouter:
             assert data.name == "fizzbang"
             assert data.campsite_type == "AUTH"
 
+            # the update was committed by the app's session; reload the factory's copy
+            db_session.expire_all()
             db_c = db_session.query(Campsite).all()
             assert len(db_c) == 1
             assert db_c[0].name == "fizzbang"
@@ -229,18 +939,232 @@ class TestCampsitesRouter:
         def test_upload_campsites(self, test_client, db_session, tmp_path):
             p = tmp_path / "test.csv"
             p.write_text(example_csv_content)
-            with open(p, "rb") as f:
-                response = test_client.post("/campsites/upload", files={"csv_file": f})
+            job = upload_campsites(test_client, p)
 
-            assert response.status_code == 200
+            assert job["state"] == "succeeded"
+            assert job["rows_processed"] == 4
+            assert job["result"]["rows"] == 4
 
             db_c = db_session.query(Campsite).all()
             assert len(db_c) == 4
+            # geo is computed in SQL from lon/lat
+            assert (
+                db_session.scalar(
+                    select(func.count())
+                    .select_from(Campsite)
+                    .filter(
+                        func.ST_X(Campsite.geo) == Campsite.lon,
+                        func.ST_Y(Campsite.geo) == Campsite.lat,
+                    )
+                )
+                == 4
+            )
+
+        def test_upload_campsites_twice(self, test_client, db_session, tmp_path):
+            p = tmp_path / "test.csv"
+            p.write_text(example_csv_content)
+            for _ in range(2):
+                job = upload_campsites(test_client, p)
+
+            result = job["result"]
+            assert (result["inserted"], result["unchanged"]) == (0, 4)
+            assert len(db_session.query(Campsite).all()) == 4
+
+        def test_upload_campsites_upsert(self, test_client, db_session, tmp_path):
+            p = tmp_path / "test.csv"
+            p.write_text(example_csv_content)
+            upload_campsites(test_client, p)
+
+            # change the phone number of the first row and drop the last one
+            header, *rows = example_csv_content.strip().split("\n")
+            rows[0] = rows[0].replace("860.283.8088,", "860.283.9999,")
+            p.write_text("\n".join([header, *rows[:-1]]) + "\n")
+            job = upload_campsites(test_client, p, mode="upsert", prune=True)
+
+            assert job["state"] == "succeeded"
+            result = job["result"]
+            assert (
+                result["inserted"],
+                result["updated"],
+                result["unchanged"],
+                result["deleted"],
+            ) == (0, 1, 2, 1)
+            db_session.expire_all()
+            campsites = db_session.query(Campsite).all()
+            assert len(campsites) == 3
+            assert "8602839999" in [c.phone for c in campsites]
+
+        def test_upload_campsites_moved_coordinates(
+            self, test_client, db_session, tmp_path
+        ):
+            p = tmp_path / "test.csv"
+            p.write_text(example_csv_content)
+            upload_campsites(test_client, p)
+
+            # coordinates are not part of the natural key, so the campsite is
+            # updated, not replaced
+            p.write_text(
+                example_csv_content.replace("-73.098,41.651,", "-73.0981,41.6512,")
+            )
+            job = upload_campsites(test_client, p, mode="upsert", prune=True)
+
+            result = job["result"]
+            assert (
+                result["inserted"],
+                result["updated"],
+                result["unchanged"],
+                result["deleted"],
+            ) == (0, 1, 3, 0)
+            db_session.expire_all()
+            assert -73.0981 in [c.lon for c in db_session.query(Campsite).all()]
+
+        def test_upload_campsites_natural_keys_distinct(self, db_session):
+            # keys differing only by a NULL or empty code, or by where a "|"
+            # falls, are different campsites
+            items = [
+                CampsiteDTO(
+                    name=name,
+                    code=code,
+                    state="CA",
+                    country="USA",
+                    lon=-71.0,
+                    lat=42.0,
+                    composite=name,
+                )
+                for code, name in [(None, "a"), ("", "a"), ("x|y", "z"), ("x", "y|z")]
+            ]
+            service = CampsitesService(db_session)
+
+            result = service.bulk_create(items)
+            assert result.inserted == 4
+            assert db_session.query(Campsite).count() == 4
+
+            result = service.bulk_create(items, update=True, prune=True)
+            assert (result.inserted, result.unchanged, result.deleted) == (0, 4, 0)
+            assert db_session.query(Campsite).count() == 4
+
+        def test_upload_campsites_prune_refused_with_row_errors(
+            self, test_client, db_session, tmp_path
+        ):
+            p = tmp_path / "test.csv"
+            p.write_text(example_csv_content)
+            upload_campsites(test_client, p)
+
+            # the last campsite's row is malformed, so it is rejected, and must
+            # not be taken for a campsite missing from the file
+            header, *rows = example_csv_content.strip().split("\n")
+            rows[0] = rows[0].replace("860.283.8088,", "860.283.9999,")
+            rows[-1] = rows[-1].replace(",CT,", ",XX,")
+            p.write_text("\n".join([header, *rows]) + "\n")
+            job = upload_campsites(test_client, p, mode="upsert", prune=True)
+
+            assert job["state"] == "failed"
+            assert job["num_errors"] == 1
+            assert "without prune" in job["detail"]
+            db_session.expire_all()
+            campsites = db_session.query(Campsite).all()
+            assert len(campsites) == 4
+            assert "8602839999" not in [c.phone for c in campsites]
+
+        def test_upload_campsites_row_errors(self, test_client, db_session, tmp_path):
+            p = tmp_path / "test.csv"
+            bad_row = example_incorrect_csv_content.strip().split("\n")[1]
+            p.write_text(example_csv_content + bad_row + "\n")
+            job = upload_campsites(test_client, p)
+
+            assert job["state"] == "succeeded"
+            assert job["result"]["rows"] == 4
+            assert job["num_errors"] == 1
+            assert job["errors"][0]["line"] == 6
+            assert len(db_session.query(Campsite).all()) == 4
 
         def test_upload_campsites_wrong_data(self, test_client, db_session, tmp_path):
             p = tmp_path / "test.csv"
             p.write_text(example_incorrect_csv_content)
+            job = upload_campsites(test_client, p)
+
+            assert job["state"] == "failed"
+            assert job["detail"] == "CSV file has no valid rows."
+            assert job["num_errors"] == 1
+
+        def test_upload_campsites_empty_file(self, test_client, tmp_path):
+            p = tmp_path / "test.csv"
+            p.write_text("")
+            job = upload_campsites(test_client, p)
+
+            assert job["state"] == "failed"
+            assert job["detail"] == "Empty file uploaded."
+
+        def test_get_upload_job_not_found(self, test_client):
+            response = test_client.get(f"/campsites/upload/{uuid.uuid4()}")
+            assert response.status_code == 404
+
+
+class TestPlacesRouter:
+    class TestListPlaces:
+        def test_list_places_fields(self, test_client, geographical_name_factory):
+            p = geographical_name_factory.create()
+
+            response = test_client.get("/places", params={"fields": "name"})
+            assert response.status_code == 200
+            assert response.json() == [{"id": str(p.id), "name": p.name}]
+            assert response.headers["X-Total-Count"] == "1"
+
+    class TestPlacesTiles:
+        def test_places_tile(self, test_client, geographical_name_factory):
+            p = geographical_name_factory.create(lat=42.36, lon=-71.06)
+
+            response = test_client.get("/places/tiles/0/0/0.pbf")
+            assert response.status_code == 200
+            assert p.name.encode() in response.content
+
+    class TestUploadPlaces:
+        def test_upload_places(self, test_client, db_session, tmp_path):
+            p = tmp_path / "places.csv"
+            p.write_text(
+                example_places_csv_content + "1,Nowhere,,,,ZZ,0,0\n", encoding="utf-8"
+            )
             with open(p, "rb") as f:
-                response = test_client.post("/campsites/upload", files={"csv_file": f})
+                response = test_client.post("/places/upload", files={"csv_file": f})
+
+            assert response.status_code == 200
+            data = response.json()
+            assert (data["rows"], data["num_errors"]) == (3, 1)
+            assert data["errors"][0]["line"] == 5
+
+            places = db_session.query(GeographicalName).all()
+            assert sorted(p.search_str for p in places) == [
+                "blue hills reservation ma",
+                "boston ma",
+                "montreal qc",
+            ]
+
+            response = test_client.get("/places/autocomplete", params={"q": "mont"})
+            assert [item["name"] for item in response.json()] == ["Montréal"]
+
+        def test_upload_places_no_valid_rows(self, test_client, tmp_path):
+            p = tmp_path / "places.csv"
+            header = example_places_csv_content.split("\n")[0]
+            p.write_text(header + "\n1,Nowhere,,,,ZZ,0,0\n")
+            with open(p, "rb") as f:
+                response = test_client.post("/places/upload", files={"csv_file": f})
+
+            assert response.status_code == 422
+            assert response.json()["detail"]["num_errors"] == 1
+
+    class TestAutocompletePlaces:
+        def test_autocomplete_places(self, test_client, geographical_name_factory):
+            p = geographical_name_factory.create(name="Boston", search_str="boston ma")
+            geographical_name_factory.create(
+                name="Worcester", search_str="worcester ma"
+            )
+
+            response = test_client.get("/places/autocomplete", params={"q": "Bos"})
+            assert response.status_code == 200
+
+            data = response.json()
+            assert [item["id"] for item in data] == [str(p.id)]
 
+        def test_autocomplete_places_missing_query(self, test_client):
+            response = test_client.get("/places/autocomplete")
             assert response.status_code == 422
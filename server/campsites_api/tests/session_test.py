@@ -0,0 +1,82 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from campsites_db.session import (
+    EngineSettings,
+    PoolMetrics,
+    metered_pool,
+    pool_stats,
+)
+
+
+class TestEngineSettings:
+    def test_defaults(self):
+        assert EngineSettings.from_env({}) == EngineSettings()
+        assert EngineSettings().echo is False
+
+    def test_from_env(self):
+        settings = EngineSettings.from_env(
+            {
+                "DATABASE_POOL_SIZE": "20",
+                "DATABASE_MAX_OVERFLOW": "0",
+                "DATABASE_POOL_TIMEOUT": "2.5",
+                "DATABASE_POOL_RECYCLE": "-1",
+                "DATABASE_STATEMENT_TIMEOUT": "5000",
+                "DATABASE_ECHO": "true",
+            }
+        )
+
+        assert settings == EngineSettings(
+            pool_size=20,
+            max_overflow=0,
+            pool_timeout=2.5,
+            pool_recycle=-1,
+            statement_timeout=5000,
+            echo=True,
+        )
+
+
+class TestPoolMetrics:
+    def test_checkouts_and_timeouts(self):
+        engine = create_engine(
+            "sqlite://",
+            poolclass=metered_pool(QueuePool, PoolMetrics()),
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.05,
+        )
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            stats = pool_stats(engine)
+            assert stats["checked_out"] == 1
+            assert stats["size"] == 1
+
+            # the only connection is checked out, so the next checkout times out
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+
+        stats = pool_stats(engine)
+        assert stats["checkouts"] == 1
+        assert stats["checkout_failures"] == 1
+        assert stats["checkout_timeouts"] == 1
+        assert stats["checked_out"] == 0
+        assert stats["overflow"] == 0
+        assert stats["wait_seconds_max"] >= 0.05
+        assert stats["wait_seconds_mean"] == stats["wait_seconds_total"] / 2
+
+    def test_metrics_survive_dispose(self):
+        engine = create_engine(
+            "sqlite://", poolclass=metered_pool(QueuePool, PoolMetrics())
+        )
+        with engine.connect():
+            pass
+        engine.dispose()
+        with engine.connect():
+            pass
+
+        assert pool_stats(engine)["checkouts"] == 2
+
+    def test_unmetered_engine(self):
+        assert pool_stats(create_engine("sqlite://")) == {}
@@ -0,0 +1,55 @@
+import time
+
+from fastapi import HTTPException
+
+from campsites_api.dto.campsites import IngestResultDTO
+from campsites_api.services.upload_jobs import UploadJob, UploadJobs
+
+
+def wait(job: UploadJob) -> UploadJob:
+    for _ in range(200):
+        if job.finished:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("upload job did not finish")
+
+
+class TestUploadJobs:
+    def test_upload_job_succeeded(self):
+        def process(job: UploadJob) -> IngestResultDTO:
+            rows = list(job.track([[1, 2], [3]]))
+            job.errors.add(5, "Invalid values for: lat")
+            return IngestResultDTO(rows=len(rows), seconds=1.0, rows_per_second=3.0)
+
+        jobs = UploadJobs()
+        job = wait(jobs.submit(process))
+
+        assert jobs.get(job.id) is job
+        data = job.dto()
+        assert data.state == "succeeded"
+        assert data.rows_processed == 3
+        assert data.result.rows == 3
+        assert (data.num_errors, data.errors[0].line) == (1, 5)
+
+    def test_upload_job_failed(self):
+        def http_error(job: UploadJob):
+            raise HTTPException(status_code=422, detail={"message": "No rows."})
+
+        def error(job: UploadJob):
+            raise RuntimeError("boom")
+
+        jobs = UploadJobs()
+        assert wait(jobs.submit(http_error)).detail == "No rows."
+        job = wait(jobs.submit(error))
+        assert job.state == "failed"
+        assert job.detail == "Upload could not be processed."
+
+    def test_upload_jobs_forget_finished(self):
+        jobs = UploadJobs(kept=1)
+        first = wait(jobs.submit(lambda job: None))
+        second = wait(jobs.submit(lambda job: None))
+        jobs.submit(lambda job: None)
+
+        assert jobs.get(first.id) is None
+        assert jobs.get(second.id) is second
+        assert jobs.get("unknown") is None
@@ -0,0 +1,124 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from pydantic import BaseModel
+
+# every cache created, by name, so their stats can be reported together
+caches: Dict[str, "TTLCache"] = {}
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries also expire `ttl` seconds
+    after being set, or never if `ttl` is None. Keeps hit/miss/eviction counts for
+    `stats()`.
+
+    Caches are registered in `caches` under their name.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: Optional[float] = 300.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        caches[name] = self
+
+    def get(self, key: Hashable) -> Tuple[bool, Optional[Any]]:
+        """
+        Looks up a key
+
+        Parameters:
+            key (Hashable): cache key
+
+        Returns:
+            hit (bool), value (Any | None): whether the key was found and not
+                expired, and its value
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Stores a value, evicting the least recently used entry if the cache is full
+
+        Parameters:
+            key (Hashable): cache key
+            value (Any): value to store
+        """
+        with self._lock:
+            expires_at = math.inf if self.ttl is None else time.monotonic() + self.ttl
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        """
+        Removes every entry
+        """
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def canonical_key(value: Any) -> Hashable:
+    """
+    Converts a filter dict (or any value within it) into a hashable canonical form,
+    so that equivalent filters give equal keys: None values are dropped, keys are
+    sorted, lists are sorted, enums are replaced by their values, and pydantic
+    models are converted like dicts.
+
+    Parameters:
+        value (Any): value to convert
+
+    Returns:
+        key (Hashable): canonical form of the value
+    """
+    if isinstance(value, BaseModel):
+        value = value.model_dump()
+    if isinstance(value, dict):
+        return tuple(
+            sorted(
+                (name, canonical_key(item))
+                for name, item in value.items()
+                if item is not None
+            )
+        )
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted(canonical_key(item) for item in value))
+    if isinstance(value, Enum):
+        return value.value
+    return value
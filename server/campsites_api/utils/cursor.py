@@ -0,0 +1,72 @@
+import base64
+import json
+import uuid
+from enum import Enum
+from typing import Any, List, Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """
+    Encodes a list of JSON-serialisable values (enums are stored by value) into an
+    opaque, url-safe cursor string.
+
+    Parameters:
+        values (List[Any]): values to encode
+
+    Returns:
+        cursor (str): url-safe base64 string
+    """
+    values = [v.value if isinstance(v, Enum) else v for v in values]
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """
+    Decodes a cursor created by `encode_cursor`. Raises a 422 HTTP exception if the
+    cursor is malformed.
+
+    Parameters:
+        cursor (str): cursor string
+
+    Returns:
+        values (List[Any]): decoded values
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=422, detail="Invalid cursor.")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=422, detail="Invalid cursor.")
+    return values
+
+
+def decode_keyset_cursor(
+    cursor: str, sort_by: str, sort_dir: str
+) -> Tuple[Any, uuid.UUID]:
+    """
+    Decodes a keyset cursor of a list sorted by `sort_by` in `sort_dir` order, as
+    encoded by `AbstractService.list()`. Raises a 422 HTTP exception if the cursor
+    is malformed or was made for another sort order.
+
+    Parameters:
+        cursor (str): cursor string
+        sort_by (str): sort column of the list
+        sort_dir (str): sort direction of the list
+
+    Returns:
+        value (Any), id (uuid.UUID): sort value and id of the previous page's
+            last item
+    """
+    values = decode_cursor(cursor)
+    if len(values) != 4 or values[:2] != [sort_by, sort_dir]:
+        raise HTTPException(
+            status_code=422, detail="Cursor does not match sort_by and sort_dir."
+        )
+    try:
+        return values[2], uuid.UUID(values[3])
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=422, detail="Invalid cursor.")
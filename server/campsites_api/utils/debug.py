@@ -0,0 +1,122 @@
+import logging
+import os
+import random
+import secrets
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+from fastapi import Header, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger(__name__)
+
+# token admin-only requests must send in the `X-Admin-Token` header; admin-only
+# features are disabled if it is not set
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """
+    Dependency rejecting requests without the admin token with a 403
+    """
+    if not (
+        ADMIN_TOKEN
+        and x_admin_token
+        and secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode())
+    ):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+def explain_requested(
+    explain: bool = Query(
+        False,
+        description="Return the plans of the list statements (admin only)",
+    ),
+    x_explain: bool = Header(False),
+    x_admin_token: Optional[str] = Header(None),
+) -> bool:
+    """
+    Dependency telling whether the request asked for the plans of its statements,
+    with the `explain` query flag or the `X-Explain` header. Such requests must be
+    made by an admin, as they run the statements again under EXPLAIN ANALYZE.
+    """
+    if explain or x_explain:
+        require_admin(x_admin_token)
+        return True
+    return False
+
+
+class SlowPlanLog:
+    """
+    Thread-safe log of the most recent `maxsize` explained requests whose
+    statements took at least `threshold_ms` to execute in total. Also decides
+    which requests are explained though they did not ask for it: each with a
+    probability of `sample_rate`, like postgres' auto_explain.
+    """
+
+    def __init__(self, threshold_ms: float, sample_rate: float, maxsize: int = 100):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=maxsize)
+        self._lock = threading.Lock()
+
+    def sample(self) -> bool:
+        """
+        Whether to explain a request that did not ask for it
+        """
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def record(self, route: str, filters: Dict, plans: Sequence[Any]) -> bool:
+        """
+        Logs the plans of a request's statements, if they took at least the
+        threshold to execute
+
+        Parameters:
+            route (str): route of the request
+            filters (Dict): filters of the request
+            plans (Sequence[ExplainedStatement]): the explained statements
+
+        Returns:
+            logged (bool): whether the plans were slow enough to be logged
+        """
+        execution_ms = sum(plan.execution_ms for plan in plans)
+        if execution_ms < self.threshold_ms:
+            return False
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "route": route,
+            "execution_ms": execution_ms,
+            "filters": jsonable_encoder(
+                {name: value for name, value in filters.items() if value is not None}
+            ),
+            "statements": [jsonable_encoder(plan._asdict()) for plan in plans],
+        }
+        with self._lock:
+            self._entries.append(entry)
+        logger.warning(
+            "slow plan: %s took %.1f ms with filters %s",
+            route,
+            execution_ms,
+            entry["filters"],
+        )
+        return True
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """
+        The logged plans, most recent first
+        """
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+slow_plans = SlowPlanLog(
+    threshold_ms=float(os.environ.get("SLOW_PLAN_THRESHOLD_MS", 200)),
+    sample_rate=float(os.environ.get("SLOW_PLAN_SAMPLE_RATE", 0)),
+    maxsize=int(os.environ.get("SLOW_PLAN_LOG_SIZE", 100)),
+)
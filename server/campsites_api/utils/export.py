@@ -0,0 +1,103 @@
+import csv
+import io
+import json
+import uuid
+from enum import Enum
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, List
+
+from campsites_api.dto.campsites import ExportFormatEnum
+
+# media type and file extension of each export format
+EXPORT_MEDIA_TYPES = {
+    ExportFormatEnum.ndjson: "application/x-ndjson",
+    ExportFormatEnum.geojson: "application/geo+json",
+    ExportFormatEnum.csv: "text/csv",
+}
+EXPORT_EXTENSIONS = {
+    ExportFormatEnum.ndjson: "ndjson",
+    ExportFormatEnum.geojson: "geojson",
+    ExportFormatEnum.csv: "csv",
+}
+
+
+def plain(value: Any) -> Any:
+    """
+    Converts a column value to a JSON or CSV scalar: enums to their value and
+    UUIDs to strings
+    """
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _json(value: Any) -> str:
+    return json.dumps(value, default=plain, ensure_ascii=False, separators=(",", ":"))
+
+
+def ndjson_lines(rows: List[Dict], fields: List[str]) -> str:
+    return "".join(
+        _json({name: plain(row[name]) for name in fields}) + "\n" for row in rows
+    )
+
+
+def geojson_features(rows: List[Dict], fields: List[str]) -> str:
+    return ",".join(
+        _json(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [row["lon"], row["lat"]]},
+                "properties": {name: plain(row[name]) for name in fields},
+            }
+        )
+        for row in rows
+    )
+
+
+def csv_lines(rows: List[Dict], fields: List[str]) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([plain(row[name]) for name in fields] for row in rows)
+    return buffer.getvalue()
+
+
+async def encode_export(
+    batches: AsyncIterable[List[Dict]],
+    fields: List[str],
+    format: ExportFormatEnum,
+) -> AsyncIterator[bytes]:
+    """
+    Encodes batches of rows into an export file, one chunk per batch, so that
+    only one batch is held in memory at a time.
+
+    GeoJSON features are points at the rows' lat/lon, which must be in the rows
+    even if not in `fields`.
+
+    Parameters:
+        batches (AsyncIterable[List[Dict]]): batches of rows, as dicts of columns
+        fields (List[str]): columns written for each row, in order
+        format (ExportFormatEnum): file format
+
+    Returns:
+        chunks (AsyncIterator[bytes]): the encoded file, in chunks
+    """
+    encode: Callable[[List[Dict], List[str]], str] = {
+        ExportFormatEnum.ndjson: ndjson_lines,
+        ExportFormatEnum.geojson: geojson_features,
+        ExportFormatEnum.csv: csv_lines,
+    }[format]
+    separator = ""
+    if format == ExportFormatEnum.geojson:
+        yield b'{"type":"FeatureCollection","features":['
+    elif format == ExportFormatEnum.csv:
+        yield csv_lines([dict(zip(fields, fields))], fields).encode()
+    async for rows in batches:
+        if not rows:
+            continue
+        chunk = encode(rows, fields)
+        yield (separator + chunk).encode()
+        if format == ExportFormatEnum.geojson:
+            separator = ","
+    if format == ExportFormatEnum.geojson:
+        yield b"]}"
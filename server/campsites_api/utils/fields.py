@@ -0,0 +1,52 @@
+from typing import Any, Dict, List, Optional, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+
+def parse_fields(fields: Optional[str], dto: Type[BaseModel]) -> Optional[List[str]]:
+    """
+    Parses a comma-separated `fields` query parameter into a list of DTO field
+    names. `id` is always included. Raises a 422 HTTP exception for unknown fields.
+
+    Parameters:
+        fields (str | None): comma-separated field names
+        dto (Type[BaseModel]): DTO the field names must belong to
+
+    Returns:
+        fields (List[str] | None): field names, or None if all fields are requested
+    """
+    if not fields:
+        return None
+    names = ["id"]
+    for name in fields.split(","):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    unknown = [name for name in names if name not in dto.model_fields]
+    if unknown:
+        raise HTTPException(
+            status_code=422, detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    return names
+
+
+def attribute(item: Any, name: str) -> Any:
+    """
+    Reads an attribute of an item, or a key if the item is a dict of column values
+    """
+    return item[name] if isinstance(item, dict) else getattr(item, name)
+
+
+def project(item: Any, fields: List[str]) -> Dict[str, Any]:
+    """
+    Reads only the given attributes of an item into a dict
+
+    Parameters:
+        item (Any): object to read, e.g. a model instance or a dict of columns
+        fields (List[str]): attribute names
+
+    Returns:
+        values (Dict[str, Any]): attribute values by name
+    """
+    return {name: attribute(item, name) for name in fields}
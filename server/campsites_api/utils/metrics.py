@@ -0,0 +1,294 @@
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Engine, event
+
+# upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# upper bounds of the buckets of SQL statements per request
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+# media type of the Prometheus text exposition format
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# every histogram created, by name, so they can be rendered together
+histograms: Dict[str, "Histogram"] = {}
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Thread-safe Prometheus histogram, with one series per combination of label
+    values. Histograms are registered in `histograms` under their name.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> (count per bucket, with +Inf last; sum)
+        self._series: Dict[Tuple, Tuple[List[int], float]] = {}
+        self._lock = threading.Lock()
+        histograms[name] = self
+
+    def observe(self, value: float, *label_values: Any) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(label_values) or (
+                [0] * (len(self.buckets) + 1),
+                0.0,
+            )
+            counts[i] += 1
+            self._series[label_values] = (counts, total + value)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = sorted(
+                (values, list(counts), total)
+                for values, (counts, total) in self._series.items()
+            )
+        for values, counts, total in series:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, float("inf")], counts):
+                cumulative += count
+                labels = _labels([*self.labels, "le"], [*values, _number(bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render_gauges(
+    name: str,
+    description: str,
+    labels: Sequence[str],
+    values: Dict[Tuple, Optional[float]],
+    kind: str = "gauge",
+) -> List[str]:
+    """
+    Renders a gauge or counter with one sample per combination of label values;
+    samples whose value is None are left out
+    """
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    for label_values, value in sorted(values.items()):
+        if value is not None:
+            lines.append(f"{name}{_labels(labels, label_values)} {_number(value)}")
+    return lines
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle a request, until its response is sent, by route and status",
+    ["method", "route", "status"],
+)
+request_sql_statements = Histogram(
+    "http_request_sql_statements",
+    "SQL statements executed per request, by route",
+    ["method", "route"],
+    STATEMENT_BUCKETS,
+)
+request_sql_duration = Histogram(
+    "http_request_sql_seconds",
+    "Time spent executing SQL statements per request, by route",
+    ["method", "route"],
+)
+sql_duration = Histogram(
+    "sql_statement_duration_seconds",
+    "Time to execute a SQL statement, in and outside of requests",
+)
+
+
+class RequestSQL:
+    """
+    SQL statements executed while handling a request, and the time they took
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+# SQL of the request being handled, shared with the tasks, threads and greenlets
+# the request runs SQL in, which copy the context
+request_sql: ContextVar[Optional[RequestSQL]] = ContextVar("request_sql", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_started_at"].pop()
+    sql_duration.observe(elapsed)
+    sql = request_sql.get()
+    if sql is not None:
+        sql.statements += 1
+        sql.seconds += elapsed
+
+
+def _handle_error(context) -> None:
+    started_at = (
+        context.connection.info.get("metrics_started_at")
+        if context.connection
+        else None
+    )
+    if started_at:
+        started_at.pop()
+
+
+def instrument_sql() -> None:
+    """
+    Times every statement executed by any engine, with engine events
+    """
+    for name, listener in [
+        ("before_cursor_execute", _before_cursor_execute),
+        ("after_cursor_execute", _after_cursor_execute),
+        ("handle_error", _handle_error),
+    ]:
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency of every HTTP request, and the SQL
+    statements it executed, by method, route template (e.g.
+    `/campsites/campsite/{campsite_uuid4}`) and status. Requests that match no
+    route are recorded as route "unmatched".
+
+    Responses also get a `Server-Timing` header with the SQL time and count and
+    the time taken until the response started, which tells apart time spent in
+    the database from time spent building the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        instrument_sql()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        sql = RequestSQL()
+        token = request_sql.set(sql)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timing = (
+                    f'sql;dur={sql.seconds * 1000:.1f};desc="{sql.statements} '
+                    f'statements", app;dur={(time.perf_counter() - start) * 1000:.1f}'
+                )
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"server-timing", timing.encode("latin-1")),
+                    ],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_sql.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            request_duration.observe(time.perf_counter() - start, method, path, status)
+            request_sql_statements.observe(sql.statements, method, path)
+            request_sql_duration.observe(sql.seconds, method, path)
+
+
+def render_metrics(
+    cache_stats: Dict[str, Dict[str, Any]],
+    pool_stats: Dict[str, Dict[str, Any]],
+) -> str:
+    """
+    Renders every histogram, and cache and connection pool stats, in the
+    Prometheus text format
+
+    Parameters:
+        cache_stats (Dict[str, Dict[str, Any]]): `TTLCache.stats()` by cache name
+        pool_stats (Dict[str, Dict[str, Any]]): `pool_stats()` by engine name
+
+    Returns:
+        metrics (str): the exposition
+    """
+    lines: List[str] = []
+    for histogram in histograms.values():
+        lines.extend(histogram.render())
+
+    cache_metrics = [
+        ("cache_hits_total", "hits", "Cache lookups that found an entry", "counter"),
+        ("cache_misses_total", "misses", "Cache lookups that found none", "counter"),
+        ("cache_hit_ratio", "hit_ratio", "Share of cache lookups that hit", "gauge"),
+        ("cache_entries", "size", "Entries in the cache", "gauge"),
+        ("cache_evictions_total", "evictions", "Entries evicted", "counter"),
+        ("cache_invalidations_total", "invalidations", "Cache clears", "counter"),
+    ]
+    for name, key, description, kind in cache_metrics:
+        values = {(cache,): stats.get(key) for cache, stats in cache_stats.items()}
+        lines.extend(render_gauges(name, description, ["cache"], values, kind))
+
+    pool_metrics = [
+        ("db_pool_size", "size", "Connections kept in the pool", "gauge"),
+        ("db_pool_checked_out", "checked_out", "Connections in use", "gauge"),
+        ("db_pool_overflow", "overflow", "Connections over the pool size", "gauge"),
+        ("db_pool_checkouts_total", "checkouts", "Connection checkouts", "counter"),
+        (
+            "db_pool_checkout_failures_total",
+            "checkout_failures",
+            "Connection checkouts that failed, including timeouts",
+            "counter",
+        ),
+        (
+            "db_pool_checkout_timeouts_total",
+            "checkout_timeouts",
+            "Connection checkouts that timed out on an exhausted pool",
+            "counter",
+        ),
+        (
+            "db_pool_wait_seconds_total",
+            "wait_seconds_total",
+            "Time spent waiting for connections",
+            "counter",
+        ),
+    ]
+    for name, key, description, kind in pool_metrics:
+        values = {(engine,): stats.get(key) for engine, stats in pool_stats.items()}
+        lines.extend(render_gauges(name, description, ["engine"], values, kind))
+    return "\n".join(lines) + "\n"
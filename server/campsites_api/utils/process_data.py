@@ -1,72 +1,290 @@
+import asyncio
 import codecs
 import csv
-from typing import List
+import os
+from itertools import islice
+from typing import (
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 
 from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
 
 import campsites_api.utils.process_data_utils as ut
-from campsites_api.dto.campsites import CampsiteDTO
+from campsites_api.dto.campsites import CampsiteDTO, IngestResultDTO
+from campsites_db.ingest import IngestResult
 
+# number of processed campsites handed to the database writer at a time
+UPLOAD_BATCH_SIZE = int(os.environ.get("UPLOAD_BATCH_SIZE", 1000))
+# most row errors kept for the upload's error report
+MAX_ROW_ERRORS = 100
+# number of raw rows normalised column-wise at a time
+NORMALIZE_BATCH_SIZE = 512
 
-def process_data(file: UploadFile) -> List[CampsiteDTO]:
+
+class RowError(NamedTuple):
+    # line of the CSV file, counting the header as line 1
+    line: int
+    error: str
+
+
+class RowErrors:
+    """
+    Per-row error report of an upload. Keeps the first `MAX_ROW_ERRORS` errors
+    and counts the rest.
+    """
+
+    def __init__(self):
+        self.errors: List[RowError] = []
+        self.count = 0
+
+    def add(self, line: int, error: str) -> None:
+        self.count += 1
+        if len(self.errors) < MAX_ROW_ERRORS:
+            self.errors.append(RowError(line, error))
+
+
+def read_rows(file: UploadFile) -> Iterator[Tuple[int, Dict]]:
     """
-    Takes in a csv file containing campsite data, returns a list of processed
-    CampsiteDTO objects.
+    Decode stage: reads the uploaded CSV one row at a time. Raises a 422 HTTP
+    exception, when called, if the file has no header.
 
     Parameters:
         file (UploadFile): file uploaded via API
 
     Returns:
-        processed_campsites (List[CampsiteDTO]): phone number as string
-            of numbers only (or None)
+        rows (Iterator[Tuple[int, Dict]]): (line number, raw row) pairs
     """
-    raw_rows = []
-
     reader = csv.DictReader(codecs.iterdecode(file.file, "utf-8"))
-    for row in reader:
-        raw_rows.append(row)
-
-    if len(raw_rows) == 0:
+    if reader.fieldnames is None:
         raise HTTPException(status_code=422, detail="Empty file uploaded.")
 
-    # using a typed list so it auto-converts values and gives helpful
-    # failures for unclean data
-    processed_campsites: List[CampsiteDTO] = []
-
-    # process each row
-    for row in raw_rows:
-        # go through all values and strip spaces.
-        # also change values to null if empty string
-        row = {k: v.strip() if v.strip() != "" else None for (k, v) in row.items()}
-
-        # a few entries have "dispersed" for number of campsites; as this is not
-        # a known number, setting value to null
-        row["num_campsites"] = (
-            row["num_campsites"]
-            if row["num_campsites"] is not None and row["num_campsites"].isdigit()
-            else None
-        )
+    def rows() -> Iterator[Tuple[int, Dict]]:
+        try:
+            for row in reader:
+                yield reader.line_num, row
+        finally:
+            file.file.close()
+
+    return rows()
 
-        # casting campsite type correctly
-        row["campsite_type"] = row["type"]
 
-        # phone number
-        row["phone"] = ut.process_phone_number(row["phone"])
+def normalize_row(row: Dict) -> Dict:
+    """
+    Normalise stage: converts a raw CSV row into CampsiteDTO fields.
+
+    Parameters:
+        row (Dict): raw row
+
+    Returns:
+        row (Dict): phone number as string of numbers only (or None), months,
+            country and amenities parsed
+    """
+    # go through all values and strip spaces.
+    # also change values to null if empty string
+    row = {
+        k: v.strip() if v is not None and v.strip() != "" else None
+        for (k, v) in row.items()
+    }
+
+    # a few entries have "dispersed" for number of campsites; as this is not
+    # a known number, setting value to null
+    row["num_campsites"] = (
+        row["num_campsites"]
+        if row["num_campsites"] is not None and row["num_campsites"].isdigit()
+        else None
+    )
+
+    # casting campsite type correctly
+    row["campsite_type"] = row["type"]
+
+    # phone number
+    row["phone"] = ut.process_phone_number(row["phone"])
+
+    # dates
+    dates = ut.process_dates(row["dates_open"])
+    row = row | dates
+
+    # country
+    row["country"] = ut.process_country(row["state"])
+
+    # amenities
+    amenities = ut.process_amenities(row["amenities"])
+    row = row | amenities
+    return row
+
+
+def normalize_rows(rows: List[Dict]) -> List[Dict]:
+    """
+    Column-wise variant of `normalize_row()`, for a batch of raw rows read from the
+    same file. Gives the same rows, except that has_rv_hookup is None rather than
+    missing when there is no hookup code. Raises if any row can't be normalised.
+
+    Parameters:
+        rows (List[Dict]): raw rows
+
+    Returns:
+        rows (List[Dict]): normalised rows
+    """
+    if not rows:
+        return []
+    names = list(rows[0])
+    if any(len(row) != len(names) for row in rows):
+        # rows with more values than the header keep them under a None key
+        raise ValueError("Rows have different columns")
+    columns = {
+        name: [
+            (value.strip() or None) if value is not None else None
+            for value in (row[name] for row in rows)
+        ]
+        for name in names
+    }
+
+    columns["num_campsites"] = [
+        value if value is not None and value.isdigit() else None
+        for value in columns["num_campsites"]
+    ]
+    columns["campsite_type"] = columns["type"]
+    columns["phone"] = ut.process_phone_numbers(columns["phone"])
+    columns.update(ut.process_dates_column(columns["dates_open"]))
+    columns["country"] = ut.process_countries(columns["state"])
+    columns.update(ut.process_amenities_column(columns["amenities"]))
 
-        # dates
-        dates = ut.process_dates(row["dates_open"])
-        row = row | dates
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
 
-        # country
-        row["country"] = ut.process_country(row["state"])
 
-        # amenities
-        amenities = ut.process_amenities(row["amenities"])
-        row = row | amenities
+def validate_rows(
+    rows: Iterable[Tuple[int, Dict]],
+    errors: RowErrors,
+    batch_size: int = NORMALIZE_BATCH_SIZE,
+) -> Iterator[CampsiteDTO]:
+    """
+    Normalise and validate stages: converts raw rows into CampsiteDTOs. Rows are
+    normalised column-wise in batches of `batch_size`; a batch with a row that
+    fails is normalised row by row instead. Rows that fail are skipped and added
+    to `errors`.
+
+    Parameters:
+        rows (Iterable[Tuple[int, Dict]]): (line number, raw row) pairs
+        errors (RowErrors): report to add failed rows to
+        batch_size (int): number of rows normalised at a time
+
+    Returns:
+        campsites (Iterator[CampsiteDTO]): valid campsites
+    """
+    for batch in batched(rows, batch_size):
         try:
-            processed_campsites.append(CampsiteDTO(**row))
+            normalized = normalize_rows([row for _, row in batch])
         except Exception:
-            raise HTTPException(status_code=422, detail="CSV file in incorrect format.")
+            normalized = None
+        for i, (line, row) in enumerate(batch):
+            if normalized is None:
+                campsite = _validate_row(line, row, errors, normalized=False)
+            else:
+                campsite = _validate_row(line, normalized[i], errors)
+            if campsite is not None:
+                yield campsite
+
+
+def _validate_row(
+    line: int, row: Dict, errors: RowErrors, normalized: bool = True
+) -> Optional[CampsiteDTO]:
+    try:
+        # using the DTO so it auto-converts values and gives helpful
+        # failures for unclean data
+        return CampsiteDTO(**(row if normalized else normalize_row(row)))
+    except ValidationError as e:
+        fields = ", ".join(str(error["loc"][0]) for error in e.errors())
+        errors.add(line, f"Invalid values for: {fields}")
+    except Exception as e:
+        errors.add(line, f"Could not be processed: {e!r}")
+    return None
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """
+    Batch stage: groups items into lists of `size` items; the last may be shorter
+    """
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def process_data(
+    file: UploadFile, errors: RowErrors, batch_size: int = UPLOAD_BATCH_SIZE
+) -> Iterator[List[CampsiteDTO]]:
+    """
+    Takes in a csv file containing campsite data, returns a lazy pipeline of
+    batches of processed CampsiteDTO objects. Only one batch is held in memory at
+    a time. Rows that fail to process are skipped and added to `errors`.
+
+    Raises a 422 HTTP exception if the file is empty.
+
+    Parameters:
+        file (UploadFile): file uploaded via API
+        errors (RowErrors): report to add failed rows to
+        batch_size (int): number of campsites per batch
+
+    Returns:
+        batches (Iterator[List[CampsiteDTO]]): batches of valid campsites
+    """
+    return batched(validate_rows(read_rows(file), errors), batch_size)
+
+
+async def iterate_in_thread(batches: Iterator[List]) -> AsyncIterator:
+    """
+    Iterates the items of a batch pipeline, processing each batch in a worker
+    thread, so that parsing a large upload does not block the event loop
+    """
+    while True:
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            return
+        for item in batch:
+            yield item
 
-    file.file.close()
-    return processed_campsites
+
+def upload_response(result: IngestResult, errors: RowErrors) -> IngestResultDTO:
+    """
+    Builds the response to an upload, with its error report. Raises a 422 HTTP
+    exception, with the error report, if no rows were loaded.
+
+    Parameters:
+        result (IngestResult): result of loading the upload
+        errors (RowErrors): rows of the upload that failed to process
+
+    Returns:
+        response (IngestResultDTO): upload counts and errors
+    """
+    errors_report = [error._asdict() for error in errors.errors]
+    if result.rows == 0:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "message": "CSV file has no valid rows.",
+                "num_errors": errors.count,
+                "errors": errors_report,
+            },
+        )
+    return IngestResultDTO(
+        rows=result.rows,
+        seconds=result.seconds,
+        rows_per_second=result.rows_per_second,
+        inserted=result.inserted,
+        updated=result.updated,
+        unchanged=result.unchanged,
+        deleted=result.deleted,
+        num_errors=errors.count,
+        errors=errors_report,
+    )
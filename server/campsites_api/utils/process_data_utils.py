@@ -1,5 +1,50 @@
 import re
-from typing import Union
+from functools import lru_cache
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
+
+# lookup tables, built once and shared by the per-row and column-wise functions
+NON_ALPHANUMERIC = re.compile("[^A-Za-z0-9]+")
+# str.translate() table deleting the characters NON_ALPHANUMERIC matches in ASCII
+ASCII_NON_ALPHANUMERIC = dict.fromkeys(i for i in range(128) if not chr(i).isalnum())
+MONTHS = {
+    "jan": 1,
+    "feb": 2,
+    "mar": 3,
+    "apr": 4,
+    "may": 5,
+    "jun": 6,
+    "jul": 7,
+    "aug": 8,
+    "sep": 9,
+    "oct": 10,
+    "nov": 11,
+    "dec": 12,
+}
+CANADIAN_PROVINCES = frozenset(
+    ["AB", "BC", "MB", "NB", "NL", "NT", "NS", "NU", "ON", "PE", "QC", "SK", "YT"]
+)
+TOILET_TYPES = {
+    "FT": "flush",
+    "VT": "vault",
+    "FTVT": "mixed",
+    "PT": "pit",
+}
+# keys of `process_amenities()`; has_rv_hookup is only set with a hookup code
+AMENITY_COLUMNS = [
+    "has_rv_hookup",
+    "has_water_hookup",
+    "has_electric_hookup",
+    "has_sewer_hookup",
+    "has_sanitary_dump",
+    "max_rv_length",
+    "has_toilets",
+    "toilet_type",
+    "has_drinking_water",
+    "has_showers",
+    "accepts_reservations",
+    "accepts_pets",
+    "low_no_fee",
+]
 
 
 def process_phone_number(phone_number_str: Union[str, None]) -> Union[str, None]:
@@ -14,7 +59,7 @@ def process_phone_number(phone_number_str: Union[str, None]) -> Union[str, None]
     """
     if phone_number_str is None:
         return None
-    return re.sub("[^A-Za-z0-9]+", "", phone_number_str)
+    return NON_ALPHANUMERIC.sub("", phone_number_str)
 
 
 def process_dates(date_open_str: Union[str, None]) -> dict:
@@ -41,41 +86,26 @@ def process_dates(date_open_str: Union[str, None]) -> dict:
         dates_dict["month_close"] = 12
         return dates_dict
 
-    dates_map = {
-        "jan": 1,
-        "feb": 2,
-        "mar": 3,
-        "apr": 4,
-        "may": 5,
-        "jun": 6,
-        "jul": 7,
-        "aug": 8,
-        "sep": 9,
-        "oct": 10,
-        "nov": 11,
-        "dec": 12,
-    }
-
     # replace "-" with spaces to ensure we get a clean split
     date_open_arr = date_open_str.replace("-", " ").split(" ")
     # find first string in array that contains a month
     open_str = date_open_arr.pop(0)
-    while open_str not in dates_map.keys() and len(date_open_arr) > 0:
+    while open_str not in MONTHS.keys() and len(date_open_arr) > 0:
         open_str = date_open_arr.pop(0)
-    for month in dates_map.keys():
+    for month in MONTHS.keys():
         if month == open_str:
-            dates_dict["month_open"] = dates_map[month]
+            dates_dict["month_open"] = MONTHS[month]
 
     if len(date_open_arr) == 0:
         return dates_dict
 
     # date open has been found; repeat process to find closing month
     close_str = date_open_arr.pop(0)
-    while close_str not in dates_map.keys() and len(date_open_arr) > 0:
+    while close_str not in MONTHS.keys() and len(date_open_arr) > 0:
         close_str = date_open_arr.pop(0)
-    for month in dates_map.keys():
+    for month in MONTHS.keys():
         if month in close_str:
-            dates_dict["month_close"] = dates_map[month]
+            dates_dict["month_close"] = MONTHS[month]
 
     return dates_dict
 
@@ -92,22 +122,7 @@ def process_country(state_str: str) -> str:
     Returns:
         country (str): country ("United States" or "Canada")
     """
-    canadian_provinces = [
-        "AB",
-        "BC",
-        "MB",
-        "NB",
-        "NL",
-        "NT",
-        "NS",
-        "NU",
-        "ON",
-        "PE",
-        "QC",
-        "SK",
-        "YT",
-    ]
-    return "CAN" if state_str in canadian_provinces else "USA"
+    return "CAN" if state_str in CANADIAN_PROVINCES else "USA"
 
 
 def process_amenities(amenity_str: Union[str, None]) -> dict:
@@ -173,13 +188,7 @@ def process_amenities(amenity_str: Union[str, None]) -> dict:
                 amenity_dict["has_toilets"] = False
             else:
                 amenity_dict["has_toilets"] = True
-                toilet_map = {
-                    "FT": "flush",
-                    "VT": "vault",
-                    "FTVT": "mixed",
-                    "PT": "pit",
-                }
-                amenity_dict["toilet_type"] = toilet_map[amenity_code]
+                amenity_dict["toilet_type"] = TOILET_TYPES[amenity_code]
 
         # drinking water
         if amenity_code in ["DW", "NW"]:
@@ -204,3 +213,99 @@ def process_amenities(amenity_str: Union[str, None]) -> dict:
             amenity_dict["low_no_fee"] = True
 
     return amenity_dict
+
+
+# Column-wise variants of the functions above, for normalising a batch of rows at
+# a time. They take and return whole columns, with the same values as the
+# per-row functions. Raw values repeat a lot (e.g. "mid may-mid sep"), so each
+# distinct value is only processed once, and results are memoized across batches.
+
+
+# distinct values remembered by each memoized normalizer, across batches, and
+# the longest value remembered. Real dates and amenities are a few dozen
+# characters; longer values are normalized every time, so a large upload pins at
+# most about NORMALIZER_CACHE_SIZE * NORMALIZER_CACHE_MAX_LENGTH characters
+NORMALIZER_CACHE_SIZE = 4096
+NORMALIZER_CACHE_MAX_LENGTH = 256
+
+
+def _memoized(process: Callable[[Optional[str]], Any]) -> Callable:
+    cached = lru_cache(maxsize=NORMALIZER_CACHE_SIZE)(process)
+
+    def lookup(value: Optional[str]) -> Any:
+        if value is not None and len(value) > NORMALIZER_CACHE_MAX_LENGTH:
+            return process(value)
+        return cached(value)
+
+    lookup.cache_info = cached.cache_info
+    return lookup
+
+
+def _map_distinct(process: Callable, column: List[Hashable]) -> List:
+    table = {value: process(value) for value in set(column)}
+    return list(map(table.__getitem__, column))
+
+
+@_memoized
+def _dates(date_open_str: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    dates = process_dates(date_open_str)
+    return dates["month_open"], dates["month_close"]
+
+
+@_memoized
+def _amenities(amenity_str: Optional[str]) -> tuple:
+    amenities = process_amenities(amenity_str)
+    return tuple(amenities.get(column) for column in AMENITY_COLUMNS)
+
+
+def process_phone_numbers(column: List[Optional[str]]) -> List[Optional[str]]:
+    """
+    Column-wise `process_phone_number()`
+    """
+    sub = NON_ALPHANUMERIC.sub
+    return [
+        None
+        if value is None
+        else value.translate(ASCII_NON_ALPHANUMERIC)
+        if value.isascii()
+        else sub("", value)
+        for value in column
+    ]
+
+
+def process_dates_column(column: List[Optional[str]]) -> Dict[str, List]:
+    """
+    Column-wise `process_dates()`
+
+    Returns:
+        columns (Dict[str, List]): "month_open" and "month_close" columns
+    """
+    dates = _map_distinct(_dates, column)
+    return {
+        "month_open": [month_open for month_open, _ in dates],
+        "month_close": [month_close for _, month_close in dates],
+    }
+
+
+def process_countries(column: List[str]) -> List[str]:
+    """
+    Column-wise `process_country()`
+    """
+    return ["CAN" if state in CANADIAN_PROVINCES else "USA" for state in column]
+
+
+def process_amenities_column(column: List[Optional[str]]) -> Dict[str, List]:
+    """
+    Column-wise `process_amenities()`. Raises a ValueError, like
+    `process_amenities()`, if any value has an invalid RV length.
+
+    Returns:
+        columns (Dict[str, List]): a column for each of `AMENITY_COLUMNS`;
+            has_rv_hookup is None where `process_amenities()` leaves it out
+    """
+    amenities = _map_distinct(_amenities, column)
+    if not amenities:
+        return {name: [] for name in AMENITY_COLUMNS}
+    return {
+        name: list(values) for name, values in zip(AMENITY_COLUMNS, zip(*amenities))
+    }
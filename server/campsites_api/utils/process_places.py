@@ -0,0 +1,211 @@
+import codecs
+import csv
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import IO, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import campsites_api.utils.process_data_utils as ut
+from campsites_api.services.place_autocomplete import normalize
+from campsites_api.utils.process_data import RowErrors, batched
+from campsites_db.models import CampsiteCountryEnum, CampsiteStateEnum
+
+# columns of the rows produced by `normalize_place()`, in order
+PLACE_COLUMNS = [
+    "govt_id",
+    "name",
+    "search_str",
+    "generic_category",
+    "generic_term",
+    "county",
+    "state_province",
+    "country",
+    "lat",
+    "lon",
+    "priority_order",
+]
+
+# priority_order of places by generic_category (case-insensitive), for rows that
+# don't have one; lower is suggested first
+PRIORITY_BY_CATEGORY = {
+    "populated place": 1,
+    "civil": 2,
+    "park": 3,
+}
+DEFAULT_PRIORITY = 4
+
+# number of places normalised per task sent to the process pool
+PLACES_BATCH_SIZE = int(os.environ.get("PLACES_BATCH_SIZE", 5000))
+# number of processes normalising places; defaults to the number of CPUs
+PLACES_LOADER_WORKERS = int(os.environ.get("PLACES_LOADER_WORKERS", 0)) or None
+
+
+def read_place_rows(file: IO[bytes]) -> Iterator[Tuple[int, Dict]]:
+    """
+    Reads a geographical names CSV one row at a time. The file has a header with
+    the columns govt_id, name, generic_category, generic_term, county,
+    state_province and lat/lon; country, search_str and priority_order are
+    optional and derived if missing.
+
+    Parameters:
+        file (IO[bytes]): CSV file
+
+    Returns:
+        rows (Iterator[Tuple[int, Dict]]): (line number, raw row) pairs
+    """
+    reader = csv.DictReader(codecs.iterdecode(file, "utf-8"))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def build_search_str(name: str, state_province: str) -> str:
+    """
+    Builds the string places are searched and suggested by, e.g. "boston ma"
+    """
+    return normalize(f"{name} {state_province}")
+
+
+def normalize_place(row: Dict) -> tuple:
+    """
+    Converts a raw geographical names row into the values of `PLACE_COLUMNS`.
+    Raises a ValueError or KeyError for invalid rows.
+
+    Parameters:
+        row (Dict): raw row
+
+    Returns:
+        place (tuple): values of `PLACE_COLUMNS`
+    """
+    row = {k: v.strip() if v and v.strip() != "" else None for k, v in row.items()}
+    for column in ["govt_id", "name", "generic_category", "generic_term"]:
+        if row[column] is None:
+            raise ValueError(f"{column} is required")
+    state = CampsiteStateEnum(row["state_province"]).value
+    country = CampsiteCountryEnum(row.get("country") or ut.process_country(state)).value
+    lat, lon = float(row["lat"]), float(row["lon"])
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("lat/lon out of range")
+    priority = row.get("priority_order")
+    priority = (
+        int(priority)
+        if priority is not None
+        else PRIORITY_BY_CATEGORY.get(row["generic_category"].lower(), DEFAULT_PRIORITY)
+    )
+    return (
+        row["govt_id"],
+        row["name"],
+        row.get("search_str") or build_search_str(row["name"], state),
+        row["generic_category"],
+        row["generic_term"],
+        row["county"],
+        state,
+        country,
+        lat,
+        lon,
+        priority,
+    )
+
+
+def normalize_batch(
+    batch: List[Tuple[int, Dict]],
+) -> Tuple[List[tuple], List[Tuple[int, str]]]:
+    """
+    Normalises a batch of (line number, raw row) pairs; run in the process pool.
+
+    Returns:
+        places (List[tuple]), errors (List[Tuple[int, str]]): normalised places,
+            and the line number and error of each invalid row
+    """
+    places, errors = [], []
+    for line, row in batch:
+        try:
+            places.append(normalize_place(row))
+        except (ValueError, KeyError, TypeError) as e:
+            errors.append((line, f"Could not be processed: {e!r}"))
+    return places, errors
+
+
+class LoadProgress:
+    """
+    Counts rows as they are normalised, and calls `callback` with itself after
+    each batch
+    """
+
+    def __init__(self, callback: Optional[Callable[["LoadProgress"], None]] = None):
+        self.callback = callback
+        self.rows = 0
+        self.errors = 0
+        self.start = time.perf_counter()
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        return self.rows / elapsed if elapsed else 0.0
+
+    def add(self, rows: int, errors: int) -> None:
+        self.rows += rows
+        self.errors += errors
+        if self.callback is not None:
+            self.callback(self)
+
+
+def process_places(
+    rows: Iterable[Tuple[int, Dict]],
+    errors: RowErrors,
+    executor: Optional[Executor] = None,
+    batch_size: int = PLACES_BATCH_SIZE,
+    progress: Optional[LoadProgress] = None,
+) -> Iterator[List[tuple]]:
+    """
+    Normalises raw geographical names rows in batches across a process pool,
+    yielding batches of `PLACE_COLUMNS` values in file order. Reading stays
+    ahead of the pool by a few batches per worker, so memory use is bounded
+    however large the file is. Invalid rows are skipped and added to `errors`.
+
+    Parameters:
+        rows (Iterable[Tuple[int, Dict]]): (line number, raw row) pairs
+        errors (RowErrors): report to add invalid rows to
+        executor (Executor | None): pool to normalise in; in this process if None
+        batch_size (int): number of rows per task
+        progress (LoadProgress | None): progress to update after each batch
+
+    Returns:
+        batches (Iterator[List[tuple]]): batches of normalised places
+    """
+    batches = batched(rows, batch_size)
+    if executor is None:
+        results: Iterator = (normalize_batch(batch) for batch in batches)
+    else:
+        results = _in_order(executor, batches)
+    for places, batch_errors in results:
+        for line, error in batch_errors:
+            errors.add(line, error)
+        if progress is not None:
+            progress.add(len(places), len(batch_errors))
+        yield places
+
+
+def _in_order(executor: Executor, batches: Iterator[List]) -> Iterator:
+    # a few tasks per worker keeps every worker busy while the file is read
+    in_flight = 2 * (getattr(executor, "_max_workers", None) or os.cpu_count() or 1)
+    pending: Deque[Future] = deque()
+    for batch in batches:
+        pending.append(executor.submit(normalize_batch, batch))
+        if len(pending) >= in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_places_executor() -> ProcessPoolExecutor:
+    """
+    Process pool shared by place uploads, created on first use
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PLACES_LOADER_WORKERS)
+    return _executor
@@ -0,0 +1,42 @@
+import hashlib
+import os
+
+from fastapi import HTTPException, Request, Response
+
+# seconds clients and proxies may cache a tile for. Writes can't invalidate
+# downstream caches, so this bounds how long a changed tile can be stale
+TILE_MAX_AGE = int(os.environ.get("TILE_CACHE_MAX_AGE", 300))
+# deepest zoom level tiles are served for
+MAX_ZOOM = 22
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+
+def check_tile(z: int, x: int, y: int) -> None:
+    """
+    Raises a 404 HTTP exception if `z/x/y` is not a tile of the web mercator grid
+    """
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2**z or not 0 <= y < 2**z:
+        raise HTTPException(status_code=404, detail=f"Tile {z}/{x}/{y} not found")
+
+
+def tile_response(request: Request, tile: bytes) -> Response:
+    """
+    Builds the response for an encoded vector tile, with cache headers. The ETag is
+    a hash of the tile, so a client revalidating an unchanged tile gets an empty
+    304 response.
+
+    Parameters:
+        request (Request): request for the tile
+        tile (bytes): encoded tile
+
+    Returns:
+        response (Response): tile response
+    """
+    headers = {
+        "Cache-Control": f"public, max-age={TILE_MAX_AGE}",
+        "ETag": f'"{hashlib.md5(tile).hexdigest()}"',
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=tile, media_type=MVT_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,50 @@
+import json
+from typing import Any, Dict, List, Union
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+
+class Explain(Executable, ClauseElement):
+    """
+    SQL construct wrapping a statement in `EXPLAIN (FORMAT JSON, ...)`. Bound
+    parameters of the wrapped statement are kept, so it can be executed like the
+    statement itself:
+
+        plan = session.execute(Explain(query.statement)).scalar()
+    """
+
+    inherit_cache = False
+
+    def __init__(self, statement, analyze: bool = False, buffers: bool = False):
+        self.statement = statement
+        self.analyze = analyze
+        self.buffers = buffers
+
+
+@compiles(Explain, "postgresql")
+def compile_explain(element: Explain, compiler, **kw) -> str:
+    options = ["FORMAT JSON"]
+    if element.analyze:
+        options.append("ANALYZE")
+    if element.buffers:
+        options.append("BUFFERS")
+    statement = compiler.process(element.statement, **kw)
+    return f"EXPLAIN ({', '.join(options)}) {statement}"
+
+
+def parse_plan(plan: Union[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Returns the top-level plan document from the result of an `Explain`. Drivers
+    differ in whether they decode the json column, so both forms are accepted.
+
+    Parameters:
+        plan (str | list): value of the single row returned by EXPLAIN
+
+    Returns:
+        plan (dict): plan document, containing "Plan" and, with ANALYZE,
+            "Planning Time" and "Execution Time"
+    """
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
@@ -0,0 +1,333 @@
+import csv
+import io
+import time
+from enum import Enum
+from typing import (
+    Any,
+    AsyncIterable,
+    Callable,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+
+from sqlalchemy import Connection, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from campsites_db.models import Base
+
+# NULL marker in the CSV sent to COPY, so NULLs and empty strings stay distinct
+COPY_NULL = "\\N"
+
+
+class IngestResult(NamedTuple):
+    # number of rows loaded
+    rows: int
+    # wall time of the load, in seconds
+    seconds: float
+    # what happened to the loaded rows; without a natural key, every row is
+    # inserted. Unchanged rows include duplicates within the load
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    # rows deleted from the table because they were missing from the load
+    deleted: int = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+class _CsvStream(io.RawIOBase):
+    """
+    Read-only file object producing CSV lines from an iterator of rows, so COPY
+    can stream rows without the whole file being built in memory
+    """
+
+    def __init__(self, rows: Iterable[Sequence[Any]]):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._pending) < size:
+            # a few hundred rows per batch keeps the csv writer overhead low
+            batch = [row for _, row in zip(range(512), self._rows)]
+            if not batch:
+                break
+            self._writer.writerows(_copy_value(row) for row in batch)
+            self._pending += self._buffer.getvalue().encode("utf-8")
+            self._buffer.seek(0)
+            self._buffer.truncate()
+        if size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+
+def _copy_value(row: Sequence[Any]) -> List[Any]:
+    return [
+        COPY_NULL if v is None else v.value if isinstance(v, Enum) else v for v in row
+    ]
+
+
+def _plain_row(row: Sequence[Any]) -> tuple:
+    return tuple(v.value if isinstance(v, Enum) else v for v in row)
+
+
+def _staging_table(model: Type[Base]) -> str:
+    return f"staging_{model.__tablename__}"
+
+
+# bulk loads take as long as their input, so the connection's statement timeout
+# is lifted for the rest of their transaction
+_NO_STATEMENT_TIMEOUT = text("SET LOCAL statement_timeout = 0")
+
+
+def _create_staging(model: Type[Base], columns: List[str]):
+    # same column types as the target table, dropped when the transaction ends
+    return text(
+        f"CREATE TEMP TABLE {_staging_table(model)} ON COMMIT DROP AS "
+        f"SELECT {', '.join(columns)} FROM {model.__tablename__} WITH NO DATA"
+    )
+
+
+def natural_key_sql(key_columns: List[str]) -> str:
+    """
+    SQL expression identifying a row across loads, from its key columns. As for
+    `content_hash_sql()`, the row value's text form keeps NULLs and empty strings
+    distinct and quotes separators within values, so different keys can't collide
+    """
+    return f"md5(ROW({', '.join(key_columns)})::text)"
+
+
+def content_hash_sql(columns: List[str]) -> str:
+    """
+    SQL expression hashing a row's content. The row value's text form keeps NULLs
+    and empty strings distinct; columns are sorted so the hash does not depend on
+    their order
+    """
+    return f"md5(ROW({', '.join(sorted(columns))})::text)"
+
+
+def _insert_targets(model: Type[Base], columns: List[str]) -> Tuple[List, List]:
+    """
+    Target columns and SQL values inserting staged rows into the model's table.
+    `id` is generated if not staged, and `geo` is built from `lon`/`lat`
+    """
+    targets, values = list(columns), list(columns)
+    table = model.__table__
+    if "id" not in columns:
+        targets.append("id")
+        values.append("gen_random_uuid()")
+    if "geo" in table.c and "geo" not in columns:
+        targets.append("geo")
+        values.append("ST_SetSRID(ST_MakePoint(lon, lat), 4326)")
+    return targets, values
+
+
+def _insert_from_staging(model: Type[Base], columns: List[str]):
+    targets, values = _insert_targets(model, columns)
+    return text(
+        f"INSERT INTO {model.__tablename__} ({', '.join(targets)}) "
+        f"SELECT {', '.join(values)} FROM {_staging_table(model)}"
+    )
+
+
+def _upsert_from_staging(
+    model: Type[Base], columns: List[str], natural_key: List[str], update: bool
+):
+    """
+    Builds the statement merging staged rows into the model's table on their
+    natural key, returning the (rows, inserted, updated) counts. Staged rows
+    with the same key are merged into one. Existing rows are only updated, if
+    `update` is set, when their content hash differs
+    """
+    table = model.__tablename__
+    targets, values = _insert_targets(model, columns)
+    if update:
+        assignments = ", ".join(
+            f"{target} = EXCLUDED.{target}"
+            for target in [*targets, "content_hash"]
+            if target != "id"
+        )
+        conflict = (
+            f"DO UPDATE SET {assignments} "
+            f"WHERE {table}.content_hash IS DISTINCT FROM EXCLUDED.content_hash"
+        )
+    else:
+        conflict = "DO NOTHING"
+    return text(
+        f"""
+        WITH incoming AS (
+            SELECT DISTINCT ON (natural_key) *
+            FROM (
+                SELECT
+                    {", ".join(columns)},
+                    {natural_key_sql(natural_key)} AS natural_key,
+                    {content_hash_sql(columns)} AS content_hash
+                FROM {_staging_table(model)}
+            ) AS keyed
+            ORDER BY natural_key
+        ), written AS (
+            INSERT INTO {table} ({", ".join(targets)}, natural_key, content_hash)
+            SELECT {", ".join(values)}, natural_key, content_hash FROM incoming
+            ON CONFLICT (natural_key) {conflict}
+            -- xmax is only set on rows that existed before this statement
+            RETURNING xmax = 0 AS inserted
+        )
+        SELECT
+            (SELECT count(*) FROM {_staging_table(model)}),
+            count(*) FILTER (WHERE inserted),
+            count(*) FILTER (WHERE NOT inserted)
+        FROM written
+        """
+    )
+
+
+def _prune_from_staging(model: Type[Base], natural_key: List[str], prune_scope: str):
+    """
+    Builds the statement deleting rows that have a natural key, share a
+    `prune_scope` value with the staged rows, and are missing from them
+    """
+    staging = _staging_table(model)
+    return text(
+        f"DELETE FROM {model.__tablename__} "
+        f"WHERE natural_key IS NOT NULL "
+        f"AND {prune_scope} IN (SELECT {prune_scope} FROM {staging}) "
+        f"AND natural_key NOT IN "
+        f"(SELECT {natural_key_sql(natural_key)} FROM {staging})"
+    )
+
+
+def _load_result(rows: int, inserted: int, updated: int, deleted: int, start: float):
+    return IngestResult(
+        rows,
+        time.perf_counter() - start,
+        inserted=inserted,
+        updated=updated,
+        unchanged=rows - inserted - updated,
+        deleted=deleted,
+    )
+
+
+def copy_rows(
+    connection: Connection,
+    model: Type[Base],
+    columns: List[str],
+    rows: Iterable[Sequence[Any]],
+    natural_key: Optional[List[str]] = None,
+    update: bool = False,
+    prune_scope: Optional[str] = None,
+    check: Optional[Callable[[], None]] = None,
+) -> IngestResult:
+    """
+    Loads rows into a model's table with COPY. Rows are streamed as CSV into a
+    temporary staging table, then written to the table in one statement that
+    computes `id` and `geo` in SQL. Runs in the connection's transaction; the
+    caller commits.
+
+    With a natural key, the model's `natural_key` and `content_hash` columns are
+    computed for each row, and rows whose natural key already exists are left
+    as they are, or with `update`, updated if their content hash changed. With
+    `prune_scope` as well, rows loaded before (with a natural key) that are
+    missing from the load are deleted, within the values of the `prune_scope`
+    column present in the load, e.g. the states of a regional file.
+
+    `check`, if given, is called once every row is staged, before the table is
+    written; it may raise to abort the load, e.g. because rows were rejected
+    while they were produced, which pruning would take for missing rows.
+
+    Parameters:
+        connection (Connection): connection using the psycopg2 driver
+        model (Type[Base]): model of the table to load
+        columns (List[str]): column names, in the order of the row values
+        rows (Iterable[Sequence[Any]]): row values
+        natural_key (List[str] | None): columns identifying a row across loads
+        update (bool): whether to update changed rows
+        prune_scope (str | None): column scoping the deletion of missing rows
+        check (Callable[[], None] | None): called before the table is written
+
+    Returns:
+        result (IngestResult): counts of rows loaded, inserted, updated,
+            unchanged and deleted, and time taken
+    """
+    start = time.perf_counter()
+    connection.execute(_NO_STATEMENT_TIMEOUT)
+    connection.execute(_create_staging(model, columns))
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {_staging_table(model)} ({', '.join(columns)}) FROM STDIN "
+            f"WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            _CsvStream(rows),
+        )
+    finally:
+        cursor.close()
+    if check is not None:
+        check()
+    if natural_key is None:
+        inserted = connection.execute(_insert_from_staging(model, columns)).rowcount
+        return _load_result(inserted, inserted, 0, 0, start)
+    loaded, inserted, updated = connection.execute(
+        _upsert_from_staging(model, columns, natural_key, update)
+    ).one()
+    deleted = 0
+    if prune_scope is not None:
+        deleted = connection.execute(
+            _prune_from_staging(model, natural_key, prune_scope)
+        ).rowcount
+    return _load_result(loaded, inserted, updated, deleted, start)
+
+
+async def acopy_rows(
+    connection: AsyncConnection,
+    model: Type[Base],
+    columns: List[str],
+    rows: Union[Iterable[Sequence[Any]], AsyncIterable[Sequence[Any]]],
+    natural_key: Optional[List[str]] = None,
+    update: bool = False,
+    prune_scope: Optional[str] = None,
+    check: Optional[Callable[[], None]] = None,
+) -> IngestResult:
+    """
+    Async variant of `copy_rows()`, for a connection using the asyncpg driver,
+    which sends rows with binary COPY. `rows` may also be an async iterable.
+    """
+    start = time.perf_counter()
+    # executed through sqlalchemy first, so the copy runs in its transaction
+    await connection.execute(_NO_STATEMENT_TIMEOUT)
+    await connection.execute(_create_staging(model, columns))
+    raw = await connection.get_raw_connection()
+    if isinstance(rows, AsyncIterable):
+        records = (_plain_row(row) async for row in rows)
+    else:
+        records = (_plain_row(row) for row in rows)
+    await raw.driver_connection.copy_records_to_table(
+        _staging_table(model), records=records, columns=columns
+    )
+    if check is not None:
+        check()
+    if natural_key is None:
+        result = await connection.execute(_insert_from_staging(model, columns))
+        return _load_result(result.rowcount, result.rowcount, 0, 0, start)
+    result = await connection.execute(
+        _upsert_from_staging(model, columns, natural_key, update)
+    )
+    loaded, inserted, updated = result.one()
+    deleted = 0
+    if prune_scope is not None:
+        result = await connection.execute(
+            _prune_from_staging(model, natural_key, prune_scope)
+        )
+        deleted = result.rowcount
+    return _load_result(loaded, inserted, updated, deleted, start)
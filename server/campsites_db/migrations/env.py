@@ -71,9 +71,13 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
-    from campsites_db.session import engine
+    from campsites_db.session import DB_URI, EngineSettings, build_engine
 
-    connectable = engine
+    # migrations, e.g. building indexes, may run longer than the API's
+    # statement timeout
+    connectable = build_engine(
+        DB_URI, EngineSettings.from_env()._replace(statement_timeout=0)
+    )
 
     with connectable.connect() as connection:
         context.configure(
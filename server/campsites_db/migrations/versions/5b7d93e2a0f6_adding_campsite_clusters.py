@@ -0,0 +1,53 @@
+"""adding campsite clusters
+
+Revision ID: 5b7d93e2a0f6
+Revises: e81b5f0c27a4
+Create Date: 2026-10-18 16:22:07.518342
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5b7d93e2a0f6"
+down_revision = "e81b5f0c27a4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "campsite_clusters",
+        sa.Column("zoom", sa.Integer(), nullable=False),
+        sa.Column("cell_x", sa.Integer(), nullable=False),
+        sa.Column("cell_y", sa.Integer(), nullable=False),
+        sa.Column("lat", sa.Float(), nullable=False),
+        sa.Column("lon", sa.Float(), nullable=False),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("zoom", "cell_x", "cell_y"),
+    )
+    # fill from existing campsites; the app refreshes the table after uploads.
+    # Zoom levels 0-10, 8 cells per tile width, as in campsites_db.models
+    op.execute(
+        """
+        INSERT INTO campsite_clusters (zoom, cell_x, cell_y, lat, lon, count)
+        SELECT zoom, cell_x, cell_y, avg(lat), avg(lon), count(*)
+        FROM (
+            SELECT
+                zoom,
+                CAST(floor(lon / (360.0 / (power(2.0, zoom) * 8))) AS INTEGER)
+                    AS cell_x,
+                CAST(floor(lat / (360.0 / (power(2.0, zoom) * 8))) AS INTEGER)
+                    AS cell_y,
+                lat,
+                lon
+            FROM campsites CROSS JOIN generate_series(0, 10) AS zoom
+        ) AS cells
+        GROUP BY zoom, cell_x, cell_y
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("campsite_clusters")
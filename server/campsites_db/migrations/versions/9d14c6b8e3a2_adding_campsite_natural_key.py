@@ -0,0 +1,114 @@
+"""adding campsite natural key
+
+Revision ID: 9d14c6b8e3a2
+Revises: 5b7d93e2a0f6
+Create Date: 2026-10-18 17:48:12.904113
+
+"""
+
+import logging
+
+import sqlalchemy as sa
+from alembic import op
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# revision identifiers, used by Alembic.
+revision = "9d14c6b8e3a2"
+down_revision = "5b7d93e2a0f6"
+branch_labels = None
+depends_on = None
+
+# as CAMPSITE_NATURAL_KEY and natural_key_sql() at the time of this migration
+natural_key = "md5(ROW(state, code, name)::text)"
+# as content_hash_sql() over the columns loaded by uploads, sorted
+content_columns = [
+    "accepts_pets",
+    "accepts_reservations",
+    "campsite_type",
+    "code",
+    "comments",
+    "composite",
+    "country",
+    "elevation_ft",
+    "has_drinking_water",
+    "has_electric_hookup",
+    "has_rv_hookup",
+    "has_sanitary_dump",
+    "has_sewer_hookup",
+    "has_showers",
+    "has_toilets",
+    "has_water_hookup",
+    "lat",
+    "lon",
+    "low_no_fee",
+    "max_rv_length",
+    "month_close",
+    "month_open",
+    "name",
+    "nearest_town",
+    "nearest_town_bearing",
+    "nearest_town_distance",
+    "num_campsites",
+    "phone",
+    "state",
+    "toilet_type",
+]
+
+
+def upgrade() -> None:
+    op.add_column("campsites", sa.Column("natural_key", sa.String(), nullable=True))
+    op.add_column("campsites", sa.Column("content_hash", sa.String(), nullable=True))
+    op.execute(
+        f"UPDATE campsites SET natural_key = {natural_key}, "
+        f"content_hash = md5(ROW({', '.join(content_columns)})::text)"
+    )
+    # repeated uploads duplicated campsites. Campsites sharing a natural key but
+    # not their content need someone to decide which to keep
+    connection = op.get_bind()
+    conflicts = connection.execute(
+        sa.text(
+            "SELECT state, code, name, count(*) FROM campsites "
+            "WHERE natural_key IS NOT NULL GROUP BY natural_key, state, code, name "
+            "HAVING count(DISTINCT content_hash) > 1 ORDER BY state, code, name"
+        )
+    ).all()
+    if conflicts:
+        listed = "\n".join(
+            f"  state={state}, code={code!r}, name={name!r} ({count} campsites)"
+            for state, code, name, count in conflicts
+        )
+        raise RuntimeError(
+            f"{len(conflicts)} natural keys (state, code, name) are shared by "
+            "campsites with different content. Delete or rename all but one "
+            f"campsite of each, then run the migration again:\n{listed}"
+        )
+    # exact copies are moved to a backup table, keeping the lowest id of each
+    op.execute(
+        "CREATE TABLE campsites_natural_key_duplicates AS "
+        "SELECT * FROM campsites AS a WHERE EXISTS ("
+        "SELECT 1 FROM campsites AS b "
+        "WHERE b.natural_key = a.natural_key AND b.id < a.id)"
+    )
+    op.execute(
+        "DELETE FROM campsites WHERE id IN "
+        "(SELECT id FROM campsites_natural_key_duplicates)"
+    )
+    duplicates = connection.execute(
+        sa.text("SELECT count(*) FROM campsites_natural_key_duplicates")
+    ).scalar()
+    logger.warning(
+        "Moved %s duplicate campsites to campsites_natural_key_duplicates", duplicates
+    )
+    op.create_index(
+        "ix_campsites_natural_key", "campsites", ["natural_key"], unique=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_campsites_natural_key", table_name="campsites")
+    # duplicates are restored as they were before the upgrade
+    op.execute("INSERT INTO campsites SELECT * FROM campsites_natural_key_duplicates")
+    op.drop_table("campsites_natural_key_duplicates")
+    op.drop_column("campsites", "content_hash")
+    op.drop_column("campsites", "natural_key")
@@ -0,0 +1,45 @@
+"""adding spatial indexes
+
+Revision ID: a3c91d7e5b20
+Revises: 235eee44e954
+Create Date: 2026-10-18 09:12:04.118392
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a3c91d7e5b20"
+down_revision = "235eee44e954"
+branch_labels = None
+depends_on = None
+
+tables = ["campsites", "geographical_names"]
+
+
+def upgrade() -> None:
+    for table in tables:
+        # geometry index, used by bounding box (&&) and KNN (<->) queries.
+        # geoalchemy2 creates this one on `create_all`, so it may already exist.
+        op.create_index(
+            f"idx_{table}_geo",
+            table,
+            ["geo"],
+            postgresql_using="gist",
+            if_not_exists=True,
+        )
+        # geography index, used by ST_DWithin radius searches. The expression
+        # must match `as_geography` in campsites_db/models.py
+        op.create_index(
+            f"idx_{table}_geo_geography",
+            table,
+            [sa.text("(CAST(geo AS geography(POINT,4326)))")],
+            postgresql_using="gist",
+        )
+
+
+def downgrade() -> None:
+    for table in tables:
+        op.drop_index(f"idx_{table}_geo_geography", table_name=table)
+        op.drop_index(f"idx_{table}_geo", table_name=table, if_exists=True)
@@ -0,0 +1,64 @@
+"""adding table versions
+
+Revision ID: b7e2d94c1f38
+Revises: 9d14c6b8e3a2
+Create Date: 2026-10-19 10:12:44.301276
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b7e2d94c1f38"
+down_revision = "9d14c6b8e3a2"
+branch_labels = None
+depends_on = None
+
+# as BUMP_TABLE_VERSION_FUNCTION and bump_table_version_trigger() at the time of
+# this migration
+bump_table_version_function = """
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO table_versions (table_name, version, changed_at)
+    VALUES (TG_TABLE_NAME, 1, now())
+    ON CONFLICT (table_name) DO UPDATE
+    SET version = table_versions.version + 1, changed_at = now();
+    RETURN NULL;
+END
+$$
+"""
+bump_campsites_version_trigger = (
+    "CREATE TRIGGER campsites_bump_version "
+    "AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON campsites "
+    "FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()"
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "table_versions",
+        sa.Column("table_name", sa.String(), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "changed_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("table_name"),
+    )
+    op.execute(bump_table_version_function)
+    op.execute(bump_campsites_version_trigger)
+    # whether campsite_clusters matches campsites is unknown, so it starts stale,
+    # and is computed from campsites until the next upload refreshes it
+    op.execute(
+        "INSERT INTO table_versions (table_name, version) VALUES ('campsites', 1)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER campsites_bump_version ON campsites")
+    op.execute("DROP FUNCTION bump_table_version()")
+    op.drop_table("table_versions")
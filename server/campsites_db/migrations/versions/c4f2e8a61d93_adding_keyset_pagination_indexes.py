@@ -0,0 +1,34 @@
+"""adding keyset pagination indexes
+
+Revision ID: c4f2e8a61d93
+Revises: a3c91d7e5b20
+Create Date: 2026-10-18 11:40:27.530194
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c4f2e8a61d93"
+down_revision = "a3c91d7e5b20"
+branch_labels = None
+depends_on = None
+
+indexes = [
+    ("campsites", "code"),
+    ("campsites", "name"),
+    ("campsites", "state"),
+    ("campsites", "country"),
+    ("campsites", "campsite_type"),
+    ("geographical_names", "priority_order"),
+]
+
+
+def upgrade() -> None:
+    for table, column in indexes:
+        op.create_index(f"ix_{table}_{column}_id", table, [column, "id"])
+
+
+def downgrade() -> None:
+    for table, column in indexes:
+        op.drop_index(f"ix_{table}_{column}_id", table_name=table)
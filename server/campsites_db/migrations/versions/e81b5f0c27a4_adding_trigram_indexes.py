@@ -0,0 +1,39 @@
+"""adding trigram indexes
+
+Revision ID: e81b5f0c27a4
+Revises: c4f2e8a61d93
+Create Date: 2026-10-18 14:03:51.274960
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e81b5f0c27a4"
+down_revision = "c4f2e8a61d93"
+branch_labels = None
+depends_on = None
+
+indexes = [
+    ("campsites", "code"),
+    ("campsites", "name"),
+    ("geographical_names", "search_str"),
+]
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, column in indexes:
+        op.create_index(
+            f"ix_{table}_{column}_trgm",
+            table,
+            [sa.text(f"lower({column}) gin_trgm_ops")],
+            postgresql_using="gin",
+        )
+
+
+def downgrade() -> None:
+    for table, column in indexes:
+        op.drop_index(f"ix_{table}_{column}_trgm", table_name=table)
+    # the extension is left installed, as other objects may depend on it
@@ -0,0 +1,32 @@
+"""adding geographical names version trigger
+
+Revision ID: f3a8c51d7e62
+Revises: b7e2d94c1f38
+Create Date: 2026-10-19 15:40:21.518903
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f3a8c51d7e62"
+down_revision = "b7e2d94c1f38"
+branch_labels = None
+depends_on = None
+
+# as bump_table_version_trigger("geographical_names") at the time of this
+# migration; bump_table_version() is created by b7e2d94c1f38
+bump_geographical_names_version_trigger = (
+    "CREATE TRIGGER geographical_names_bump_version "
+    "AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON geographical_names "
+    "FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()"
+)
+
+
+def upgrade() -> None:
+    op.execute(bump_geographical_names_version_trigger)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER geographical_names_bump_version ON geographical_names")
+    op.execute("DELETE FROM table_versions WHERE table_name = 'geographical_names'")
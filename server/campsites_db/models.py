@@ -1,9 +1,22 @@
 import uuid
+from datetime import datetime
 from enum import Enum
 from typing import Optional
 
-from geoalchemy2 import Geometry
+from geoalchemy2 import Geography, Geometry
 from pydantic import UUID4
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    cast,
+    event,
+    func,
+    select,
+)
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
@@ -144,6 +157,15 @@ def build_geo_point(context):
     return f"POINT ({lon} {lat})"
 
 
+def as_geography(geo):
+    """
+    Casts a 'geo' geometry column (or point) to geography. Distance queries must use
+    this exact expression so the planner can match it against the
+    `idx_*_geo_geography` expression indexes.
+    """
+    return cast(geo, Geography(geometry_type="POINT", srid=4326, spatial_index=False))
+
+
 class Campsite(Base):
     __tablename__ = "campsites"
 
@@ -157,8 +179,9 @@ class Campsite(Base):
     campsite_type: Mapped[Optional[CampsiteTypeEnum]]
     lon: Mapped[float]
     lat: Mapped[float]
+    # deferred: only used in SQL, so not loaded with the rest of the row
     geo: Mapped[Geometry] = mapped_column(
-        Geometry("POINT", srid=4326), default=build_geo_point
+        Geometry("POINT", srid=4326), default=build_geo_point, deferred=True
     )
     composite: Mapped[str]
     comments: Mapped[Optional[str]]
@@ -184,6 +207,18 @@ class Campsite(Base):
     accepts_reservations: Mapped[Optional[bool]]
     accepts_pets: Mapped[Optional[bool]]
     low_no_fee: Mapped[Optional[bool]]
+    # identity of the campsite across uploads (see CAMPSITE_NATURAL_KEY) and a
+    # hash of its content, set by campsites_db.ingest; NULL for campsites created
+    # one at a time
+    natural_key: Mapped[Optional[str]] = mapped_column(deferred=True)
+    content_hash: Mapped[Optional[str]] = mapped_column(deferred=True)
+
+
+# columns identifying a campsite across uploads; `code` alone is not unique.
+# Coordinates are left out, so a campsite whose coordinates the source rounds
+# differently is updated rather than replaced. Rows of one upload with the same
+# key are merged into one
+CAMPSITE_NATURAL_KEY = ["state", "code", "name"]
 
 
 class GeographicalName(Base):
@@ -202,7 +237,161 @@ class GeographicalName(Base):
     country: Mapped[CampsiteCountryEnum]
     lat: Mapped[float]
     lon: Mapped[float]
+    # deferred: only used in SQL, so not loaded with the rest of the row
     geo: Mapped[Geometry] = mapped_column(
-        Geometry("POINT", srid=4326), default=build_geo_point
+        Geometry("POINT", srid=4326), default=build_geo_point, deferred=True
     )
     priority_order: Mapped[int]
+
+
+class CampsiteCluster(Base):
+    """
+    Campsites grouped into grid cells, precomputed for each zoom level up to
+    `CLUSTER_MAX_ZOOM`. Cells and centroids are in degrees; see `cluster_cell()`.
+    """
+
+    __tablename__ = "campsite_clusters"
+
+    zoom: Mapped[int] = mapped_column(primary_key=True)
+    cell_x: Mapped[int] = mapped_column(primary_key=True)
+    cell_y: Mapped[int] = mapped_column(primary_key=True)
+    lat: Mapped[float]
+    lon: Mapped[float]
+    count: Mapped[int]
+
+
+class TableVersion(Base):
+    """
+    Write counter of a table, bumped by a trigger after every statement that
+    writes to it (see `VERSIONED_TABLES`), in whichever process it runs. Other
+    rows record the version of a table that something derived from it was built
+    from, e.g. `CLUSTERS_SOURCE_VERSION`.
+    """
+
+    __tablename__ = "table_versions"
+
+    table_name: Mapped[str] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger)
+    changed_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+
+
+# tables whose writes bump their `table_versions` row. The bump is a row lock
+# held until commit, so concurrent writes to a table are serialized
+VERSIONED_TABLES = ["campsites", "geographical_names"]
+# `table_versions` row holding the campsites version `campsite_clusters` was
+# last refreshed from
+CLUSTERS_SOURCE_VERSION = "campsite_clusters"
+
+# statement-level, so a bulk load bumps the version once. Also used by the
+# migration creating `table_versions`
+BUMP_TABLE_VERSION_FUNCTION = """
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO table_versions (table_name, version, changed_at)
+    VALUES (TG_TABLE_NAME, 1, now())
+    ON CONFLICT (table_name) DO UPDATE
+    SET version = table_versions.version + 1, changed_at = now();
+    RETURN NULL;
+END
+$$
+"""
+
+
+def bump_table_version_trigger(table_name: str) -> str:
+    return (
+        f"CREATE TRIGGER {table_name}_bump_version "
+        f"AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table_name} "
+        "FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()"
+    )
+
+
+for table_name in VERSIONED_TABLES:
+    table = Base.metadata.tables[table_name]
+    event.listen(table, "after_create", DDL(BUMP_TABLE_VERSION_FUNCTION))
+    event.listen(table, "after_create", DDL(bump_table_version_trigger(table_name)))
+
+
+def table_version(table_name: str):
+    """
+    Builds a SQL expression for the version of a table in `table_versions`, 0 if
+    it has none
+    """
+    return func.coalesce(
+        select(TableVersion.version)
+        .where(TableVersion.table_name == table_name)
+        .scalar_subquery(),
+        0,
+    )
+
+
+# deepest zoom level with precomputed clusters
+CLUSTER_MAX_ZOOM = 10
+# grid cells per map tile width, at every zoom level
+CLUSTER_CELLS_PER_TILE = 8
+
+
+def cluster_cell_size(zoom: int) -> float:
+    """
+    Width and height in degrees of the cluster grid cells at `zoom`
+    """
+    return 360.0 / (2**zoom * CLUSTER_CELLS_PER_TILE)
+
+
+def cluster_cell(zoom, lon, lat):
+    """
+    Builds SQL expressions for the (x, y) index of the cluster grid cell holding
+    `lon`/`lat` at `zoom`. `zoom` may be a column, so the cell size is computed
+    in SQL, with the same float arithmetic as `cluster_cell_size()`.
+    """
+    size = 360.0 / (cast(func.power(2, zoom), Float) * CLUSTER_CELLS_PER_TILE)
+    return (
+        cast(func.floor(lon / size), Integer),
+        cast(func.floor(lat / size), Integer),
+    )
+
+
+# GiST indexes on the geography cast of 'geo', used by ST_DWithin radius searches.
+# The plain geometry GiST indexes (`idx_<table>_geo`) are created by geoalchemy2.
+Index(
+    "idx_campsites_geo_geography",
+    as_geography(Campsite.geo),
+    postgresql_using="gist",
+)
+Index(
+    "idx_geographical_names_geo_geography",
+    as_geography(GeographicalName.geo),
+    postgresql_using="gist",
+)
+
+# (sort column, id) indexes backing keyset pagination for each sortable column
+for sort_column in ["code", "name", "state", "country", "campsite_type"]:
+    Index(
+        f"ix_campsites_{sort_column}_id",
+        getattr(Campsite, sort_column),
+        Campsite.id,
+    )
+Index(
+    "ix_geographical_names_priority_order_id",
+    GeographicalName.priority_order,
+    GeographicalName.id,
+)
+
+# target of the upload upserts' ON CONFLICT
+Index("ix_campsites_natural_key", Campsite.natural_key, unique=True)
+
+# GIN trigram indexes backing the case-insensitive `__ct` substring filters, which
+# compile to `lower(column) LIKE '%...%'`. Requires the pg_trgm extension
+for model, column in [
+    (Campsite, "code"),
+    (Campsite, "name"),
+    (GeographicalName, "search_str"),
+]:
+    Index(
+        f"ix_{model.__tablename__}_{column}_trgm",
+        func.lower(getattr(model, column)).label(f"{column}_lower"),
+        postgresql_using="gin",
+        postgresql_ops={f"{column}_lower": "gin_trgm_ops"},
+    )
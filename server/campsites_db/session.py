@@ -1,25 +1,253 @@
 import os
-from functools import lru_cache
+import threading
+import time
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Type
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
 
 DB_URI = os.environ.get("DATABASE_URI")
 
-engine = create_engine(DB_URI, pool_pre_ping=True, echo=True)
 
+def to_async_uri(uri: str) -> str:
+    """
+    Returns the asyncpg equivalent of a (psycopg2) postgresql database URI
+    """
+    scheme, rest = uri.split("://", 1)
+    if scheme.split("+")[0] not in ["postgresql", "postgres"]:
+        raise ValueError(f"Unsupported database URI scheme: {scheme}")
+    return f"postgresql+asyncpg://{rest}"
 
-@lru_cache
-def create_session():
-    Session = scoped_session(
-        sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class EngineSettings(NamedTuple):
+    # connections kept open in the pool
+    pool_size: int = 5
+    # connections opened beyond pool_size under load, closed when returned
+    max_overflow: int = 10
+    # seconds to wait for a connection before failing the checkout
+    pool_timeout: float = 30.0
+    # seconds after which a connection is replaced; -1 to keep connections
+    pool_recycle: int = 1800
+    # milliseconds after which postgres cancels a statement; 0 for no limit
+    statement_timeout: int = 30000
+    # whether every statement is logged
+    echo: bool = False
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "EngineSettings":
+        """
+        Reads settings from `DATABASE_POOL_SIZE`, `DATABASE_MAX_OVERFLOW`,
+        `DATABASE_POOL_TIMEOUT`, `DATABASE_POOL_RECYCLE`,
+        `DATABASE_STATEMENT_TIMEOUT` (ms) and `DATABASE_ECHO`; defaults for
+        those that are not set
+        """
+        defaults = cls()
+        return cls(
+            pool_size=int(environ.get("DATABASE_POOL_SIZE", defaults.pool_size)),
+            max_overflow=int(
+                environ.get("DATABASE_MAX_OVERFLOW", defaults.max_overflow)
+            ),
+            pool_timeout=float(
+                environ.get("DATABASE_POOL_TIMEOUT", defaults.pool_timeout)
+            ),
+            pool_recycle=int(
+                environ.get("DATABASE_POOL_RECYCLE", defaults.pool_recycle)
+            ),
+            statement_timeout=int(
+                environ.get("DATABASE_STATEMENT_TIMEOUT", defaults.statement_timeout)
+            ),
+            echo=environ.get("DATABASE_ECHO", "false").lower() in ["1", "true"],
+        )
+
+
+class PoolMetrics:
+    """
+    Checkout counts and wait times of a connection pool. Waits include opening a
+    new connection when the pool has none idle, and failures include checkouts
+    that timed out because the pool was exhausted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, wait: float, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+            if error is None:
+                self.checkouts += 1
+            else:
+                self.checkout_failures += 1
+                if isinstance(error, PoolTimeoutError):
+                    self.checkout_timeouts += 1
+
+    def stats(self, pool: Pool) -> Dict[str, Any]:
+        """
+        The metrics, with the live state of `pool`
+        """
+        with self._lock:
+            attempts = self.checkouts + self.checkout_failures
+            stats = {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checkout_timeouts": self.checkout_timeouts,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_max": self.wait_seconds_max,
+                "wait_seconds_mean": (
+                    self.wait_seconds_total / attempts if attempts else None
+                ),
+            }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+                timeout=pool.timeout(),
+            )
+        return stats
+
+
+def metered_pool(base: Type[QueuePool], metrics: PoolMetrics) -> Type[QueuePool]:
+    """
+    Subclass of a queue pool class that records every checkout in `metrics`. The
+    metrics are a class attribute, so they are kept when the pool is recreated.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = base._do_get(self)
+        except BaseException as e:
+            self.metrics.record(time.perf_counter() - start, e)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return connection
+
+    return type(
+        f"Metered{base.__name__}", (base,), {"metrics": metrics, "_do_get": _do_get}
+    )
+
+
+def _engine_options(
+    settings: EngineSettings, pool_class: Type[QueuePool]
+) -> Dict[str, Any]:
+    return dict(
+        poolclass=metered_pool(pool_class, PoolMetrics()),
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_recycle=settings.pool_recycle,
+        pool_pre_ping=True,
+        echo=settings.echo,
     )
-    return Session
+
+
+def build_engine(uri: str, settings: Optional[EngineSettings] = None) -> Engine:
+    """
+    Creates the engine for a (psycopg2) postgresql URI, with a metered pool and
+    a statement timeout set on every connection
+
+    Parameters:
+        uri (str): database URI
+        settings (EngineSettings | None): pool and connection settings; read
+            from the environment if None
+
+    Returns:
+        engine (Engine): the engine; `pool_stats(engine)` reports on its pool
+    """
+    settings = settings or EngineSettings.from_env()
+    connect_args = {}
+    if settings.statement_timeout:
+        connect_args["options"] = f"-c statement_timeout={settings.statement_timeout}"
+    return create_engine(
+        uri, connect_args=connect_args, **_engine_options(settings, QueuePool)
+    )
+
+
+def build_async_engine(
+    uri: str, settings: Optional[EngineSettings] = None
+) -> AsyncEngine:
+    """
+    Async variant of `build_engine()`, using asyncpg
+    """
+    settings = settings or EngineSettings.from_env()
+    connect_args = {}
+    if settings.statement_timeout:
+        connect_args["server_settings"] = {
+            "statement_timeout": str(settings.statement_timeout)
+        }
+    return create_async_engine(
+        to_async_uri(uri),
+        connect_args=connect_args,
+        **_engine_options(settings, AsyncAdaptedQueuePool),
+    )
+
+
+def pool_stats(engine: Engine) -> Dict[str, Any]:
+    """
+    Metrics of an engine built by `build_engine()` or `build_async_engine()`
+    (for which pass `async_engine.sync_engine`), with its pool's live state
+    """
+    pool = engine.pool
+    metrics: Optional[PoolMetrics] = getattr(pool, "metrics", None)
+    if metrics is None:
+        return {}
+    return metrics.stats(pool)
+
+
+engine = build_engine(DB_URI)
+async_engine = build_async_engine(DB_URI)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# objects are not expired on commit: with an AsyncSession, reloading an expired
+# attribute would need IO outside of an await
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
 
 
 def get_session():
-    Session = create_session()
+    """
+    Dependency providing a session for the duration of a single request
+    """
+    session = SessionLocal()
     try:
-        yield Session
+        yield session
     finally:
-        Session.remove()
+        session.close()
+
+
+def get_session_factory() -> sessionmaker:
+    """
+    Dependency providing the session factory, for work that outlives a request
+    """
+    return SessionLocal
+
+
+def get_async_session_factory() -> async_sessionmaker:
+    """
+    Dependency providing the async session factory, for streamed responses that
+    read from the database after the request's dependencies have closed
+    """
+    return AsyncSessionLocal
+
+
+async def get_async_session():
+    """
+    Dependency providing an async session for the duration of a single request
+    """
+    async with AsyncSessionLocal() as session:
+        yield session